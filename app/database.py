@@ -1,4 +1,5 @@
 import os
+import json
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -15,7 +16,11 @@ DATABASE_URL = (
 if not DATABASE_URL:
     raise RuntimeError("No database URL found. Set DATABASE_URL in .env")
 
-engine = create_engine(DATABASE_URL)
+# Keep Chinese text readable in JSON columns stored as TEXT (SQLite)
+engine = create_engine(
+    DATABASE_URL,
+    json_serializer=lambda obj: json.dumps(obj, ensure_ascii=False),
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
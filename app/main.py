@@ -6,9 +6,11 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse
 from dotenv import load_dotenv
 
-from app.database import engine, Base
 from app.routers import dashboard, members, activities, respite, notifications
 from app.services.scheduler import start_scheduler, stop_scheduler
+from app.services.events import start_event_listener, stop_event_listener
+from app.services.dispatch import stop_dispatch
+from app.services.mail_transport import close_transport
 
 load_dotenv()
 logging.basicConfig(
@@ -19,12 +21,15 @@ logging.basicConfig(
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    Base.metadata.create_all(bind=engine)
+    # Startup – schema is managed by scripts/migrate.py, not reflected here
     start_scheduler()
+    start_event_listener()
     yield
     # Shutdown
+    stop_event_listener()
     stop_scheduler()
+    stop_dispatch()
+    close_transport()
 
 
 app = FastAPI(title="長者中心 CRM", version="1.0.0", lifespan=lifespan)
@@ -0,0 +1,104 @@
+"""
+Lightweight schema migrations.
+
+Each module in ``app/migrations/versions`` is named ``NNNN_slug.py`` and exposes
+``description`` plus ``upgrade(conn)``.  Applied versions are recorded in the
+``schema_migrations`` table, so the app itself never has to reflect or create
+the schema at startup.
+
+Run: uv run python scripts/migrate.py
+"""
+import importlib
+import logging
+import pkgutil
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, DateTime, MetaData, String, Table, inspect, select, text,
+)
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _meta,
+    Column("version", String(20), primary_key=True),
+    Column("description", String(200)),
+    Column("applied_at", DateTime, default=datetime.now),
+)
+
+
+def available_migrations() -> list[tuple[str, object]]:
+    """Return [(version, module)] sorted by version."""
+    from app.migrations import versions
+
+    found = []
+    for info in pkgutil.iter_modules(versions.__path__):
+        version = info.name.split("_", 1)[0]
+        if not version.isdigit():
+            continue
+        module = importlib.import_module(f"{versions.__name__}.{info.name}")
+        found.append((version, module))
+    return sorted(found, key=lambda item: item[0])
+
+
+def applied_versions(conn: Connection) -> set[str]:
+    schema_migrations.create(conn, checkfirst=True)
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending_migrations(conn: Connection) -> list[tuple[str, object]]:
+    done = applied_versions(conn)
+    return [(v, m) for v, m in available_migrations() if v not in done]
+
+
+def upgrade(engine: Engine) -> list[str]:
+    """Apply every pending migration, each in its own transaction."""
+    applied = []
+    with engine.begin() as conn:
+        todo = pending_migrations(conn)
+    for version, module in todo:
+        with engine.begin() as conn:
+            logger.info(f"[Migrate] {version}: {module.description}")
+            module.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version,
+                description=module.description,
+                applied_at=datetime.now(),
+            ))
+        applied.append(version)
+    return applied
+
+
+# ── Helpers for migration modules ──────────────────────────────────────────────
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def add_column(conn: Connection, table: str, column: Column) -> None:
+    """
+    ALTER TABLE ... ADD COLUMN, skipped if the column already exists. NOT NULL
+    is emitted only together with a server default, which fills existing rows.
+    """
+    if has_column(conn, table, column.name):
+        return
+    col_type = column.type.compile(dialect=conn.dialect)
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column.name} {col_type}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+        if column.nullable is False:
+            ddl += " NOT NULL"
+    for fk in column.foreign_keys:
+        ref_table, ref_column = fk.target_fullname.split(".")
+        ddl += f" REFERENCES {ref_table}({ref_column})"
+    conn.execute(text(ddl))
+
+
+def add_enum_value(conn: Connection, enum_name: str, value: str) -> None:
+    """Extend a native Postgres enum type; a no-op on other databases."""
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text(f"ALTER TYPE {enum_name} ADD VALUE IF NOT EXISTS '{value}'"))
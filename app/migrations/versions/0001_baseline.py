@@ -0,0 +1,112 @@
+"""
+Baseline schema plus the indexes the hot queries need.
+
+The tables are a frozen copy of the models as they stood before migrations were
+introduced, created with ``checkfirst`` so databases that were bootstrapped with
+``create_all`` are adopted as-is and only gain the new indexes.
+"""
+from sqlalchemy import (
+    Boolean, Column, Date, DateTime, Enum, Float, ForeignKey, Index, Integer,
+    MetaData, String, Table, Text,
+)
+
+description = "baseline schema + performance indexes"
+
+meta = MetaData()
+
+members = Table(
+    "members", meta,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name_zh", String(50), nullable=False, index=True),
+    Column("name_en", String(100)),
+    Column("dob", Date),
+    Column("gender", String(10)),
+    Column("phone", String(20), index=True),
+    Column("address", Text),
+    Column("health_condition", Text),
+    Column("special_needs", Text),
+    Column("emergency_contact", Text),
+    Column("joined_date", Date),
+    Column("is_active", Boolean),
+    Column("notes", Text),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+)
+
+activities = Table(
+    "activities", meta,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String(200), nullable=False, index=True),
+    Column("type", Enum("interest_class", "health_talk", "social_event", name="activitytype"), nullable=False),
+    Column("description", Text),
+    Column("datetime_start", DateTime, nullable=False),
+    Column("datetime_end", DateTime),
+    Column("location", String(200)),
+    Column("capacity", Integer),
+    Column("fee", Float),
+    Column("status", Enum("upcoming", "ongoing", "completed", "cancelled", name="activitystatus")),
+    Column("created_at", DateTime),
+)
+
+registrations = Table(
+    "registrations", meta,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("member_id", Integer, ForeignKey("members.id"), nullable=False),
+    Column("activity_id", Integer, ForeignKey("activities.id"), nullable=False),
+    Column("registered_at", DateTime),
+    Column("attendance", Enum("registered", "attended", "absent", "cancelled", name="attendancestatus")),
+    Column("feedback", Text),
+)
+
+respite_services = Table(
+    "respite_services", meta,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("member_id", Integer, ForeignKey("members.id"), nullable=False),
+    Column("date", Date, nullable=False, index=True),
+    Column("session", Enum("full_day", "morning", "afternoon", name="sessiontype"), nullable=False),
+    Column("status", Enum("pending", "approved", "rejected", name="respitestatus")),
+    Column("notes", Text),
+    Column("created_at", DateTime),
+)
+
+email_drafts = Table(
+    "email_drafts", meta,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("member_id", Integer, ForeignKey("members.id"), nullable=False),
+    Column("subject", String(200), nullable=False),
+    Column("body", Text, nullable=False),
+    Column("template_type", String(50)),
+    Column("status", Enum("draft", "approved", "sent", "failed", name="emaildraftstatus")),
+    Column("scheduled_at", DateTime),
+    Column("sent_at", DateTime),
+    Column("recipient_email", String(200)),
+    Column("batch_id", String(50), index=True),
+    Column("created_at", DateTime),
+)
+
+system_notifications = Table(
+    "system_notifications", meta,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("title", String(200), nullable=False),
+    Column("message", Text),
+    Column("notif_type", String(50)),
+    Column("is_read", Boolean),
+    Column("created_at", DateTime),
+)
+
+indexes = [
+    Index("ix_registrations_member_id", registrations.c.member_id),
+    Index("ix_registrations_activity_id", registrations.c.activity_id),
+    Index("ix_registrations_activity_attendance", registrations.c.activity_id, registrations.c.attendance),
+    Index("ix_email_drafts_status_scheduled", email_drafts.c.status, email_drafts.c.scheduled_at),
+    Index(
+        "ix_respite_services_date_session_status",
+        respite_services.c.date, respite_services.c.session, respite_services.c.status,
+    ),
+]
+
+
+def upgrade(conn):
+    meta.create_all(conn, checkfirst=True)
+    for index in indexes:
+        index.create(conn, checkfirst=True)
@@ -0,0 +1,33 @@
+"""Materialised per-day respite occupancy, backfilled from respite_services."""
+from sqlalchemy import Column, Date, Integer, MetaData, String, Table, text
+
+description = "respite_daily_occupancy table"
+
+meta = MetaData()
+
+respite_daily_occupancy = Table(
+    "respite_daily_occupancy", meta,
+    Column("date", Date, primary_key=True),
+    Column("half", String(10), primary_key=True),
+    Column("approved", Integer, nullable=False, default=0),
+    Column("pending", Integer, nullable=False, default=0),
+)
+
+
+def upgrade(conn):
+    respite_daily_occupancy.create(conn, checkfirst=True)
+    conn.execute(text("DELETE FROM respite_daily_occupancy"))
+    conn.execute(text("""
+        INSERT INTO respite_daily_occupancy (date, half, approved, pending)
+        SELECT date, half,
+               SUM(CASE WHEN status = 'approved' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END)
+        FROM (
+            SELECT date, 'morning' AS half, status FROM respite_services
+            WHERE session IN ('full_day', 'morning') AND status IN ('approved', 'pending')
+            UNION ALL
+            SELECT date, 'afternoon' AS half, status FROM respite_services
+            WHERE session IN ('full_day', 'afternoon') AND status IN ('approved', 'pending')
+        ) AS halves
+        GROUP BY date, half
+    """))
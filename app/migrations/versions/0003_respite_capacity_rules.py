@@ -0,0 +1,33 @@
+"""Capacity calendar for respite slots, seeded with the former fixed capacity of 4."""
+from datetime import datetime
+from sqlalchemy import (
+    Column, Date, DateTime, Enum, Integer, MetaData, String, Table, select,
+)
+
+description = "respite_capacity_rules table"
+
+meta = MetaData()
+
+respite_capacity_rules = Table(
+    "respite_capacity_rules", meta,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("kind", Enum("default", "weekday", "closure", "reduction", name="capacityrulekind"), nullable=False),
+    Column("half", String(10)),
+    Column("weekday", Integer),
+    Column("start_date", Date),
+    Column("end_date", Date),
+    Column("capacity", Integer),
+    Column("reason", String(200)),
+    Column("created_at", DateTime),
+)
+
+
+def upgrade(conn):
+    respite_capacity_rules.create(conn, checkfirst=True)
+    has_default = conn.execute(
+        select(respite_capacity_rules.c.id).where(respite_capacity_rules.c.kind == "default")
+    ).first()
+    if not has_default:
+        conn.execute(respite_capacity_rules.insert().values(
+            kind="default", capacity=4, reason="暫託位", created_at=datetime.now(),
+        ))
@@ -0,0 +1,11 @@
+"""Partial index so the next waitlisted (pending) booking for a date is one index probe."""
+from sqlalchemy import text
+
+description = "respite waitlist index"
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_respite_services_waitlist "
+        "ON respite_services (date, created_at, id) WHERE status = 'pending'"
+    ))
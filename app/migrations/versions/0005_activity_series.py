@@ -0,0 +1,43 @@
+"""Recurring activity series; occurrences link back via activities.series_id."""
+from sqlalchemy import (
+    Column, Date, DateTime, Enum, Float, ForeignKey, Index, Integer, MetaData,
+    String, Table, Text,
+)
+
+from app.migrations import add_column
+
+description = "activity_series table + activities.series_id"
+
+meta = MetaData()
+
+activity_series = Table(
+    "activity_series", meta,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String(200), nullable=False),
+    Column("type", Enum("interest_class", "health_talk", "social_event", name="activitytype"), nullable=False),
+    Column("description", Text),
+    Column("location", String(200)),
+    Column("capacity", Integer),
+    Column("fee", Float),
+    Column("weekdays", String(20), nullable=False),
+    Column("start_time", String(5), nullable=False),
+    Column("duration_minutes", Integer),
+    Column("start_date", Date, nullable=False),
+    Column("end_date", Date, nullable=False),
+    Column("created_at", DateTime),
+)
+
+activities = Table(
+    "activities", meta,
+    Column("id", Integer, primary_key=True),
+    Column("series_id", Integer, ForeignKey("activity_series.id")),
+    Column("datetime_start", DateTime),
+)
+
+
+def upgrade(conn):
+    activity_series.create(conn, checkfirst=True)
+    add_column(conn, "activities", activities.c.series_id)
+    Index("ix_activities_series_start", activities.c.series_id, activities.c.datetime_start).create(
+        conn, checkfirst=True,
+    )
@@ -0,0 +1,23 @@
+"""
+One non-cancelled registration per (activity, member).
+
+Existing duplicates are resolved first: the earliest registration of each pair
+is kept and the later copies are marked cancelled.
+"""
+from sqlalchemy import text
+
+description = "unique active registration per activity and member"
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "UPDATE registrations SET attendance = 'cancelled' "
+        "WHERE attendance != 'cancelled' AND id NOT IN ("
+        "  SELECT MIN(id) FROM registrations WHERE attendance != 'cancelled' "
+        "  GROUP BY activity_id, member_id"
+        ")"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_registrations_active "
+        "ON registrations (activity_id, member_id) WHERE attendance != 'cancelled'"
+    ))
@@ -0,0 +1,8 @@
+"""Add the waitlisted attendance status (Postgres enum; plain VARCHAR elsewhere)."""
+from app.migrations import add_enum_value
+
+description = "attendancestatus += waitlisted"
+
+
+def upgrade(conn):
+    add_enum_value(conn, "attendancestatus", "waitlisted")
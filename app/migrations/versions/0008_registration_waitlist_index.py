@@ -0,0 +1,15 @@
+"""
+Partial index so the next waitlisted registrations for an activity are one
+index range scan. Separate from 0007 because Postgres cannot use a new enum
+value in the transaction that added it.
+"""
+from sqlalchemy import text
+
+description = "activity waitlist index"
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_registrations_waitlist "
+        "ON registrations (activity_id, registered_at, id) WHERE attendance = 'waitlisted'"
+    ))
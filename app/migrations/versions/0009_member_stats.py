@@ -0,0 +1,57 @@
+"""Per-member participation rollup, backfilled from registrations and respite_services."""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import (
+    Column, Date, DateTime, ForeignKey, Integer, MetaData, Table, text,
+)
+
+description = "member_stats rollup table"
+
+meta = MetaData()
+
+# Referenced table, so the foreign key below resolves without reflection
+members = Table("members", meta, Column("id", Integer, primary_key=True))
+
+member_stats = Table(
+    "member_stats", meta,
+    Column("member_id", Integer, ForeignKey("members.id"), primary_key=True),
+    Column("total_attended", Integer, nullable=False, default=0),
+    Column("last_attended_at", DateTime),
+    Column("absence_streak", Integer, nullable=False, default=0),
+    Column("respite_month", Date),
+    Column("respite_days", Integer, nullable=False, default=0),
+    Column("updated_at", DateTime),
+)
+
+
+def upgrade(conn):
+    member_stats.create(conn, checkfirst=True)
+    month = date.today().replace(day=1)
+    month_end = (month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    conn.execute(text("DELETE FROM member_stats"))
+    conn.execute(text("""
+        INSERT INTO member_stats (
+            member_id, total_attended, last_attended_at, absence_streak,
+            respite_month, respite_days, updated_at
+        )
+        SELECT m.id,
+               COALESCE(att.total, 0),
+               att.last_at,
+               (SELECT COUNT(*) FROM registrations r
+                JOIN activities a ON a.id = r.activity_id
+                WHERE r.member_id = m.id AND r.attendance = 'absent'
+                  AND (att.last_at IS NULL OR a.datetime_start > att.last_at)),
+               :month,
+               (SELECT COUNT(DISTINCT s.date) FROM respite_services s
+                WHERE s.member_id = m.id AND s.status = 'approved'
+                  AND s.date >= :month AND s.date <= :month_end),
+               :now
+        FROM members m
+        LEFT JOIN (
+            SELECT r.member_id, COUNT(*) AS total, MAX(a.datetime_start) AS last_at
+            FROM registrations r
+            JOIN activities a ON a.id = r.activity_id
+            WHERE r.attendance = 'attended'
+            GROUP BY r.member_id
+        ) att ON att.member_id = m.id
+    """), {"month": month, "month_end": month_end, "now": datetime.now()})
@@ -0,0 +1,13 @@
+"""members.emergency_contact TEXT → JSONB on Postgres; SQLite keeps the JSON text as is."""
+from sqlalchemy import text
+
+description = "members.emergency_contact as JSONB"
+
+
+def upgrade(conn):
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text(
+        "ALTER TABLE members ALTER COLUMN emergency_contact TYPE JSONB "
+        "USING NULLIF(emergency_contact, '')::jsonb"
+    ))
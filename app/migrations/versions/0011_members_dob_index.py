@@ -0,0 +1,8 @@
+"""Index members.dob so age-band filters are a range scan."""
+from sqlalchemy import text
+
+description = "members.dob index"
+
+
+def upgrade(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_members_dob ON members (dob)"))
@@ -0,0 +1,8 @@
+"""(status, id) index so each keyset page of a draft status tab is a range scan."""
+from sqlalchemy import text
+
+description = "email_drafts (status, id) index"
+
+
+def upgrade(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_email_drafts_status_id ON email_drafts (status, id)"))
@@ -0,0 +1,8 @@
+"""Add the dead_letter email draft status (Postgres enum; plain VARCHAR elsewhere)."""
+from app.migrations import add_enum_value
+
+description = "emaildraftstatus += dead_letter"
+
+
+def upgrade(conn):
+    add_enum_value(conn, "emaildraftstatus", "dead_letter")
@@ -0,0 +1,28 @@
+"""
+Send retries: attempts / next_attempt_at on email_drafts, with the sender's
+due query served by (status, next_attempt_at). Approved drafts become due at
+their scheduled time; drafts that failed under the old single-attempt sender
+were never going to be retried, so they move to dead_letter.
+"""
+from sqlalchemy import Column, DateTime, Integer, text
+
+from app.migrations import add_column
+
+description = "email_drafts.attempts / next_attempt_at + (status, next_attempt_at) index"
+
+
+def upgrade(conn):
+    add_column(conn, "email_drafts", Column("attempts", Integer, nullable=False, server_default="0"))
+    add_column(conn, "email_drafts", Column("next_attempt_at", DateTime))
+    conn.execute(text(
+        "UPDATE email_drafts SET next_attempt_at = scheduled_at "
+        "WHERE status = 'approved' AND next_attempt_at IS NULL"
+    ))
+    conn.execute(text(
+        "UPDATE email_drafts SET status = 'dead_letter', attempts = 1 WHERE status = 'failed'"
+    ))
+    conn.execute(text("DROP INDEX IF EXISTS ix_email_drafts_status_scheduled"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_email_drafts_status_next_attempt "
+        "ON email_drafts (status, next_attempt_at)"
+    ))
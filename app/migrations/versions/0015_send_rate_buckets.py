@@ -0,0 +1,18 @@
+"""Shared token buckets pacing outgoing mail across worker processes."""
+from sqlalchemy import Column, DateTime, Float, MetaData, String, Table
+
+description = "send_rate_buckets table"
+
+meta = MetaData()
+
+send_rate_buckets = Table(
+    "send_rate_buckets", meta,
+    Column("name", String(20), primary_key=True),
+    Column("tokens", Float, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+    Column("blocked_until", DateTime),
+)
+
+
+def upgrade(conn):
+    send_rate_buckets.create(conn, checkfirst=True)
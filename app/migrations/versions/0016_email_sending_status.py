@@ -0,0 +1,8 @@
+"""Add the sending email draft status (Postgres enum; plain VARCHAR elsewhere)."""
+from app.migrations import add_enum_value
+
+description = "emaildraftstatus += sending"
+
+
+def upgrade(conn):
+    add_enum_value(conn, "emaildraftstatus", "sending")
@@ -0,0 +1,18 @@
+"""Staff overrides of the file-based email templates."""
+from sqlalchemy import Column, DateTime, MetaData, String, Table, Text
+
+description = "email_templates table"
+
+meta = MetaData()
+
+email_templates = Table(
+    "email_templates", meta,
+    Column("key", String(50), primary_key=True),
+    Column("subject", Text, nullable=False),
+    Column("body", Text, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+
+def upgrade(conn):
+    email_templates.create(conn, checkfirst=True)
@@ -0,0 +1,28 @@
+"""
+Incremental inactivity scan: a cursor recording when each scan last ran,
+plus the indexes its candidate queries range-scan (members crossing the
+threshold, members changed since the cursor, and each candidate's latest
+scan draft).
+"""
+from sqlalchemy import Column, DateTime, MetaData, String, Table, text
+
+description = "scan_cursors table + inactivity scan indexes"
+
+meta = MetaData()
+
+scan_cursors = Table(
+    "scan_cursors", meta,
+    Column("name", String(50), primary_key=True),
+    Column("scanned_at", DateTime),  # NULL until the first scan
+)
+
+
+def upgrade(conn):
+    scan_cursors.create(conn, checkfirst=True)
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_member_stats_last_attended_at ON member_stats (last_attended_at)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_members_updated_at ON members (updated_at)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_email_drafts_member_created ON email_drafts (member_id, created_at)"
+    ))
@@ -0,0 +1,64 @@
+"""
+Outreach campaigns replacing the hard-coded template choice of the
+inactivity scan. Seeds the four former rules as campaigns, in their old
+order, and attributes existing scan drafts to them by template, so members
+already contacted are not drafted again. Also indexes the columns the
+incremental scan range-scans for members that changed.
+"""
+from datetime import datetime
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, text,
+)
+
+from app.migrations import add_column
+
+description = "campaigns table + email_drafts.campaign_id"
+
+meta = MetaData()
+
+campaigns = Table(
+    "campaigns", meta,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("template_key", String(50), nullable=False),
+    Column("priority", Integer, nullable=False),
+    Column("is_active", Boolean, nullable=False),
+    Column("min_absent_days", Integer, nullable=False),
+    Column("age_band", String(20)),
+    Column("has_health_condition", Boolean),
+    Column("health_keywords", Text),
+    Column("joined_within_days", Integer),
+    Column("attended_before", Boolean),
+    Column("min_respite_days", Integer),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+)
+
+DEFAULTS = [
+    {"name": "新會員關懷", "template_key": "new_member", "priority": 10, "joined_within_days": 180},
+    {"name": "久未出席", "template_key": "long_absent", "priority": 20, "attended_before": True},
+    {"name": "健康關懷", "template_key": "health_care", "priority": 30, "has_health_condition": True},
+    {"name": "一般關懷", "template_key": "general", "priority": 40},
+]
+
+
+def upgrade(conn):
+    campaigns.create(conn, checkfirst=True)
+    now = datetime.now()
+    conn.execute(campaigns.insert(), [
+        {
+            "is_active": True, "min_absent_days": 14, "age_band": None, "has_health_condition": None,
+            "health_keywords": None, "joined_within_days": None, "attended_before": None,
+            "min_respite_days": None, "created_at": now, "updated_at": now, **row,
+        }
+        for row in DEFAULTS
+    ])
+    add_column(conn, "email_drafts", Column("campaign_id", Integer, ForeignKey("campaigns.id")))
+    conn.execute(text(
+        "UPDATE email_drafts SET campaign_id = "
+        "(SELECT c.id FROM campaigns c WHERE c.template_key = email_drafts.template_type) "
+        "WHERE batch_id LIKE 'scan%'"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_members_created_at ON members (created_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_member_stats_updated_at ON member_stats (updated_at)"))
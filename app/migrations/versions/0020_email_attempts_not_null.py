@@ -0,0 +1,15 @@
+"""
+email_drafts.attempts NOT NULL, as the model declares: add_column did not
+emit NOT NULL when 0014 ran. Postgres only – SQLite cannot alter a column,
+and its rows all carry the default anyway.
+"""
+from sqlalchemy import text
+
+description = "email_drafts.attempts NOT NULL"
+
+
+def upgrade(conn):
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text("UPDATE email_drafts SET attempts = 0 WHERE attempts IS NULL"))
+    conn.execute(text("ALTER TABLE email_drafts ALTER COLUMN attempts SET NOT NULL"))
@@ -1,11 +1,15 @@
-import json
 import enum
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
 from sqlalchemy import (
-    Column, Integer, String, Float, Date, DateTime, Text, Boolean,
-    ForeignKey, Enum as SAEnum, func
+    Column, Integer, String, Float, Date, DateTime, Text, Boolean, JSON,
+    ForeignKey, Index, Enum as SAEnum, func, text, case, and_, null,
 )
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_method, hybrid_property
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql.expression import FunctionElement
 from app.database import Base
 
 
@@ -27,6 +31,11 @@ class AttendanceStatus(str, enum.Enum):
     attended = "已出席"
     absent = "缺席"
     cancelled = "已取消"
+    waitlisted = "候補"
+
+
+# Registrations in these states do not take up one of an activity's places
+NOT_HOLDING_PLACE = (AttendanceStatus.cancelled, AttendanceStatus.waitlisted)
 
 
 class SessionType(str, enum.Enum):
@@ -41,48 +50,172 @@ class RespiteStatus(str, enum.Enum):
     rejected = "已拒絕"
 
 
+# Age bands used for targeting (e.g. health talk invitations): key -> (label, min age, max age)
+AGE_BANDS = {
+    "under_60": ("60歲以下", None, 59),
+    "60_69": ("60–69歲", 60, 69),
+    "70_79": ("70–79歲", 70, 79),
+    "80_plus": ("80歲或以上", 80, None),
+}
+
+
+def _years_before(day: date, years: int) -> date:
+    """The same calendar day `years` earlier (28 Feb for 29 Feb in non-leap years)."""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+class age_in_years(FunctionElement):
+    """SQL: completed years between a date column and today."""
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(age_in_years)
+def _age_default(element, compiler, **kw):
+    return "EXTRACT(YEAR FROM AGE(%s))" % compiler.process(element.clauses, **kw)
+
+
+@compiles(age_in_years, "sqlite")
+def _age_sqlite(element, compiler, **kw):
+    dob = compiler.process(element.clauses, **kw)
+    return (
+        f"(CAST(strftime('%Y', 'now', 'localtime') AS INTEGER) - CAST(strftime('%Y', {dob}) AS INTEGER)"
+        f" - (strftime('%m-%d', 'now', 'localtime') < strftime('%m-%d', {dob})))"
+    )
+
+
 class Member(Base):
     __tablename__ = "members"
 
     id = Column(Integer, primary_key=True, index=True)
     name_zh = Column(String(50), nullable=False, index=True)
     name_en = Column(String(100))
-    dob = Column(Date)
+    dob = Column(Date, index=True)
     gender = Column(String(10), default="未知")
     phone = Column(String(20), index=True)
     address = Column(Text)
     health_condition = Column(Text)
     special_needs = Column(Text)
-    _emergency_contact = Column("emergency_contact", Text)
+    # JSONB on Postgres, JSON-encoded TEXT on SQLite; decoded once when the row loads
+    _emergency_contact = Column("emergency_contact", JSON().with_variant(JSONB(), "postgresql"))
     joined_date = Column(Date, default=datetime.now)
     is_active = Column(Boolean, default=True)
     notes = Column(Text)
-    created_at = Column(DateTime, default=datetime.now)
-    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
 
     registrations = relationship("Registration", back_populates="member", cascade="all, delete-orphan")
     respite_services = relationship("RespiteService", back_populates="member", cascade="all, delete-orphan")
+    stats = relationship("MemberStats", uselist=False, back_populates="member", cascade="all, delete-orphan")
 
     @property
     def emergency_contact(self):
-        if self._emergency_contact:
-            return json.loads(self._emergency_contact)
-        return {}
+        return self._emergency_contact or {}
 
     @emergency_contact.setter
     def emergency_contact(self, value):
-        self._emergency_contact = json.dumps(value, ensure_ascii=False)
+        self._emergency_contact = value
 
-    @property
+    @hybrid_property
     def age(self):
         if self.dob:
             today = datetime.now().date()
             return today.year - self.dob.year - ((today.month, today.day) < (self.dob.month, self.dob.day))
         return None
 
+    @age.expression
+    def age(cls):
+        return age_in_years(cls.dob)
+
+    @hybrid_property
+    def age_band(self) -> Optional[str]:
+        age = self.age
+        if age is None:
+            return None
+        for key, (_, low, high) in AGE_BANDS.items():
+            if (low is None or age >= low) and (high is None or age <= high):
+                return key
+        return None
+
+    @age_band.expression
+    def age_band(cls):
+        age = age_in_years(cls.dob)
+        bounded = [(age <= high, key) for key, (_, _, high) in AGE_BANDS.items() if high is not None]
+        open_ended = next(key for key, (_, _, high) in AGE_BANDS.items() if high is None)
+        return case((cls.dob.is_(None), null()), *bounded, else_=open_ended)
+
+    @hybrid_method
+    def in_age_band(self, band: str) -> bool:
+        return self.age_band == band
+
+    @in_age_band.expression
+    def in_age_band(cls, band: str):
+        """
+        dob range equivalent of age_band == band, so the filter is an index
+        range scan on members.dob instead of computing every member's age.
+        """
+        _, low, high = AGE_BANDS[band]
+        today = date.today()
+        clauses = []
+        if low is not None:
+            clauses.append(cls.dob <= _years_before(today, low))
+        if high is not None:
+            clauses.append(cls.dob > _years_before(today, high + 1))
+        return and_(cls.dob.isnot(None), *clauses)
+
+
+class MemberStats(Base):
+    """
+    Participation rollup, one row per member, kept current by
+    app.services.member_stats.refresh() whenever the member's attendance or
+    respite bookings change.
+    """
+    __tablename__ = "member_stats"
+
+    member_id = Column(Integer, ForeignKey("members.id"), primary_key=True)
+    total_attended = Column(Integer, nullable=False, default=0)
+    last_attended_at = Column(DateTime, index=True)  # start of the latest attended activity
+    absence_streak = Column(Integer, nullable=False, default=0)  # absences since then
+    respite_month = Column(Date)  # first day of the month respite_days counts
+    respite_days = Column(Integer, nullable=False, default=0)  # approved respite days
+    updated_at = Column(DateTime, default=datetime.now, index=True)
+
+    member = relationship("Member", back_populates="stats")
+
+
+class ActivitySeries(Base):
+    """A recurring activity (e.g. weekly 太極拳班) whose occurrences are Activity rows."""
+    __tablename__ = "activity_series"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(200), nullable=False)
+    type = Column(SAEnum(ActivityType), nullable=False)
+    description = Column(Text)
+    location = Column(String(200))
+    capacity = Column(Integer, default=20)
+    fee = Column(Float, default=0.0)
+    weekdays = Column(String(20), nullable=False)  # comma-separated, Mon = 0
+    start_time = Column(String(5), nullable=False)  # "HH:MM"
+    duration_minutes = Column(Integer, default=60)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+    activities = relationship("Activity", back_populates="series", order_by="Activity.datetime_start")
+
+    @property
+    def weekday_list(self):
+        return [int(w) for w in self.weekdays.split(",") if w != ""]
+
 
 class Activity(Base):
     __tablename__ = "activities"
+    __table_args__ = (
+        Index("ix_activities_series_start", "series_id", "datetime_start"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(200), nullable=False, index=True)
@@ -94,13 +227,19 @@ class Activity(Base):
     capacity = Column(Integer, default=20)
     fee = Column(Float, default=0.0)
     status = Column(SAEnum(ActivityStatus), default=ActivityStatus.upcoming)
+    series_id = Column(Integer, ForeignKey("activity_series.id"))
     created_at = Column(DateTime, default=datetime.now)
 
     registrations = relationship("Registration", back_populates="activity", cascade="all, delete-orphan")
+    series = relationship("ActivitySeries", back_populates="activities")
 
     @property
     def registered_count(self):
-        return len([r for r in self.registrations if r.attendance != AttendanceStatus.cancelled])
+        return len([r for r in self.registrations if r.attendance not in NOT_HOLDING_PLACE])
+
+    @property
+    def waitlist_count(self):
+        return len([r for r in self.registrations if r.attendance == AttendanceStatus.waitlisted])
 
     @property
     def remaining_slots(self):
@@ -109,6 +248,23 @@ class Activity(Base):
 
 class Registration(Base):
     __tablename__ = "registrations"
+    __table_args__ = (
+        Index("ix_registrations_member_id", "member_id"),
+        Index("ix_registrations_activity_id", "activity_id"),
+        Index("ix_registrations_activity_attendance", "activity_id", "attendance"),
+        # One live registration per member and activity; cancelled rows may repeat
+        Index(
+            "ux_registrations_active", "activity_id", "member_id", unique=True,
+            postgresql_where=text("attendance != 'cancelled'"),
+            sqlite_where=text("attendance != 'cancelled'"),
+        ),
+        # Activity waitlist in arrival order
+        Index(
+            "ix_registrations_waitlist", "activity_id", "registered_at", "id",
+            postgresql_where=text("attendance = 'waitlisted'"),
+            sqlite_where=text("attendance = 'waitlisted'"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     member_id = Column(Integer, ForeignKey("members.id"), nullable=False)
@@ -123,8 +279,15 @@ class Registration(Base):
 
 class RespiteService(Base):
     __tablename__ = "respite_services"
-
-    TOTAL_CAPACITY = 4  # Physical slots; full_day counts against both morning and afternoon
+    __table_args__ = (
+        Index("ix_respite_services_date_session_status", "date", "session", "status"),
+        # FIFO waitlist: pending bookings per date in arrival order
+        Index(
+            "ix_respite_services_waitlist", "date", "created_at", "id",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     member_id = Column(Integer, ForeignKey("members.id"), nullable=False)
@@ -137,15 +300,65 @@ class RespiteService(Base):
     member = relationship("Member", back_populates="respite_services")
 
 
+class RespiteDailyOccupancy(Base):
+    """
+    Materialised approved/pending counts per date and half-session, kept in step
+    with respite_services by app.services.respite_occupancy on every write.
+    Full-day bookings are counted under both "morning" and "afternoon".
+    """
+    __tablename__ = "respite_daily_occupancy"
+
+    date = Column(Date, primary_key=True)
+    half = Column(String(10), primary_key=True)  # "morning" / "afternoon"
+    approved = Column(Integer, nullable=False, default=0)
+    pending = Column(Integer, nullable=False, default=0)
+
+
+class CapacityRuleKind(str, enum.Enum):
+    default = "預設名額"
+    weekday = "星期設定"
+    closure = "暫停服務"
+    reduction = "名額調減"
+
+
+class RespiteCapacityRule(Base):
+    """
+    Capacity calendar entry. Full-day bookings use a slot in both halves, so
+    every rule applies per half-session; `half` = None means both halves.
+      default   – capacity for any day without a weekday rule
+      weekday   – capacity for `weekday` (Mon = 0)
+      closure   – no service from start_date to end_date
+      reduction – `capacity` fewer slots from start_date to end_date (e.g. staff leave)
+    """
+    __tablename__ = "respite_capacity_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(SAEnum(CapacityRuleKind), nullable=False)
+    half = Column(String(10))  # "morning" / "afternoon" / NULL = both
+    weekday = Column(Integer)
+    start_date = Column(Date)
+    end_date = Column(Date)
+    capacity = Column(Integer, default=0)
+    reason = Column(String(200))
+    created_at = Column(DateTime, default=datetime.now)
+
+
 class EmailDraftStatus(str, enum.Enum):
     draft = "草稿"
     approved = "待發送"
+    sending = "發送中"  # claimed by a sender until next_attempt_at (its lease)
     sent = "已發送"
-    failed = "發送失敗"
+    failed = "發送失敗"  # will be retried at next_attempt_at
+    dead_letter = "停止重試"  # gave up after MAX_SEND_ATTEMPTS
 
 
 class EmailDraft(Base):
     __tablename__ = "email_drafts"
+    __table_args__ = (
+        Index("ix_email_drafts_status_next_attempt", "status", "next_attempt_at"),  # sender's due query
+        Index("ix_email_drafts_status_id", "status", "id"),  # keyset pages per status tab
+        Index("ix_email_drafts_member_created", "member_id", "created_at"),  # member's latest draft
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     member_id = Column(Integer, ForeignKey("members.id"), nullable=False)
@@ -155,11 +368,74 @@ class EmailDraft(Base):
     status = Column(SAEnum(EmailDraftStatus), default=EmailDraftStatus.draft)
     scheduled_at = Column(DateTime, nullable=True)
     sent_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at = Column(DateTime, nullable=True)  # due time of the next send attempt
     recipient_email = Column(String(200))
     batch_id = Column(String(50), index=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.now)
 
     member = relationship("Member")
+    campaign = relationship("Campaign")
+
+
+class Campaign(Base):
+    """
+    An outreach rule: active members absent for at least min_absent_days who
+    also match every other criterion that is set (NULL = not filtered on)
+    get a draft from template_key. The scan evaluates all campaigns in one
+    query; see app.services.campaigns.
+    """
+    __tablename__ = "campaigns"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    template_key = Column(String(50), nullable=False)
+    priority = Column(Integer, nullable=False, default=100)  # lower wins when a member matches several
+    is_active = Column(Boolean, nullable=False, default=True)  # campaigns are disabled, never deleted
+    min_absent_days = Column(Integer, nullable=False, default=14)  # since last attendance (or joining)
+    age_band = Column(String(20))  # AGE_BANDS key
+    has_health_condition = Column(Boolean)
+    health_keywords = Column(Text)  # any of, separated by commas / spaces
+    joined_within_days = Column(Integer)
+    attended_before = Column(Boolean)  # True: attended at least once; False: never
+    min_respite_days = Column(Integer)  # approved respite days this month
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class EmailTemplate(Base):
+    """
+    Staff edits of an email template. A row overrides the file of the same
+    key in app/email_templates; deleting it restores the file version.
+    """
+    __tablename__ = "email_templates"
+
+    key = Column(String(50), primary_key=True)
+    subject = Column(Text, nullable=False)  # Jinja2 source
+    body = Column(Text, nullable=False)  # Jinja2 source
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, nullable=False)
+
+
+class SendRateBucket(Base):
+    """
+    Token-bucket state for outgoing mail, shared by every worker process
+    through the database; see app.services.send_rate.
+    """
+    __tablename__ = "send_rate_buckets"
+
+    name = Column(String(20), primary_key=True)  # "second" / "day"
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    blocked_until = Column(DateTime, nullable=True)  # from the provider's Retry-After
+
+
+class ScanCursor(Base):
+    """When a periodic scan last ran, so the next run only looks at what changed since."""
+    __tablename__ = "scan_cursors"
+
+    name = Column(String(50), primary_key=True)  # e.g. "inactive"
+    scanned_at = Column(DateTime)  # NULL until the first run
 
 
 class SystemNotification(Base):
@@ -4,14 +4,23 @@ from fastapi import APIRouter, Request, Depends, Form, HTTPException
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
 
 from app.database import get_db
-from app.models import Activity, Registration, Member, ActivityType, ActivityStatus, AttendanceStatus
+from app.models import (
+    Activity, ActivitySeries, Registration, Member, ActivityType, ActivityStatus, AttendanceStatus,
+)
+from app.services.activity_series import generate_occurrences, update_future_occurrences
+from app.services.activity_registration import register, set_attendance, ActivityFull, REGISTERED
+from app.services.activity_waitlist import promote_waitlist
+from app.services import member_stats
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
+WEEKDAYS = ["一", "二", "三", "四", "五", "六", "日"]
+
 
 @router.get("/", response_class=HTMLResponse)
 async def list_activities(
@@ -86,8 +95,119 @@ async def create_activity(
     return HTMLResponse(status_code=303, headers={"Location": f"/activities/{activity.id}"})
 
 
+@router.get("/series/new", response_class=HTMLResponse)
+async def new_series_form(request: Request, db: Session = Depends(get_db)):
+    recent_activities = (
+        db.query(Activity).order_by(Activity.datetime_start.desc()).limit(50).all()
+    )
+    return templates.TemplateResponse("activities/series_form.html", {
+        "request": request,
+        "ActivityType": ActivityType,
+        "WEEKDAYS": WEEKDAYS,
+        "recent_activities": recent_activities,
+    })
+
+
+@router.post("/series", response_class=HTMLResponse)
+async def create_series(
+    request: Request,
+    db: Session = Depends(get_db),
+    name: str = Form(...),
+    type: str = Form(...),
+    description: str = Form(""),
+    location: str = Form(""),
+    capacity: int = Form(20),
+    fee: float = Form(0.0),
+    weekdays: list[int] = Form(...),
+    start_time: str = Form(...),
+    duration_minutes: int = Form(60),
+    start_date: str = Form(...),
+    end_date: str = Form(...),
+    roster_activity_id: Optional[int] = Form(None),
+):
+    series = ActivitySeries(
+        name=name,
+        type=ActivityType(type),
+        description=description,
+        location=location,
+        capacity=capacity,
+        fee=fee,
+        weekdays=",".join(str(w) for w in sorted(set(weekdays))),
+        start_time=start_time,
+        duration_minutes=duration_minutes,
+        start_date=datetime.strptime(start_date, "%Y-%m-%d").date(),
+        end_date=datetime.strptime(end_date, "%Y-%m-%d").date(),
+    )
+    db.add(series)
+    db.flush()
+    generate_occurrences(db, series, roster_activity_id)
+    db.commit()
+    return HTMLResponse(status_code=303, headers={"Location": f"/activities/series/{series.id}"})
+
+
+@router.get("/series/{series_id}", response_class=HTMLResponse)
+async def series_detail(request: Request, series_id: int, db: Session = Depends(get_db)):
+    series = db.query(ActivitySeries).filter(ActivitySeries.id == series_id).first()
+    if not series:
+        raise HTTPException(status_code=404, detail="Series not found")
+    return templates.TemplateResponse("activities/series_detail.html", {
+        "request": request,
+        "series": series,
+        "current_time": datetime.now(),
+        "WEEKDAYS": WEEKDAYS,
+        "ActivityStatus": ActivityStatus,
+    })
+
+
+@router.post("/series/{series_id}/edit", response_class=HTMLResponse)
+async def update_series(
+    request: Request,
+    series_id: int,
+    db: Session = Depends(get_db),
+    name: str = Form(...),
+    description: str = Form(""),
+    location: str = Form(""),
+    capacity: int = Form(20),
+    fee: float = Form(0.0),
+    status: str = Form(""),
+):
+    series = db.query(ActivitySeries).filter(ActivitySeries.id == series_id).first()
+    if not series:
+        raise HTTPException(status_code=404, detail="Series not found")
+    # Occurrences whose capacity grows get their waitlist promoted afterwards
+    grown = db.scalars(select(Activity.id).where(
+        Activity.series_id == series_id,
+        Activity.datetime_start >= datetime.now(),
+        func.coalesce(Activity.capacity, 0) < capacity,
+    )).all()
+    series.name = name
+    series.description = description
+    series.location = location
+    series.capacity = capacity
+    series.fee = fee
+    values = {
+        Activity.name: name,
+        Activity.description: description,
+        Activity.location: location,
+        Activity.capacity: capacity,
+        Activity.fee: fee,
+    }
+    if status:  # blank keeps each occurrence's own status, e.g. a cancelled week
+        values[Activity.status] = ActivityStatus(status)
+    update_future_occurrences(db, series, values)
+    for activity_id in grown:
+        promote_waitlist(db, activity_id)
+    db.commit()
+    return HTMLResponse(status_code=303, headers={"Location": f"/activities/series/{series_id}"})
+
+
 @router.get("/{activity_id}", response_class=HTMLResponse)
-async def activity_detail(request: Request, activity_id: int, db: Session = Depends(get_db)):
+async def activity_detail(
+    request: Request,
+    activity_id: int,
+    db: Session = Depends(get_db),
+    registration: str = "",
+):
     activity = db.query(Activity).filter(Activity.id == activity_id).first()
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
@@ -97,6 +217,7 @@ async def activity_detail(request: Request, activity_id: int, db: Session = Depe
         "activity": activity,
         "available_members": available_members,
         "AttendanceStatus": AttendanceStatus,
+        "registration_result": registration,
     })
 
 
@@ -133,15 +254,21 @@ async def update_activity(
     activity = db.query(Activity).filter(Activity.id == activity_id).first()
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
+    new_start = datetime.strptime(datetime_start, "%Y-%m-%dT%H:%M")
+    moved = new_start != activity.datetime_start
     activity.name = name
     activity.type = ActivityType(type)
     activity.description = description
-    activity.datetime_start = datetime.strptime(datetime_start, "%Y-%m-%dT%H:%M")
+    activity.datetime_start = new_start
     activity.datetime_end = datetime.strptime(datetime_end, "%Y-%m-%dT%H:%M") if datetime_end else None
     activity.location = location
     activity.capacity = capacity
     activity.fee = fee
     activity.status = ActivityStatus(status)
+    if moved:
+        # The date feeds members' last-attended and absence streak
+        member_stats.refresh(db, [r.member_id for r in activity.registrations])
+    promote_waitlist(db, activity_id)  # capacity may have grown
     db.commit()
     return HTMLResponse(status_code=303, headers={"Location": f"/activities/{activity_id}"})
 
@@ -151,7 +278,9 @@ async def delete_activity(request: Request, activity_id: int, db: Session = Depe
     activity = db.query(Activity).filter(Activity.id == activity_id).first()
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
+    member_ids = [r.member_id for r in activity.registrations]
     db.delete(activity)
+    member_stats.refresh(db, member_ids)
     db.commit()
     return HTMLResponse(status_code=303, headers={"Location": "/activities/"})
 
@@ -166,16 +295,11 @@ async def register_member(
     activity = db.query(Activity).filter(Activity.id == activity_id).first()
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
-    existing = db.query(Registration).filter(
-        Registration.activity_id == activity_id,
-        Registration.member_id == member_id,
-        Registration.attendance != AttendanceStatus.cancelled,
-    ).first()
-    if not existing:
-        reg = Registration(activity_id=activity_id, member_id=member_id)
-        db.add(reg)
-        db.commit()
-    return HTMLResponse(status_code=303, headers={"Location": f"/activities/{activity_id}"})
+    result = register(db, activity_id, member_id)
+    location = f"/activities/{activity_id}"
+    if result != REGISTERED:
+        location += f"?registration={result}"
+    return HTMLResponse(status_code=303, headers={"Location": location})
 
 
 @router.post("/{activity_id}/registrations/{reg_id}/attendance", response_class=HTMLResponse)
@@ -187,9 +311,87 @@ async def update_attendance(
     attendance: str = Form(...),
     feedback: str = Form(""),
 ):
-    reg = db.query(Registration).filter(Registration.id == reg_id).first()
+    reg = db.query(Registration).filter(
+        Registration.id == reg_id,
+        Registration.activity_id == activity_id,
+    ).first()
+    location = f"/activities/{activity_id}"
     if reg:
-        reg.attendance = AttendanceStatus(attendance)
         reg.feedback = feedback
+        try:
+            _, freed = set_attendance(db, activity_id, {reg_id: AttendanceStatus(attendance)})
+        except IntegrityError:
+            db.rollback()
+            return HTMLResponse(status_code=303, headers={"Location": f"{location}?registration=active_elsewhere"})
+        except ActivityFull:
+            db.rollback()
+            return HTMLResponse(status_code=303, headers={"Location": f"{location}?registration=full"})
+        if freed:
+            promote_waitlist(db, activity_id)
         db.commit()
-    return HTMLResponse(status_code=303, headers={"Location": f"/activities/{activity_id}"})
+    return HTMLResponse(status_code=303, headers={"Location": location})
+
+
+def _attendance(db: Session, activity_id: int, reg_ids: list[int]) -> dict:
+    """{registration id: current status} for the given rows of one activity."""
+    return dict(db.query(Registration.id, Registration.attendance).filter(
+        Registration.activity_id == activity_id,
+        Registration.id.in_(reg_ids),
+    ))
+
+
+@router.post("/{activity_id}/attendance", response_class=HTMLResponse)
+async def bulk_update_attendance(
+    request: Request,
+    activity_id: int,
+    db: Session = Depends(get_db),
+    reg_ids: list[int] = Form([]),
+    attendance: list[str] = Form([]),
+    loaded: list[str] = Form([]),
+):
+    """
+    Mark a whole roster at once (HTMX). Rows changed elsewhere since the form
+    was loaded are left alone; the response swaps the badge and select of every
+    row whose status differs from what the form loaded – the rows just saved,
+    members promoted from the waitlist, and those stale rows.
+    """
+    updates = {
+        reg_id: AttendanceStatus(value)
+        for reg_id, value in zip(reg_ids, attendance)
+    }
+    shown = None
+    if len(loaded) == len(reg_ids):
+        shown = {reg_id: AttendanceStatus(value) for reg_id, value in zip(reg_ids, loaded)}
+    stale = sum(
+        1 for reg_id, status in _attendance(db, activity_id, reg_ids).items()
+        if shown and shown.get(reg_id) != status
+    )
+    error = None
+    promoted = []
+    try:
+        changed, freed = set_attendance(db, activity_id, updates, shown)
+        if freed:
+            promoted = promote_waitlist(db, activity_id)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        changed, promoted = {}, []
+        error = "有會員已另有有效報名，未能恢復已取消的報名。"
+    except ActivityFull:
+        db.rollback()
+        changed, promoted = {}, []
+        error = "活動名額不足，未能為已取消或候補的會員恢復報名。"
+    refreshed = {
+        reg_id: status
+        for reg_id, status in _attendance(db, activity_id, reg_ids).items()
+        if shown is None or shown.get(reg_id) != status
+    }
+    return templates.TemplateResponse("partials/attendance_result.html", {
+        "request": request,
+        "changed": changed,
+        "promoted": promoted,
+        "stale": stale,
+        "refreshed": refreshed,
+        "error": error,
+        "AttendanceStatus": AttendanceStatus,
+    })
@@ -102,6 +102,10 @@ async def activity_detail(request: Request, activity_id: int, db: Session = Depe
     registered = [r for r in activity.registrations if r.attendance == AttendanceStatus.registered]
     absent = [r for r in activity.registrations if r.attendance == AttendanceStatus.absent]
     cancelled = [r for r in activity.registrations if r.attendance == AttendanceStatus.cancelled]
+    waitlisted = sorted(
+        (r for r in activity.registrations if r.attendance == AttendanceStatus.waitlisted),
+        key=lambda r: (r.registered_at, r.id),
+    )
 
     return templates.TemplateResponse("partials/activity_detail.html", {
         "request": request,
@@ -110,4 +114,5 @@ async def activity_detail(request: Request, activity_id: int, db: Session = Depe
         "registered": registered,
         "absent": absent,
         "cancelled": cancelled,
+        "waitlisted": waitlisted,
     })
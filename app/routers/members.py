@@ -10,7 +10,11 @@ from sqlalchemy.orm import Session
 from sqlalchemy import or_
 
 from app.database import get_db
-from app.models import Member
+from app.models import Member, AGE_BANDS, NOT_HOLDING_PLACE
+from app.services.activity_waitlist import promote_waitlist
+from app.services.respite_occupancy import record_change, snapshot
+from app.services.respite_waitlist import release_and_promote
+from app.services.member_stats import get_stats
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
@@ -22,6 +26,7 @@ async def list_members(
     db: Session = Depends(get_db),
     q: str = "",
     status: str = "all",
+    age_band: str = "all",
     page: int = 1,
 ):
     page_size = 20
@@ -38,6 +43,8 @@ async def list_members(
         query = query.filter(Member.is_active == True)
     elif status == "inactive":
         query = query.filter(Member.is_active == False)
+    if age_band in AGE_BANDS:
+        query = query.filter(Member.in_age_band(age_band))
 
     total = query.count()
     members = query.order_by(Member.name_zh).offset((page - 1) * page_size).limit(page_size).all()
@@ -53,6 +60,7 @@ async def list_members(
             "total_pages": total_pages,
             "q": q,
             "status": status,
+            "age_band": age_band,
         })
 
     return templates.TemplateResponse("members/list.html", {
@@ -63,6 +71,8 @@ async def list_members(
         "total_pages": total_pages,
         "q": q,
         "status": status,
+        "age_band": age_band,
+        "AGE_BANDS": AGE_BANDS,
     })
 
 
@@ -125,6 +135,7 @@ async def member_detail(request: Request, member_id: int, db: Session = Depends(
     return templates.TemplateResponse("members/detail.html", {
         "request": request,
         "member": member,
+        "stats": get_stats(db, member_id),
     })
 
 
@@ -260,6 +271,16 @@ async def delete_member(request: Request, member_id: int, db: Session = Depends(
     member = db.query(Member).filter(Member.id == member_id).first()
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
+    # Respite bookings are cascade-deleted with the member; release their slots
+    released = [snapshot(record) for record in member.respite_services]
+    for before in released:
+        record_change(db, before, None)
+    # So are activity registrations; the places they held go to the waitlists
+    activity_ids = {r.activity_id for r in member.registrations if r.attendance not in NOT_HOLDING_PLACE}
     db.delete(member)
+    for before in released:
+        release_and_promote(db, before, None)
+    for activity_id in activity_ids:
+        promote_waitlist(db, activity_id)
     db.commit()
     return HTMLResponse(status_code=303, headers={"Location": "/members/"})
@@ -1,18 +1,63 @@
+import asyncio
 from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Optional
 from fastapi import APIRouter, Request, Depends, Form
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import HTMLResponse, StreamingResponse
+from jinja2 import TemplateSyntaxError
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func
 
 from app.database import get_db
-from app.models import EmailDraft, EmailDraftStatus, SystemNotification
-from app.services.email import run_inactive_scan, send_email
+from app.models import AGE_BANDS, Campaign, EmailDraft, EmailDraftStatus, EmailTemplate, SystemNotification
+from app.services.email import run_inactive_scan, request_full_scan, claim_for_sending, publish_status
+from app.services import campaigns, dispatch, events
+from app.services.email_templates import registry, TEMPLATE_LABELS
+from app.services.email_bulk import bulk_approve, draft_batches, DEFAULT_WINDOW_MINUTES
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
 
-def _get_page_data(db: Session, status_filter: str = "all"):
+DRAFT_PAGE_SIZE = 50
+STREAM_KEEPALIVE = 15  # seconds between comment lines, so proxies keep the stream open
+
+
+def _status_counts(db: Session) -> dict:
+    """{"all": n, "draft": n, "approved": n, ...} from one GROUP BY status."""
+    counts = {s.name: 0 for s in EmailDraftStatus}
+    for status, n in db.query(EmailDraft.status, func.count(EmailDraft.id)).group_by(EmailDraft.status):
+        counts[status.name] = n
+    counts["all"] = sum(counts.values())
+    return counts
+
+
+def _draft_page(db: Session, status_filter: str = "all", before: Optional[int] = None):
+    """
+    One page of drafts, newest first, by keyset on id: `before` is the last id
+    of the previous page, so each page is an index range scan rather than an
+    OFFSET. Returns (drafts, next_before) where next_before is None on the
+    last page.
+    """
+    q = db.query(EmailDraft).options(joinedload(EmailDraft.member))
+    if status_filter in EmailDraftStatus.__members__:
+        q = q.filter(EmailDraft.status == EmailDraftStatus[status_filter])
+    if before:
+        q = q.filter(EmailDraft.id < before)
+    drafts = q.order_by(EmailDraft.id.desc()).limit(DRAFT_PAGE_SIZE + 1).all()
+    if len(drafts) > DRAFT_PAGE_SIZE:
+        drafts = drafts[:DRAFT_PAGE_SIZE]
+        return drafts, drafts[-1].id
+    return drafts, None
+
+
+@router.get("/", response_class=HTMLResponse)
+async def notifications_page(
+    request: Request,
+    status: str = "all",
+    db: Session = Depends(get_db),
+):
     notifications = (
         db.query(SystemNotification)
         .order_by(SystemNotification.created_at.desc())
@@ -22,41 +67,76 @@ def _get_page_data(db: Session, status_filter: str = "all"):
     unread_count = db.query(SystemNotification).filter(
         SystemNotification.is_read == False
     ).count()
+    drafts, next_before = _draft_page(db, status)
+    return templates.TemplateResponse("notifications.html", {
+        "request": request,
+        "notifications": notifications,
+        "unread_count": unread_count,
+        "drafts": drafts,
+        "next_before": next_before,
+        "counts": _status_counts(db),
+        "status_filter": status,
+        "batches": draft_batches(db),
+        "default_window": DEFAULT_WINDOW_MINUTES,
+    })
+
 
-    q = db.query(EmailDraft)
-    if status_filter == "draft":
-        q = q.filter(EmailDraft.status == EmailDraftStatus.draft)
-    elif status_filter == "approved":
-        q = q.filter(EmailDraft.status == EmailDraftStatus.approved)
-    elif status_filter == "sent":
-        q = q.filter(EmailDraft.status == EmailDraftStatus.sent)
+def _render_event(item: dict) -> str:
+    """One bus event as an SSE message whose data is out-of-band swap HTML."""
+    kind, data = item["kind"], item["data"]
+    context = {"kind": kind}
+    if kind == "notification":
+        context["notif"] = SimpleNamespace(
+            **{**data, "created_at": datetime.fromisoformat(data["created_at"])}, is_read=False,
+        )
+    elif kind == "unread":
+        context["unread_count"] = data["count"]
+    elif kind == "draft_status":
+        context.update(draft_id=data["id"], status=data["status"], label=data["label"])
+    html = templates.get_template("partials/live_event.html").render(context)
+    lines = [line for line in html.splitlines() if line.strip()]
+    return "event: message\n" + "".join(f"data: {line}\n" for line in lines) + "\n"
 
-    drafts = q.order_by(EmailDraft.created_at.desc()).all()
 
-    counts = {
-        "all": db.query(EmailDraft).count(),
-        "draft": db.query(EmailDraft).filter(EmailDraft.status == EmailDraftStatus.draft).count(),
-        "approved": db.query(EmailDraft).filter(EmailDraft.status == EmailDraftStatus.approved).count(),
-        "sent": db.query(EmailDraft).filter(EmailDraft.status == EmailDraftStatus.sent).count(),
-        "failed": db.query(EmailDraft).filter(EmailDraft.status == EmailDraftStatus.failed).count(),
-    }
+@router.get("/stream")
+async def notification_stream(request: Request):
+    """
+    Server-sent events for the notifications page: new system notifications,
+    the unread count and per-draft send status, pushed as they commit.
+    """
+    async def stream():
+        queue = events.subscribe()
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    item = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _render_event(item)
+        finally:
+            events.unsubscribe(queue)
 
-    return notifications, unread_count, drafts, counts
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
 
-@router.get("/", response_class=HTMLResponse)
-async def notifications_page(
+@router.get("/drafts", response_class=HTMLResponse)
+async def more_drafts(
     request: Request,
     status: str = "all",
+    before: Optional[int] = None,
     db: Session = Depends(get_db),
 ):
-    notifications, unread_count, drafts, counts = _get_page_data(db, status)
-    return templates.TemplateResponse("notifications.html", {
+    """Next page of draft rows for the "load more" button (HTMX)."""
+    drafts, next_before = _draft_page(db, status, before)
+    return templates.TemplateResponse("partials/draft_rows.html", {
         "request": request,
-        "notifications": notifications,
-        "unread_count": unread_count,
         "drafts": drafts,
-        "counts": counts,
+        "next_before": next_before,
         "status_filter": status,
     })
 
@@ -64,15 +144,10 @@ async def notifications_page(
 @router.post("/scan", response_class=HTMLResponse)
 async def trigger_scan(request: Request, db: Session = Depends(get_db)):
     count = run_inactive_scan(db)
-    notifications, unread_count, drafts, counts = _get_page_data(db)
-    return templates.TemplateResponse("notifications.html", {
+    return templates.TemplateResponse("partials/scan_result.html", {
         "request": request,
-        "notifications": notifications,
-        "unread_count": unread_count,
-        "drafts": drafts,
-        "counts": counts,
-        "status_filter": "all",
         "scan_result": count,
+        "counts": _status_counts(db),
     })
 
 
@@ -80,12 +155,14 @@ async def trigger_scan(request: Request, db: Session = Depends(get_db)):
 async def draft_edit_form(
     request: Request,
     draft_id: int,
+    sending: bool = False,
     db: Session = Depends(get_db),
 ):
     draft = db.query(EmailDraft).filter(EmailDraft.id == draft_id).first()
     return templates.TemplateResponse("partials/email_draft_detail.html", {
         "request": request,
         "draft": draft,
+        "sent_now": sending and draft is not None and draft.status == EmailDraftStatus.sent,
     })
 
 
@@ -123,6 +200,7 @@ async def approve_draft(
     if draft and draft.status == EmailDraftStatus.draft:
         draft.status = EmailDraftStatus.approved
         draft.scheduled_at = datetime.now() + timedelta(minutes=5)
+        draft.next_attempt_at = draft.scheduled_at
         db.commit()
         db.refresh(draft)
 
@@ -133,31 +211,69 @@ async def approve_draft(
     })
 
 
+@router.post("/drafts/approve-bulk", response_class=HTMLResponse)
+async def approve_drafts_bulk(
+    request: Request,
+    db: Session = Depends(get_db),
+    draft_ids: list[int] = Form([]),
+    batch_id: str = Form(""),
+    window_minutes: int = Form(DEFAULT_WINDOW_MINUTES),
+):
+    """Approve a batch or the ticked drafts with staggered send times (HTMX)."""
+    schedule = bulk_approve(db, draft_ids, batch_id or None, window_minutes)
+    db.commit()
+    return templates.TemplateResponse("partials/bulk_approve_result.html", {
+        "request": request,
+        "schedule": schedule,
+        "counts": _status_counts(db),
+        "approved_label": EmailDraftStatus.approved.value,
+    })
+
+
 @router.post("/drafts/{draft_id}/send-now", response_class=HTMLResponse)
 async def send_now(
     request: Request,
     draft_id: int,
     db: Session = Depends(get_db),
 ):
+    """
+    Claim the draft and hand the send to the background dispatcher; the
+    returned fragment shows it as sending and polls until it completes.
+    """
+    if claim_for_sending(db, draft_id, (EmailDraftStatus.draft, EmailDraftStatus.approved)):
+        draft = db.query(EmailDraft).filter(EmailDraft.id == draft_id).first()
+        draft.scheduled_at = datetime.now()
+        publish_status(db, draft)
+        db.commit()
+        dispatch.enqueue_send(draft_id)
     draft = db.query(EmailDraft).filter(EmailDraft.id == draft_id).first()
-    sent = False
-    if draft and draft.status in (EmailDraftStatus.draft, EmailDraftStatus.approved):
-        success = send_email(
-            to=draft.recipient_email,
-            subject=draft.subject,
-            body=draft.body,
-        )
-        if success:
-            draft.status = EmailDraftStatus.sent
-            draft.sent_at = datetime.now()
-            db.commit()
-            db.refresh(draft)
-            sent = True
 
     return templates.TemplateResponse("partials/email_draft_detail.html", {
         "request": request,
         "draft": draft,
-        "sent_now": sent,
+    })
+
+
+@router.post("/drafts/{draft_id}/retry", response_class=HTMLResponse)
+async def retry_draft(
+    request: Request,
+    draft_id: int,
+    db: Session = Depends(get_db),
+):
+    """Put a failed or dead-lettered draft back in the send queue with a fresh attempt count."""
+    draft = db.query(EmailDraft).filter(EmailDraft.id == draft_id).first()
+    if draft and draft.status in (EmailDraftStatus.failed, EmailDraftStatus.dead_letter):
+        draft.status = EmailDraftStatus.approved
+        draft.attempts = 0
+        draft.next_attempt_at = datetime.now()
+        publish_status(db, draft)
+        db.commit()
+        db.refresh(draft)
+
+    return templates.TemplateResponse("partials/email_draft_detail.html", {
+        "request": request,
+        "draft": draft,
+        "requeued": True,
     })
 
 
@@ -184,6 +300,7 @@ async def mark_read(
     notif = db.query(SystemNotification).filter(SystemNotification.id == notif_id).first()
     if notif:
         notif.is_read = True
+        events.publish_unread_count(db)
         db.commit()
     return HTMLResponse("")
 
@@ -193,5 +310,165 @@ async def mark_all_read(request: Request, db: Session = Depends(get_db)):
     db.query(SystemNotification).filter(
         SystemNotification.is_read == False
     ).update({"is_read": True})
+    events.publish_unread_count(db)
     db.commit()
     return HTMLResponse("")
+
+
+# ── Email templates ───────────────────────────────────────────────────────────
+
+def _templates_page(
+    request: Request,
+    db: Session,
+    saved: str = "",
+    error: str = "",
+    rejected: Optional[tuple[str, str, str]] = None,
+):
+    """Editor page; `rejected` is (key, subject, body) of an edit to show again with its error."""
+    registry.refresh(db)
+    overridden = {key for (key,) in db.query(EmailTemplate.key)}
+    items = []
+    for key in registry.keys():
+        subject, body = rejected[1:] if rejected and rejected[0] == key else registry.source(key)
+        items.append({
+            "key": key,
+            "label": TEMPLATE_LABELS.get(key, key),
+            "subject": subject,
+            "body": body,
+            "overridden": key in overridden,
+        })
+    return templates.TemplateResponse("email_templates.html", {
+        "request": request,
+        "items": items,
+        "saved": saved,
+        "error": error,
+        "error_key": rejected[0] if rejected else "",
+    })
+
+
+@router.get("/templates", response_class=HTMLResponse)
+async def email_templates_page(request: Request, saved: str = "", db: Session = Depends(get_db)):
+    return _templates_page(request, db, saved=saved)
+
+
+@router.post("/templates/{key}", response_class=HTMLResponse)
+async def save_email_template(
+    request: Request,
+    key: str,
+    subject: str = Form(...),
+    body: str = Form(...),
+    db: Session = Depends(get_db),
+):
+    """Store a staff edit; every worker picks it up on its next render."""
+    if key not in registry.keys():
+        return HTMLResponse(status_code=303, headers={"Location": "/notifications/templates"})
+    body = body.replace("\r\n", "\n")
+    try:
+        registry.check(subject, body)
+    except TemplateSyntaxError as e:
+        return _templates_page(
+            request, db,
+            error=f"範本語法錯誤（第 {e.lineno} 行）：{e.message}",
+            rejected=(key, subject, body),
+        )
+    except Exception as e:  # unknown filter / test, unsafe access, runtime error in the trial render
+        return _templates_page(
+            request, db,
+            error=f"範本無法套用：{e}",
+            rejected=(key, subject, body),
+        )
+    row = db.get(EmailTemplate, key) or EmailTemplate(key=key)
+    row.subject = subject.strip()
+    row.body = body
+    row.updated_at = datetime.now()
+    db.add(row)
+    db.commit()
+    return HTMLResponse(status_code=303, headers={"Location": f"/notifications/templates?saved={key}"})
+
+
+@router.post("/templates/{key}/reset", response_class=HTMLResponse)
+async def reset_email_template(key: str, db: Session = Depends(get_db)):
+    """Drop the staff edit so the file version applies again."""
+    db.query(EmailTemplate).filter(EmailTemplate.key == key).delete()
+    db.commit()
+    return HTMLResponse(status_code=303, headers={"Location": f"/notifications/templates?saved={key}"})
+
+
+# ── Outreach campaigns ────────────────────────────────────────────────────────
+
+def _optional_int(value: str) -> Optional[int]:
+    value = value.strip()
+    return int(value) if value else None
+
+
+def _optional_bool(value: str) -> Optional[bool]:
+    """Tri-state select: "" = not filtered on, "1" / "0"."""
+    return {"1": True, "0": False}.get(value)
+
+
+def _campaigns_page(request: Request, db: Session, saved: str = "", error: str = ""):
+    return templates.TemplateResponse("campaigns.html", {
+        "request": request,
+        "campaigns": [(c, campaigns.describe(c)) for c in campaigns.all_campaigns(db)],
+        "template_keys": [(key, TEMPLATE_LABELS.get(key, key)) for key in registry.keys()],
+        "AGE_BANDS": AGE_BANDS,
+        "saved": saved,
+        "error": error,
+    })
+
+
+@router.get("/campaigns", response_class=HTMLResponse)
+async def campaigns_page(request: Request, saved: str = "", db: Session = Depends(get_db)):
+    return _campaigns_page(request, db, saved=saved)
+
+
+@router.post("/campaigns", response_class=HTMLResponse)
+@router.post("/campaigns/{campaign_id}", response_class=HTMLResponse)
+async def save_campaign(
+    request: Request,
+    campaign_id: Optional[int] = None,
+    name: str = Form(...),
+    template_key: str = Form(...),
+    priority: int = Form(100),
+    is_active: bool = Form(False),
+    min_absent_days: int = Form(14),
+    age_band: str = Form(""),
+    has_health_condition: str = Form(""),
+    health_keywords: str = Form(""),
+    joined_within_days: str = Form(""),
+    attended_before: str = Form(""),
+    min_respite_days: str = Form(""),
+    db: Session = Depends(get_db),
+):
+    """
+    Create or update a campaign. The next scan then evaluates every member,
+    so members who already match the new criteria are reached too.
+    """
+    campaign = db.get(Campaign, campaign_id) if campaign_id else Campaign()
+    if campaign is None:
+        return HTMLResponse(status_code=303, headers={"Location": "/notifications/campaigns"})
+    try:
+        joined_within = _optional_int(joined_within_days)
+        respite_days = _optional_int(min_respite_days)
+    except ValueError:
+        return _campaigns_page(request, db, error="天數必須為整數。")
+    if template_key not in registry.keys():
+        return _campaigns_page(request, db, error=f"找不到電郵範本「{template_key}」。")
+    if min_absent_days < 1:
+        return _campaigns_page(request, db, error="缺席天數最少為 1 天。")
+
+    campaign.name = name.strip() or TEMPLATE_LABELS.get(template_key, template_key)
+    campaign.template_key = template_key
+    campaign.priority = priority
+    campaign.is_active = is_active
+    campaign.min_absent_days = min_absent_days
+    campaign.age_band = age_band if age_band in AGE_BANDS else None
+    campaign.has_health_condition = _optional_bool(has_health_condition)
+    campaign.health_keywords = "、".join(campaigns.split_keywords(health_keywords)) or None
+    campaign.joined_within_days = joined_within
+    campaign.attended_before = _optional_bool(attended_before)
+    campaign.min_respite_days = respite_days or None
+    db.add(campaign)
+    request_full_scan(db)
+    db.commit()
+    return HTMLResponse(status_code=303, headers={"Location": f"/notifications/campaigns?saved={campaign.id}"})
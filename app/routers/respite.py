@@ -7,9 +7,18 @@ from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func
 
 from app.database import get_db
-from app.models import RespiteService, Member, SessionType, RespiteStatus
+from app.models import (
+    RespiteService, RespiteCapacityRule, Member, SessionType, RespiteStatus, CapacityRuleKind,
+)
 from app.services.respite_scheduler import (
-    get_daily_summary, get_remaining_slots, get_monthly_data, TOTAL_CAPACITY
+    get_daily_summary, get_remaining_slots, get_monthly_data,
+)
+from app.services.respite_occupancy import record_change, snapshot
+from app.services.respite_capacity import get_capacity, invalidate_cache, DEFAULT_CAPACITY
+from app.services.respite_waitlist import release_and_promote
+from app.services import member_stats
+from app.services.respite_bulk import (
+    pending_records, bulk_approve, bulk_reject, expand_recurrence, book_recurring,
 )
 
 router = APIRouter()
@@ -17,6 +26,8 @@ templates = Jinja2Templates(directory="app/templates")
 
 MONTH_NAMES = ["一月", "二月", "三月", "四月", "五月", "六月",
                "七月", "八月", "九月", "十月", "十一月", "十二月"]
+WEEKDAYS = ["一", "二", "三", "四", "五", "六", "日"]
+HALF_LABELS = {"morning": "早上", "afternoon": "下午"}
 
 
 def _build_calendar_weeks(year: int, month: int, monthly_data: dict) -> list:
@@ -108,6 +119,7 @@ async def new_respite_form(request: Request, db: Session = Depends(get_db)):
         "members": members,
         "SessionType": SessionType,
         "RespiteStatus": RespiteStatus,
+        "WEEKDAYS": WEEKDAYS,
         "action": "/respite/",
         "method": "POST",
     })
@@ -139,13 +151,14 @@ async def day_detail(
             RespiteService.date == query_date,
             RespiteService.session.in_(sessions_filter),
         )
-        .order_by(RespiteService.status, RespiteService.id)
+        .order_by(RespiteService.status, RespiteService.created_at, RespiteService.id)
         .all()
     )
 
     approved = [r for r in records if r.status == RespiteStatus.approved]
     pending = [r for r in records if r.status == RespiteStatus.pending]
-    remaining = max(0, TOTAL_CAPACITY - len(approved))
+    capacity = get_capacity(db, query_date, "morning" if session == "morning" else "afternoon")
+    remaining = max(0, capacity - len(approved))
 
     return templates.TemplateResponse("partials/respite_day_detail.html", {
         "request": request,
@@ -155,7 +168,7 @@ async def day_detail(
         "approved": approved,
         "pending": pending,
         "remaining": remaining,
-        "capacity": TOTAL_CAPACITY,
+        "capacity": capacity,
     })
 
 
@@ -172,6 +185,106 @@ async def get_slots(request: Request, db: Session = Depends(get_db), date_str: s
     })
 
 
+@router.get("/capacity", response_class=HTMLResponse)
+async def capacity_rules(request: Request, db: Session = Depends(get_db)):
+    rules = (
+        db.query(RespiteCapacityRule)
+        .order_by(RespiteCapacityRule.kind, RespiteCapacityRule.weekday, RespiteCapacityRule.start_date)
+        .all()
+    )
+    return templates.TemplateResponse("respite/capacity.html", {
+        "request": request,
+        "rules": rules,
+        "CapacityRuleKind": CapacityRuleKind,
+        "WEEKDAYS": WEEKDAYS,
+        "HALF_LABELS": HALF_LABELS,
+        "default_capacity": DEFAULT_CAPACITY,
+    })
+
+
+@router.post("/capacity", response_class=HTMLResponse)
+async def create_capacity_rule(
+    request: Request,
+    db: Session = Depends(get_db),
+    kind: str = Form(...),
+    half: str = Form(""),
+    weekday: int = Form(0),
+    capacity: int = Form(0),
+    start_date: str = Form(""),
+    end_date: str = Form(""),
+    reason: str = Form(""),
+):
+    rule_kind = CapacityRuleKind(kind)
+    start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+    end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else start
+    if rule_kind in (CapacityRuleKind.closure, CapacityRuleKind.reduction) and not start:
+        raise HTTPException(status_code=400, detail="Start date is required")
+
+    if rule_kind in (CapacityRuleKind.default, CapacityRuleKind.weekday):
+        # Replace an existing rule for the same slot rather than stacking them
+        existing = db.query(RespiteCapacityRule).filter(
+            RespiteCapacityRule.kind == rule_kind,
+            RespiteCapacityRule.half == (half or None),
+        )
+        if rule_kind == CapacityRuleKind.weekday:
+            existing = existing.filter(RespiteCapacityRule.weekday == weekday)
+        existing.delete()
+
+    db.add(RespiteCapacityRule(
+        kind=rule_kind,
+        half=half or None,
+        weekday=weekday if rule_kind == CapacityRuleKind.weekday else None,
+        start_date=start,
+        end_date=end,
+        capacity=max(0, capacity),
+        reason=reason,
+    ))
+    db.commit()
+    invalidate_cache()
+    return HTMLResponse(status_code=303, headers={"Location": "/respite/capacity"})
+
+
+@router.post("/capacity/{rule_id}/delete", response_class=HTMLResponse)
+async def delete_capacity_rule(request: Request, rule_id: int, db: Session = Depends(get_db)):
+    rule = db.query(RespiteCapacityRule).filter(RespiteCapacityRule.id == rule_id).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    db.delete(rule)
+    db.commit()
+    invalidate_cache()
+    return HTMLResponse(status_code=303, headers={"Location": "/respite/capacity"})
+
+
+@router.post("/bulk", response_class=HTMLResponse)
+async def bulk_respite(
+    request: Request,
+    db: Session = Depends(get_db),
+    action: str = Form("approve"),
+    record_ids: list[int] = Form([]),
+    date_from: str = Form(""),
+    date_to: str = Form(""),
+):
+    start = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None
+    end = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else None
+    if not record_ids and not (start and end):
+        records = []
+    else:
+        records = pending_records(db, record_ids, start, end)
+
+    if action == "reject":
+        done, unplaced = bulk_reject(db, records), []
+    else:
+        done, unplaced = bulk_approve(db, records)
+    db.commit()
+
+    return templates.TemplateResponse("partials/respite_bulk_result.html", {
+        "request": request,
+        "action": action,
+        "done": done,
+        "unplaced": unplaced,
+    })
+
+
 @router.post("/", response_class=HTMLResponse)
 async def create_respite(
     request: Request,
@@ -181,15 +294,39 @@ async def create_respite(
     session: str = Form(...),
     status: str = Form("pending"),
     notes: str = Form(""),
+    repeat: str = Form("none"),
+    weekdays: list[int] = Form([]),
+    until_str: str = Form(""),
 ):
+    start = datetime.strptime(date_str, "%Y-%m-%d").date()
+    if repeat == "weekly" and until_str:
+        until = datetime.strptime(until_str, "%Y-%m-%d").date()
+        dates = expand_recurrence(start, until, set(weekdays) or {start.weekday()})
+        created, conflicts = book_recurring(
+            db, member_id, dates, SessionType(session), RespiteStatus(status), notes,
+        )
+        db.commit()
+        member = db.query(Member).filter(Member.id == member_id).first()
+        return templates.TemplateResponse("respite/recurring_result.html", {
+            "request": request,
+            "member": member,
+            "session": SessionType(session),
+            "dates": dates,
+            "created": created,
+            "conflicts": conflicts,
+            "WEEKDAYS": WEEKDAYS,
+        })
+
     record = RespiteService(
         member_id=member_id,
-        date=datetime.strptime(date_str, "%Y-%m-%d").date(),
+        date=start,
         session=SessionType(session),
         status=RespiteStatus(status),
         notes=notes,
     )
     db.add(record)
+    record_change(db, None, snapshot(record))
+    member_stats.refresh(db, [member_id])
     db.commit()
     return HTMLResponse(status_code=303, headers={"Location": "/respite/"})
 
@@ -225,11 +362,17 @@ async def update_respite(
     record = db.query(RespiteService).filter(RespiteService.id == record_id).first()
     if not record:
         raise HTTPException(status_code=404, detail="Record not found")
+    before = snapshot(record)
+    previous_member_id = record.member_id
     record.member_id = member_id
     record.date = datetime.strptime(date_str, "%Y-%m-%d").date()
     record.session = SessionType(session)
     record.status = RespiteStatus(status)
     record.notes = notes
+    after = snapshot(record)
+    record_change(db, before, after)
+    release_and_promote(db, before, after)
+    member_stats.refresh(db, [previous_member_id, member_id])
     db.commit()
     return HTMLResponse(status_code=303, headers={"Location": "/respite/"})
 
@@ -239,7 +382,11 @@ async def delete_respite(request: Request, record_id: int, db: Session = Depends
     record = db.query(RespiteService).filter(RespiteService.id == record_id).first()
     if not record:
         raise HTTPException(status_code=404, detail="Record not found")
+    before = snapshot(record)
+    record_change(db, before, None)
     db.delete(record)
+    release_and_promote(db, before, None)
+    member_stats.refresh(db, [record.member_id])
     db.commit()
     return HTMLResponse(status_code=303, headers={"Location": "/respite/"})
 
@@ -248,6 +395,23 @@ async def delete_respite(request: Request, record_id: int, db: Session = Depends
 async def approve_respite(request: Request, record_id: int, db: Session = Depends(get_db)):
     record = db.query(RespiteService).filter(RespiteService.id == record_id).first()
     if record:
+        before = snapshot(record)
         record.status = RespiteStatus.approved
+        record_change(db, before, snapshot(record))
+        member_stats.refresh(db, [record.member_id])
+        db.commit()
+    return HTMLResponse(status_code=303, headers={"Location": "/respite/"})
+
+
+@router.post("/{record_id}/reject", response_class=HTMLResponse)
+async def reject_respite(request: Request, record_id: int, db: Session = Depends(get_db)):
+    record = db.query(RespiteService).filter(RespiteService.id == record_id).first()
+    if record:
+        before = snapshot(record)
+        record.status = RespiteStatus.rejected
+        after = snapshot(record)
+        record_change(db, before, after)
+        release_and_promote(db, before, after)
+        member_stats.refresh(db, [record.member_id])
         db.commit()
     return HTMLResponse(status_code=303, headers={"Location": "/respite/"})
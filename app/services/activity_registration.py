@@ -0,0 +1,160 @@
+"""
+Activity registration.
+
+A member holds at most one non-cancelled registration per activity, enforced by
+the partial unique index ux_registrations_active. The capacity check and the
+insert are one INSERT ... SELECT ... WHERE (places taken) < capacity statement,
+run after locking the activity row, so concurrent staff cannot overbook. When
+the activity is full the member joins its waitlist instead.
+"""
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import case, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models import Activity, Registration, AttendanceStatus, NOT_HOLDING_PLACE
+from app.services import member_stats
+
+REGISTERED = "registered"
+WAITLISTED = "waitlisted"
+DUPLICATE = "duplicate"
+
+
+class ActivityFull(Exception):
+    """An attendance change would give more members a place than the activity has."""
+
+
+def places_taken(activity_id):
+    """SELECT count of registrations holding a place (not cancelled / waitlisted)."""
+    return (
+        select(func.count(Registration.id))
+        .where(
+            Registration.activity_id == activity_id,
+            Registration.attendance.not_in(NOT_HOLDING_PLACE),
+        )
+    )
+
+
+def lock_activity(db: Session, activity_id: int):
+    """
+    SELECT ... FOR UPDATE on the activity row. Serialises registrations and
+    waitlist promotions for one activity on Postgres; SQLite already allows a
+    single writer at a time.
+    """
+    return db.query(Activity).filter(Activity.id == activity_id).with_for_update().first()
+
+
+def register(db: Session, activity_id: int, member_id: int) -> str:
+    """
+    Register a member, or waitlist them when the activity is full. Returns
+    REGISTERED, WAITLISTED or DUPLICATE; commits on success and rolls back on
+    DUPLICATE.
+    """
+    lock_activity(db, activity_id)
+
+    capacity = select(Activity.capacity).where(Activity.id == activity_id).scalar_subquery()
+    attendance_type = Registration.__table__.c.attendance.type
+    now = datetime.now()
+    stmt = insert(Registration).from_select(
+        ["activity_id", "member_id", "registered_at", "attendance"],
+        select(
+            literal(activity_id),
+            literal(member_id),
+            literal(now),
+            literal(AttendanceStatus.registered, attendance_type),
+        ).where(places_taken(activity_id).scalar_subquery() < capacity),
+    )
+    try:
+        result = REGISTERED
+        if not db.execute(stmt).rowcount:
+            db.execute(insert(Registration).values(
+                activity_id=activity_id,
+                member_id=member_id,
+                registered_at=now,
+                attendance=AttendanceStatus.waitlisted,
+            ))
+            result = WAITLISTED
+    except IntegrityError:
+        db.rollback()
+        return DUPLICATE
+    db.commit()
+    return result
+
+
+def set_attendance(
+    db: Session,
+    activity_id: int,
+    updates: dict,
+    loaded: Optional[dict] = None,
+) -> tuple[dict, bool]:
+    """
+    Apply {registration_id: AttendanceStatus} for one activity. Rows whose
+    status is unchanged are skipped, as are rows whose status no longer
+    matches `loaded` ({registration_id: status the form was rendered with}),
+    i.e. rows someone – or a waitlist promotion – changed in the meantime.
+    The rest are written by a single
+    UPDATE ... SET attendance = CASE id WHEN ... END, and the affected
+    members' rollups are refreshed. Returns the changed
+    {registration_id: status} and whether any row gave up its place
+    (moved from a place-holding status into NOT_HOLDING_PLACE), i.e.
+    whether the waitlist should be promoted.
+
+    Rows taking a place back (out of NOT_HOLDING_PLACE) are checked against
+    the activity's free places under the activity lock and raise
+    ActivityFull if they do not fit; reviving a cancelled row for a member
+    who registered again raises IntegrityError (ux_registrations_active).
+    Caller commits, or rolls back on either error.
+    """
+    if not updates:
+        return {}, False
+    current = {
+        reg_id: (attendance, member_id)
+        for reg_id, attendance, member_id in db.query(
+            Registration.id, Registration.attendance, Registration.member_id,
+        ).filter(
+            Registration.activity_id == activity_id,
+            Registration.id.in_(list(updates)),
+        )
+    }
+    changed = {
+        reg_id: status
+        for reg_id, status in updates.items()
+        if reg_id in current and current[reg_id][0] != status
+        and (loaded is None or loaded.get(reg_id, current[reg_id][0]) == current[reg_id][0])
+    }
+    if not changed:
+        return {}, False
+    freed = any(
+        current[reg_id][0] not in NOT_HOLDING_PLACE and status in NOT_HOLDING_PLACE
+        for reg_id, status in changed.items()
+    )
+    taking = sum(
+        1 for reg_id, status in changed.items()
+        if current[reg_id][0] in NOT_HOLDING_PLACE and status not in NOT_HOLDING_PLACE
+    )
+    if taking:
+        activity = lock_activity(db, activity_id)
+        releasing = sum(
+            1 for reg_id, status in changed.items()
+            if current[reg_id][0] not in NOT_HOLDING_PLACE and status in NOT_HOLDING_PLACE
+        )
+        free = (activity.capacity or 0) - db.scalar(places_taken(activity_id)) + releasing
+        if taking > free:
+            raise ActivityFull()
+
+    attendance_type = Registration.__table__.c.attendance.type
+    db.execute(
+        update(Registration)
+        .where(
+            Registration.activity_id == activity_id,
+            Registration.id.in_(list(changed)),
+        )
+        .values(attendance=case(
+            {reg_id: literal(status, attendance_type) for reg_id, status in changed.items()},
+            value=Registration.id,
+        ))
+        .execution_options(synchronize_session=False)
+    )
+    member_stats.refresh(db, {current[reg_id][1] for reg_id in changed})
+    return changed, freed
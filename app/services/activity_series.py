@@ -0,0 +1,94 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, select
+
+from app.models import (
+    Activity, ActivitySeries, ActivityStatus, AttendanceStatus, Registration, NOT_HOLDING_PLACE,
+)
+
+MAX_OCCURRENCES = 200
+
+
+def occurrence_dates(series: ActivitySeries) -> list[date]:
+    """Dates between start_date and end_date that fall on the series' weekdays."""
+    weekdays = set(series.weekday_list)
+    dates, d = [], series.start_date
+    while d <= series.end_date and len(dates) < MAX_OCCURRENCES:
+        if d.weekday() in weekdays:
+            dates.append(d)
+        d += timedelta(days=1)
+    return dates
+
+
+def generate_occurrences(
+    db: Session,
+    series: ActivitySeries,
+    roster_activity_id: Optional[int] = None,
+) -> list[int]:
+    """
+    Insert every occurrence of the series in one batched INSERT ... RETURNING,
+    optionally copying the confirmed roster of `roster_activity_id` onto
+    each new occurrence with a second batched INSERT. Returns the new ids.
+    Caller commits.
+    """
+    hour, minute = (int(x) for x in series.start_time.split(":"))
+    duration = timedelta(minutes=series.duration_minutes or 0)
+    now = datetime.now()
+    rows = []
+    for d in occurrence_dates(series):
+        start = datetime(d.year, d.month, d.day, hour, minute)
+        rows.append({
+            "name": series.name,
+            "type": series.type,
+            "description": series.description,
+            "datetime_start": start,
+            "datetime_end": start + duration if duration else None,
+            "location": series.location,
+            "capacity": series.capacity,
+            "fee": series.fee,
+            "status": ActivityStatus.upcoming,
+            "series_id": series.id,
+            "created_at": now,
+        })
+    if not rows:
+        return []
+
+    activity_ids = list(db.scalars(insert(Activity).returning(Activity.id), rows))
+
+    if roster_activity_id:
+        member_ids = db.scalars(
+            select(Registration.member_id).where(
+                Registration.activity_id == roster_activity_id,
+                Registration.attendance.not_in(NOT_HOLDING_PLACE),
+            )
+        ).all()
+        registrations = [
+            {
+                "activity_id": activity_id,
+                "member_id": member_id,
+                "registered_at": now,
+                "attendance": AttendanceStatus.registered,
+            }
+            for activity_id in activity_ids
+            for member_id in member_ids
+        ]
+        if registrations:
+            db.execute(insert(Registration), registrations)
+    return activity_ids
+
+
+def update_future_occurrences(db: Session, series: ActivitySeries, values: dict) -> int:
+    """
+    Apply `values` (Activity column → value) to every occurrence that has not
+    started yet, in a single UPDATE. Returns the number of rows changed.
+    Caller commits.
+    """
+    return (
+        db.query(Activity)
+        .filter(
+            Activity.series_id == series.id,
+            Activity.datetime_start >= datetime.now(),
+        )
+        .update(values, synchronize_session=False)
+    )
@@ -0,0 +1,83 @@
+"""
+Activity waitlist.
+
+Waitlisted registrations queue per activity by (registered_at, id). When a
+place frees up, promote_waitlist() moves the head of the queue into the freed
+places with one UPDATE over an ordered, limited subquery (served by the
+partial index ix_registrations_waitlist), and drafts a notification email for
+each promoted member.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+
+from app.models import Activity, Member, Registration, AttendanceStatus, SystemNotification
+from app.services.activity_registration import lock_activity, places_taken
+from app.services.email import build_drafts
+
+
+def waitlist(db: Session, activity_id: int) -> list[Registration]:
+    """Waitlisted registrations for an activity in queue order."""
+    return (
+        db.query(Registration)
+        .filter(
+            Registration.activity_id == activity_id,
+            Registration.attendance == AttendanceStatus.waitlisted,
+        )
+        .order_by(Registration.registered_at, Registration.id)
+        .all()
+    )
+
+
+def promote_waitlist(db: Session, activity_id: int) -> list[int]:
+    """
+    Fill free places from the waitlist and return the promoted member ids.
+
+    The activity row is locked first, so concurrent cancellations promote one
+    after the other and each sees the places the previous one filled.
+    Does not commit – the caller commits together with the change that freed
+    the place.
+    """
+    db.flush()
+    activity = lock_activity(db, activity_id)
+    if activity is None:
+        return []
+    free = (activity.capacity or 0) - db.scalar(places_taken(activity_id))
+    if free <= 0:
+        return []
+
+    head = (
+        select(Registration.id)
+        .where(
+            Registration.activity_id == activity_id,
+            Registration.attendance == AttendanceStatus.waitlisted,
+        )
+        .order_by(Registration.registered_at, Registration.id)
+        .limit(free)
+    )
+    member_ids = list(db.scalars(
+        update(Registration)
+        .where(Registration.id.in_(head))
+        .values(attendance=AttendanceStatus.registered)
+        .returning(Registration.member_id)
+        .execution_options(synchronize_session=False)
+    ))
+    if not member_ids:
+        return []
+    db.expire(activity, ["registrations"])
+
+    members = db.query(Member).filter(Member.id.in_(member_ids)).all()
+    batch_id = f"waitlist_{activity.id}"
+    details = {
+        "activity": activity.name,
+        "when": activity.datetime_start.strftime("%Y-%m-%d %H:%M"),
+        "location": activity.location or "中心",
+    }
+    db.add_all(build_drafts(db, [(member, "waitlist_promoted") for member in members], batch_id, **details))
+
+    names = "、".join(m.name_zh for m in members)
+    db.add(SystemNotification(
+        title=f"活動候補已自動補上（{activity.name}）",
+        message=f"因有名額釋出，系統已按候補次序為以下會員確認報名：{names}。通知電郵草稿已生成，請前往「通知管理」審閱。",
+        notif_type="activity_waitlist",
+    ))
+    return member_ids
@@ -0,0 +1,163 @@
+"""
+Outreach campaigns: the segment rules behind the inactivity scan.
+
+Each Campaign's criteria compile to one SQL predicate over members LEFT
+JOIN member_stats. The scan evaluates every active campaign in a single
+query – a CASE in priority order picks the first campaign each member
+matches – so adding a campaign adds a branch to that CASE, not another
+pass over the members table.
+
+Absence is counted from the member's last attendance, or from when the
+member was added if they never attended. A campaign drafts a member at
+most once per absence: not if, since that point, a campaign with an
+absence threshold at least as long already drafted them. Two 14-day
+campaigns therefore never both fire for one absence, while a 60-day
+follow-up still fires after a 14-day one.
+"""
+import re
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import and_, case, exists, func, or_, select, union
+from sqlalchemy.orm import Session, contains_eager
+
+from app.models import AGE_BANDS, Campaign, EmailDraft, Member, MemberStats
+from app.services.member_stats import month_bounds
+
+KEYWORD_SEPARATORS = re.compile(r"[,，、;；\s]+")
+
+
+def split_keywords(text: Optional[str]) -> list[str]:
+    return [k for k in KEYWORD_SEPARATORS.split(text or "") if k]
+
+
+def describe(campaign: Campaign) -> list[str]:
+    """The campaign's criteria as short labels, for the campaigns page."""
+    labels = [f"缺席 {campaign.min_absent_days} 天或以上"]
+    if campaign.age_band in AGE_BANDS:
+        labels.append(AGE_BANDS[campaign.age_band][0])
+    if campaign.has_health_condition is not None:
+        labels.append("有健康狀況記錄" if campaign.has_health_condition else "無健康狀況記錄")
+    words = split_keywords(campaign.health_keywords)
+    if words:
+        labels.append("健康狀況含「" + "／".join(words) + "」")
+    if campaign.joined_within_days is not None:
+        labels.append(f"入會 {campaign.joined_within_days} 天內")
+    if campaign.attended_before is not None:
+        labels.append("曾出席活動" if campaign.attended_before else "從未出席活動")
+    if campaign.min_respite_days:
+        labels.append(f"本月暫託 {campaign.min_respite_days} 天或以上")
+    return labels
+
+
+def absence_start():
+    """SQL: when the member's current absence began (NULL if unknown)."""
+    return func.coalesce(MemberStats.last_attended_at, Member.created_at)
+
+
+def segment(campaign: Campaign, now: datetime) -> list:
+    """SQL clauses for the campaign's criteria other than absence."""
+    clauses = []
+    if campaign.age_band in AGE_BANDS:
+        clauses.append(Member.in_age_band(campaign.age_band))
+    has_condition = and_(Member.health_condition.is_not(None), func.trim(Member.health_condition) != "")
+    if campaign.has_health_condition is not None:
+        clauses.append(has_condition if campaign.has_health_condition else ~has_condition)
+    words = split_keywords(campaign.health_keywords)
+    if words:
+        clauses.append(or_(*[Member.health_condition.icontains(w, autoescape=True) for w in words]))
+    if campaign.joined_within_days is not None:
+        since = now.date() - timedelta(days=campaign.joined_within_days)
+        clauses.append(or_(Member.joined_date.is_(None), Member.joined_date >= since))
+    if campaign.attended_before is not None:
+        attended = func.coalesce(MemberStats.total_attended, 0) > 0
+        clauses.append(attended if campaign.attended_before else ~attended)
+    if campaign.min_respite_days:
+        clauses.append(and_(
+            MemberStats.respite_month == month_bounds(now.date())[0],
+            MemberStats.respite_days >= campaign.min_respite_days,
+        ))
+    return clauses
+
+
+def predicate(campaign: Campaign, thresholds: dict, now: datetime):
+    """
+    SQL: the member matches `campaign` and has not been drafted for this
+    absence yet. `thresholds` is {campaign id: min_absent_days} for every
+    campaign, disabled ones included, since their drafts still count.
+    """
+    start = absence_start()
+    covering = [cid for cid, days in thresholds.items() if days >= campaign.min_absent_days]
+    drafted = exists().where(
+        EmailDraft.member_id == Member.id,
+        EmailDraft.campaign_id.in_(covering),
+        or_(start.is_(None), EmailDraft.created_at >= start),
+    )
+    return and_(
+        or_(start.is_(None), start < now - timedelta(days=campaign.min_absent_days)),
+        *segment(campaign, now),
+        ~drafted,
+    )
+
+
+def changed_since(since: datetime, now: datetime, absent_days: set):
+    """
+    Ids of members who may have started matching a campaign in [since, now):
+    their absence crossed one of the thresholds in that window (index ranges
+    on member_stats.last_attended_at and members.created_at), or their
+    member row or participation rollup changed.
+    """
+    parts = [
+        select(Member.id).where(Member.updated_at >= since),
+        select(MemberStats.member_id).where(MemberStats.updated_at >= since),
+    ]
+    for days in sorted(absent_days):
+        threshold = timedelta(days=days)
+        parts.append(select(MemberStats.member_id).where(
+            MemberStats.last_attended_at >= since - threshold,
+            MemberStats.last_attended_at < now - threshold,
+        ))
+        parts.append(select(Member.id).where(
+            Member.created_at >= since - threshold,
+            Member.created_at < now - threshold,
+        ))
+    return union(*parts)
+
+
+def all_campaigns(db: Session) -> list[Campaign]:
+    """Every campaign, enabled first, each group in priority order."""
+    return db.query(Campaign).order_by(Campaign.is_active.desc(), Campaign.priority, Campaign.id).all()
+
+
+def match(
+    db: Session,
+    campaigns: list[Campaign],
+    now: Optional[datetime] = None,
+    since: Optional[datetime] = None,
+) -> list[tuple[Member, Campaign]]:
+    """
+    (member, campaign) for each active member due a draft, evaluated in one
+    query: the first of the active `campaigns` (in priority order) they
+    match. With `since`, only members from changed_since() are evaluated.
+    """
+    now = now or datetime.now()
+    active = sorted((c for c in campaigns if c.is_active), key=lambda c: (c.priority, c.id))
+    if not active:
+        return []
+    thresholds = {c.id: c.min_absent_days for c in campaigns}
+    chosen = case(*[(predicate(c, thresholds, now), c.id) for c in active], else_=None)
+    start = absence_start()
+    query = (
+        db.query(Member, chosen)
+        .outerjoin(MemberStats, MemberStats.member_id == Member.id)
+        .options(contains_eager(Member.stats))
+        .filter(
+            Member.is_active == True,
+            # cheap pre-filter before the CASE: absent for at least the shortest threshold
+            or_(start.is_(None), start < now - timedelta(days=min(c.min_absent_days for c in active))),
+            chosen.is_not(None),
+        )
+    )
+    if since is not None:
+        query = query.filter(Member.id.in_(changed_since(since, now, {c.min_absent_days for c in active})))
+    by_id = {c.id: c for c in active}
+    return [(member, by_id[campaign_id]) for member, campaign_id in query.all()]
@@ -0,0 +1,46 @@
+"""
+Background dispatch for "send now".
+
+The route claims the draft ('sending', see email.claim_for_sending) and
+returns at once; the actual send runs on a small thread pool with its own
+session. If no rate token comes within SEND_NOW_WAIT, or the worker dies,
+the claimed draft falls due for the per-minute sender, so a queued send is
+never lost.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from app.database import SessionLocal
+from app.models import EmailDraft, EmailDraftStatus
+from app.services.email import deliver
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_WORKERS = 2
+SEND_NOW_WAIT = 30  # seconds a send-now waits for a rate token before leaving it to the scheduler
+
+_executor = ThreadPoolExecutor(max_workers=DISPATCH_WORKERS, thread_name_prefix="dispatch")
+
+
+def _send_job(draft_id: int):
+    db = SessionLocal()
+    try:
+        draft = db.get(EmailDraft, draft_id)
+        if draft is None or draft.status != EmailDraftStatus.sending:
+            return
+        if deliver(db, draft, SEND_NOW_WAIT) is None:
+            logger.info(f"[Dispatch] Draft {draft_id} left for the scheduled sender")
+    except Exception as e:
+        logger.error(f"[Dispatch] Draft {draft_id} send error: {e}")
+    finally:
+        db.close()
+
+
+def enqueue_send(draft_id: int):
+    """Send a claimed draft in the background."""
+    _executor.submit(_send_job, draft_id)
+
+
+def stop_dispatch():
+    """Let running sends finish; queued ones are picked up by the scheduler later."""
+    _executor.shutdown(wait=True, cancel_futures=True)
@@ -1,294 +1,286 @@
 import os
-import base64
 import logging
-from datetime import datetime, timedelta, date
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Optional
 from sqlalchemy.orm import Session
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
 
 from app.models import (
-    Member, Registration, AttendanceStatus,
-    EmailDraft, EmailDraftStatus, SystemNotification,
+    Member,
+    EmailDraft, EmailDraftStatus, ScanCursor, SystemNotification,
 )
+from app.services import campaigns, events, send_rate
+from app.services.email_templates import render_batch
+from app.services.mail_transport import get_transport
 
 logger = logging.getLogger(__name__)
 
-CENTRE_NAME = os.getenv("CENTRE_NAME", "快樂長者中心")
-CENTRE_PHONE = os.getenv("CENTRE_PHONE", "2xxx-xxxx")
-
 # ── Email templates ────────────────────────────────────────────────────────────
+# Sources live in app/email_templates (overridable from the DB); see
+# app.services.email_templates for the compiled registry.
+
+def build_drafts(
+    db: Session,
+    items: list[tuple[Member, str]],
+    batch_id: str,
+    **extra,
+) -> list[EmailDraft]:
+    """
+    Unsaved EmailDrafts for (member, template key) pairs, rendered as one
+    batch and addressed per TEST_RECIPIENT.
+    """
+    test_recipient = os.getenv("TEST_RECIPIENT", "")
+    rendered = render_batch(db, items, **extra)
+    return [
+        EmailDraft(
+            member_id=member.id,
+            subject=subject,
+            body=body,
+            template_type=template_key,
+            status=EmailDraftStatus.draft,
+            recipient_email=test_recipient if test_recipient else (member.phone or ""),
+            batch_id=batch_id,
+        )
+        for (member, template_key), (subject, body) in zip(items, rendered)
+    ]
 
-TEMPLATES = {
-    "new_member": {
-        "subject": f"【{CENTRE_NAME}】歡迎加入，期待與您相遇！",
-        "body": """\
-親愛的 {name}，
-
-您好！感謝您成為{centre}的一員。
-
-我們中心定期舉辦各類活動，包括興趣班、健康講座及社交聚會，希望您能夠積極參與，與中心的朋友們共度愉快時光。
-
-如您有任何問題或需要協助，歡迎隨時聯絡我們：
-電話：{phone}
-
-期待在中心與您相見！
-
-此致
-{centre}職員團隊
-""",
-    },
-    "health_care": {
-        "subject": f"【{CENTRE_NAME}】健康關懷問候",
-        "body": """\
-親愛的 {name}，
-
-您好！我們的職員一直掛念著您的健康狀況。
-
-中心近期舉辦了多場健康講座及保健活動，內容涵蓋慢性病管理、防跌技巧及營養飲食等，相信對您會有所裨益。
-
-歡迎您回來中心參加活動，與我們的醫護義工及職員交流。如有任何不適或需要，請隨時聯絡我們：
-電話：{phone}
-
-您的健康是我們最大的關心！
-
-此致
-{centre}職員團隊
-""",
-    },
-    "long_absent": {
-        "subject": f"【{CENTRE_NAME}】我們非常掛念您！",
-        "body": """\
-親愛的 {name}，
-
-您好！好久不見，中心的職員和朋友們都非常想念您。
-
-您上次參加活動已經有一段時間了，我們希望您一切安好。中心近期新增了不少精彩活動，誠邀您回來與大家重聚！
-
-如您身體或生活上有任何困難，我們很樂意為您提供協助，請隨時聯絡我們：
-電話：{phone}
-
-期待盡快與您重逢！
-
-此致
-{centre}職員團隊
-""",
-    },
-    "general": {
-        "subject": f"【{CENTRE_NAME}】中心關懷問候",
-        "body": """\
-親愛的 {name}，
-
-您好！感謝您一直以來對{centre}的支持。
-
-我們中心持續舉辦各類活動，歡迎您隨時回來參與，與中心的朋友共度美好時光。
-
-如有任何查詢，請致電：{phone}
-
-祝您身體健康、生活愉快！
-
-此致
-{centre}職員團隊
-""",
-    },
-}
-
-
-def select_template(member: Member) -> str:
-    """Pick the most suitable template key based on member profile."""
-    today = date.today()
-    joined = member.joined_date or today
-
-    # New member: joined within 6 months
-    if (today - joined).days <= 180:
-        return "new_member"
-
-    # Has attended activities before but gone quiet → long_absent
-    ever_attended = any(
-        r.attendance == AttendanceStatus.attended
-        for r in member.registrations
-    )
-    if ever_attended:
-        return "long_absent"
-
-    # Has health conditions → health care
-    if member.health_condition and member.health_condition.strip():
-        return "health_care"
-
-    return "general"
-
-
-def _render_template(template_key: str, member: Member) -> tuple[str, str]:
-    """Return (subject, body) filled with member data."""
-    tmpl = TEMPLATES[template_key]
-    ctx = {
-        "name": member.name_zh,
-        "centre": CENTRE_NAME,
-        "phone": CENTRE_PHONE,
-    }
-    subject = tmpl["subject"]
-    body = tmpl["body"].format(**ctx)
-    return subject, body
-
-
-# ── Gmail API ──────────────────────────────────────────────────────────────────
-
-def _build_gmail_service():
-    """Build an authenticated Gmail API service using stored OAuth2 tokens."""
-    from google.oauth2.credentials import Credentials
-    from google.auth.transport.requests import Request
-    from googleapiclient.discovery import build
-
-    creds = Credentials(
-        token=None,
-        refresh_token=os.getenv("GMAIL_REFRESH_TOKEN"),
-        client_id=os.getenv("GMAIL_CLIENT_ID"),
-        client_secret=os.getenv("GMAIL_CLIENT_SECRET"),
-        token_uri="https://oauth2.googleapis.com/token",
-        scopes=["https://www.googleapis.com/auth/gmail.send"],
-    )
-    creds.refresh(Request())
-    return build("gmail", "v1", credentials=creds)
 
+# ── Sending ────────────────────────────────────────────────────────────────────
 
 def send_email(to: str, subject: str, body: str) -> bool:
-    """Send email via Gmail API. Returns True on success."""
-    client_id = os.getenv("GMAIL_CLIENT_ID")
-    refresh_token = os.getenv("GMAIL_REFRESH_TOKEN")
-    test_recipient = os.getenv("TEST_RECIPIENT", "")
-
-    if not client_id or not refresh_token:
-        logger.warning("Gmail API credentials not set – logging mock email")
-        logger.info("=" * 60)
-        logger.info(f"[MOCK EMAIL] To: {to}")
-        logger.info(f"[MOCK EMAIL] Subject: {subject}")
-        logger.info(f"[MOCK EMAIL] Body:\n{body}")
-        logger.info("=" * 60)
-        return True  # treat mock as success so workflow proceeds
-
+    """
+    Send one email through the configured transport (MAIL_TRANSPORT; see
+    app.services.mail_transport). Returns True on success. Raises
+    send_rate.RateLimited, after pausing all senders for the provider's
+    Retry-After, when the provider refuses the message for rate reasons.
+    """
     # Always redirect to test recipient during testing
+    test_recipient = os.getenv("TEST_RECIPIENT", "")
     actual_to = test_recipient if test_recipient else to
+    return get_transport().send(actual_to, subject, body)
 
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = subject
-    msg["From"] = os.getenv("GMAIL_USER", "me")
-    msg["To"] = actual_to
-    msg.attach(MIMEText(body, "plain", "utf-8"))
 
-    raw = base64.urlsafe_b64encode(msg.as_bytes()).decode()
+# ── Scheduled jobs ─────────────────────────────────────────────────────────────
 
-    try:
-        service = _build_gmail_service()
-        service.users().messages().send(
-            userId="me",
-            body={"raw": raw},
-        ).execute()
-        logger.info(f"Gmail API: sent → {actual_to} | {subject}")
-        return True
-    except Exception as e:
-        logger.error(f"Gmail API send failed: {e}")
-        return False
+SCAN_CURSOR = "inactive"
 
 
-# ── Scheduled jobs ─────────────────────────────────────────────────────────────
+def _lock_cursor(db: Session) -> ScanCursor:
+    """The scan cursor row, created if missing and locked against concurrent scans."""
+    table = ScanCursor.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        db.execute(insert(table).values(name=SCAN_CURSOR).on_conflict_do_nothing(index_elements=[table.c.name]))
+    elif db.get(ScanCursor, SCAN_CURSOR) is None:
+        db.add(ScanCursor(name=SCAN_CURSOR))
+        db.flush()
+    return db.query(ScanCursor).filter(ScanCursor.name == SCAN_CURSOR).with_for_update().one()
 
-def get_inactive_members(db: Session, days: int = 14) -> list[Member]:
-    """Active members with no attended activity in the last N days."""
-    cutoff = datetime.now() - timedelta(days=days)
-    all_members = db.query(Member).filter(Member.is_active == True).all()
-    inactive = []
-    for member in all_members:
-        recent = [
-            r for r in member.registrations
-            if r.attendance == AttendanceStatus.attended
-            and r.registered_at >= cutoff
-        ]
-        if not recent:
-            inactive.append(member)
-    return inactive
-
-
-def run_inactive_scan(db: Session) -> int:
+
+def request_full_scan(db: Session):
     """
-    Scan for inactive members and create EmailDraft records.
-    Returns the number of new drafts created.
+    Make the next scan evaluate every member, e.g. after a campaign changed:
+    members who already match the new criteria have not changed themselves,
+    so an incremental scan would never reach them. Caller commits.
     """
-    today = datetime.now()
-    # batch_id = Monday of the current week, e.g. scan_2026-02-23
-    monday = today - timedelta(days=today.weekday())
-    batch_id = f"scan_{monday.strftime('%Y-%m-%d')}"
-
-    # Avoid duplicate scans in the same week
-    existing = db.query(EmailDraft).filter(
-        EmailDraft.batch_id == batch_id
-    ).first()
-    if existing:
-        logger.info(f"Scan {batch_id} already run – skipping")
-        return 0
+    db.execute(update(ScanCursor).where(ScanCursor.name == SCAN_CURSOR).values(scanned_at=None))
+
 
-    inactive = get_inactive_members(db, days=14)
-    if not inactive:
-        logger.info("No inactive members found")
+def run_inactive_scan(db: Session, full: bool = False) -> int:
+    """
+    Create EmailDraft records for members matched by the outreach campaigns
+    (see app.services.campaigns): one draft batch per campaign, all
+    campaigns evaluated in one query. Returns the number of new drafts.
+
+    Incremental: the scan_cursors row remembers when the last scan ran, and
+    only members whose absence crossed a campaign threshold since then, or
+    whose member row or rollup changed, are evaluated – so a daily run costs
+    in proportion to what changed rather than to the membership. The first
+    scan, the first after request_full_scan(), or full=True evaluates every
+    member – which is also how segment changes that need no member change
+    (a birthday moving someone into an age band) are picked up.
+    """
+    now = datetime.now()
+    cursor = _lock_cursor(db)  # a second worker's scan waits here, then sees this one's drafts
+    since = None if full else cursor.scanned_at
+    matched = campaigns.match(db, campaigns.all_campaigns(db), now=now, since=since)
+    cursor.scanned_at = now
+    if not matched:
+        db.commit()
+        logger.info("No members due an outreach draft")
         return 0
 
-    drafts_created = 0
-    for member in inactive:
-        tmpl_key = select_template(member)
-        subject, body = _render_template(tmpl_key, member)
-        test_recipient = os.getenv("TEST_RECIPIENT", "")
-        recipient = test_recipient if test_recipient else (member.phone or "")
-
-        draft = EmailDraft(
-            member_id=member.id,
-            subject=subject,
-            body=body,
-            template_type=tmpl_key,
-            status=EmailDraftStatus.draft,
-            recipient_email=recipient,
-            batch_id=batch_id,
-        )
-        db.add(draft)
-        drafts_created += 1
+    by_campaign: dict = {}
+    for member, campaign in matched:
+        by_campaign.setdefault(campaign, []).append(member)
+    summary = []
+    for campaign, members in by_campaign.items():
+        batch_id = f"scan_{now.strftime('%Y-%m-%d')}_{campaign.id}"
+        drafts = build_drafts(db, [(m, campaign.template_key) for m in members], batch_id)
+        for draft in drafts:
+            draft.campaign_id = campaign.id
+        db.add_all(drafts)
+        summary.append(f"{campaign.name} {len(drafts)} 封")
+        logger.info(f"Scan {batch_id} ({campaign.name}): created {len(drafts)} drafts")
+    drafts_created = len(matched)
 
     # Create a system notification for staff
     notif = SystemNotification(
-        title=f"電郵草稿已生成（{batch_id}）",
+        title=f"電郵草稿已生成（{now.strftime('%Y-%m-%d')}）",
         message=(
-            f"系統已為 {drafts_created} 位兩週未出席的會員生成關懷電郵草稿，"
+            f"系統已按外展計劃為 {drafts_created} 位會員生成關懷電郵草稿（{'、'.join(summary)}），"
             f"請前往「通知管理」審閱並批准發送。"
         ),
         notif_type="email_scan",
     )
     db.add(notif)
     db.commit()
-
-    logger.info(f"Scan {batch_id}: created {drafts_created} drafts")
     return drafts_created
 
 
-def process_scheduled_sends(db: Session) -> int:
+MAX_SEND_ATTEMPTS = 6
+SEND_LEASE = timedelta(minutes=10)  # a claimed draft is picked up again after this if its sender died
+DUE_STATUSES = (EmailDraftStatus.approved, EmailDraftStatus.failed, EmailDraftStatus.sending)
+SEND_JOB_BUDGET = 50  # seconds; the per-minute sender stops pacing before its next run
+RETRY_BASE = timedelta(minutes=1)
+RETRY_CAP = timedelta(hours=6)
+
+
+def retry_delay(attempts: int) -> timedelta:
     """
-    Send any approved drafts whose scheduled_at has passed.
-    Returns the number of emails sent.
+    Exponential backoff after `attempts` failed sends (1 min, 2, 4, ... capped
+    at 6 h) with equal jitter: half the delay is fixed, half is random, so
+    drafts that failed together do not all retry in the same minute.
     """
-    now = datetime.now()
-    due_drafts = db.query(EmailDraft).filter(
-        EmailDraft.status == EmailDraftStatus.approved,
-        EmailDraft.scheduled_at <= now,
-    ).all()
+    delay = min(RETRY_CAP, RETRY_BASE * 2 ** (attempts - 1))
+    return delay / 2 + delay / 2 * random.random()
 
-    sent_count = 0
-    for draft in due_drafts:
+
+def record_send_result(draft: EmailDraft, success: bool, now: datetime):
+    """
+    Apply one send attempt to `draft`: sent, failed with the next attempt
+    scheduled, or dead_letter once MAX_SEND_ATTEMPTS is reached.
+    """
+    draft.attempts = (draft.attempts or 0) + 1
+    if success:
+        draft.status = EmailDraftStatus.sent
+        draft.sent_at = now
+        draft.next_attempt_at = None
+    elif draft.attempts >= MAX_SEND_ATTEMPTS:
+        draft.status = EmailDraftStatus.dead_letter
+        draft.next_attempt_at = None
+        logger.warning(f"Draft {draft.id}: giving up after {draft.attempts} attempts")
+    else:
+        draft.status = EmailDraftStatus.failed
+        draft.next_attempt_at = now + retry_delay(draft.attempts)
+
+
+def publish_status(db: Session, draft: EmailDraft):
+    """Announce a draft's status to the live notifications page when `db` commits."""
+    events.publish(db, "draft_status", {
+        "id": draft.id, "status": draft.status.name, "label": draft.status.value,
+    })
+
+
+def claim_for_sending(
+    db: Session,
+    draft_id: int,
+    from_statuses: tuple,
+    due_before: Optional[datetime] = None,
+) -> bool:
+    """
+    Move a draft to 'sending' under a SEND_LEASE with one conditional UPDATE,
+    so exactly one sender (a worker's scheduler or a send-now dispatch) owns
+    it. Returns False if another sender got there first. Commits.
+    """
+    stmt = update(EmailDraft).where(
+        EmailDraft.id == draft_id,
+        EmailDraft.status.in_(from_statuses),
+    )
+    if due_before is not None:
+        stmt = stmt.where(EmailDraft.next_attempt_at <= due_before)
+    result = db.execute(
+        stmt.values(status=EmailDraftStatus.sending, next_attempt_at=datetime.now() + SEND_LEASE)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.rollback()
+        return False
+    db.commit()
+    return True
+
+
+def deliver(db: Session, draft: EmailDraft, wait: float) -> Optional[bool]:
+    """
+    Send a claimed draft once a rate token is free, waiting up to `wait`
+    seconds, and record the attempt. Returns True / False for sent / failed,
+    or None when nothing was sent (no token in time, or the provider rate
+    limited us); the draft then stays 'sending' and falls due again without
+    using up an attempt. Commits.
+    """
+    try:
+        if not send_rate.acquire(wait):
+            draft.next_attempt_at = datetime.now()
+            db.commit()
+            return None
         success = send_email(
             to=draft.recipient_email,
             subject=draft.subject,
             body=draft.body,
         )
-        if success:
-            draft.status = EmailDraftStatus.sent
-            draft.sent_at = now
+    except send_rate.RateLimited as e:
+        draft.next_attempt_at = datetime.now() + timedelta(seconds=e.retry_after)
+        db.commit()
+        return None
+    record_send_result(draft, success, datetime.now())
+    publish_status(db, draft)
+    db.commit()
+    return success
+
+
+def process_scheduled_sends(db: Session) -> int:
+    """
+    Send approved drafts that are due, retry failed ones whose backoff has
+    elapsed and pick up 'sending' ones whose lease ran out; all are range
+    scans on (status, next_attempt_at). Each draft is claimed before it is
+    sent, so several workers can run this job without double sends. Sends
+    are paced by the shared send_rate buckets; drafts that do not get a
+    token within SEND_JOB_BUDGET, or that are left when the provider rate
+    limits us, stay due for the next run without using up an attempt.
+    Returns the number of emails sent.
+    """
+    now = datetime.now()
+    deadline = time.monotonic() + SEND_JOB_BUDGET
+    due_ids = [
+        draft_id for (draft_id,) in db.query(EmailDraft.id).filter(
+            EmailDraft.status.in_(DUE_STATUSES),
+            EmailDraft.next_attempt_at <= now,
+        ).order_by(EmailDraft.next_attempt_at).limit(
+            int(SEND_JOB_BUDGET * send_rate.SEND_RATE + send_rate.SEND_BURST)  # most one run can send
+        )
+    ]
+
+    sent_count = 0
+    dead_count = 0
+    for draft_id in due_ids:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not claim_for_sending(db, draft_id, DUE_STATUSES, due_before=now):
+            continue
+        draft = db.get(EmailDraft, draft_id)
+        result = deliver(db, draft, remaining)
+        if result is None:
+            logger.info("Send rate limit reached – remaining drafts wait for the next run")
+            break
+        if result:
             sent_count += 1
-        else:
-            draft.status = EmailDraftStatus.failed
+        elif draft.status == EmailDraftStatus.dead_letter:
+            dead_count += 1
 
     if sent_count > 0:
         notif = SystemNotification(
@@ -297,6 +289,15 @@ def process_scheduled_sends(db: Session) -> int:
             notif_type="email_sent",
         )
         db.add(notif)
+    if dead_count > 0:
+        db.add(SystemNotification(
+            title=f"電郵發送失敗（{dead_count} 封）",
+            message=(
+                f"有 {dead_count} 封電郵重試 {MAX_SEND_ATTEMPTS} 次後仍未能發送，已停止重試，"
+                f"請前往「通知管理」檢查收件人後重新排程。"
+            ),
+            notif_type="email_dead_letter",
+        ))
 
     db.commit()
     return sent_count
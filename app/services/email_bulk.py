@@ -0,0 +1,90 @@
+"""
+Set-based email draft approval.
+
+A whole scan batch (or a hand-picked selection) is approved with one
+UPDATE ... SET scheduled_at = CASE id WHEN ... END, spreading the send
+times evenly over a window so the per-minute sender drains the batch at a
+steady rate instead of bursting it into the Gmail quota.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import case, func, literal, update
+
+from app.models import EmailDraft, EmailDraftStatus
+
+APPROVAL_DELAY = timedelta(minutes=5)  # grace period before the first send, as for single approval
+DEFAULT_WINDOW_MINUTES = 60
+MAX_WINDOW_MINUTES = 7 * 24 * 60
+
+
+def draft_batches(db: Session) -> list[tuple[str, int]]:
+    """[(batch_id, draft count)] for batches that still have unapproved drafts, newest first."""
+    return (
+        db.query(EmailDraft.batch_id, func.count(EmailDraft.id))
+        .filter(
+            EmailDraft.status == EmailDraftStatus.draft,
+            EmailDraft.batch_id.is_not(None),
+        )
+        .group_by(EmailDraft.batch_id)
+        .order_by(func.max(EmailDraft.id).desc())
+        .all()
+    )
+
+
+def stagger(count: int, start: datetime, window: timedelta) -> list[datetime]:
+    """`count` send times from `start`, evenly spaced so the last falls at start + window."""
+    if count <= 1:
+        return [start] * count
+    step = window / (count - 1)
+    return [start + step * i for i in range(count)]
+
+
+def bulk_approve(
+    db: Session,
+    draft_ids: Optional[list[int]] = None,
+    batch_id: Optional[str] = None,
+    window_minutes: int = DEFAULT_WINDOW_MINUTES,
+    start: Optional[datetime] = None,
+) -> dict:
+    """
+    Approve the unapproved drafts selected by id and/or batch, staggering
+    scheduled_at over `window_minutes` in creation order. The selected rows
+    are locked first (SELECT ... FOR UPDATE on Postgres) so a concurrent
+    single approval or send-now cannot slip in between. Returns
+    {draft_id: scheduled_at} for the drafts approved. Caller commits.
+    """
+    if not draft_ids and not batch_id:
+        return {}
+    query = db.query(EmailDraft.id).filter(EmailDraft.status == EmailDraftStatus.draft)
+    if draft_ids:
+        query = query.filter(EmailDraft.id.in_(draft_ids))
+    if batch_id:
+        query = query.filter(EmailDraft.batch_id == batch_id)
+    ids = [draft_id for (draft_id,) in query.order_by(EmailDraft.id).with_for_update()]
+    if not ids:
+        return {}
+
+    window = timedelta(minutes=max(0, min(window_minutes, MAX_WINDOW_MINUTES)))
+    start = start or datetime.now() + APPROVAL_DELAY
+    schedule = dict(zip(ids, stagger(len(ids), start, window)))
+
+    scheduled_type = EmailDraft.__table__.c.scheduled_at.type
+    send_at = case(
+        {draft_id: literal(when, scheduled_type) for draft_id, when in schedule.items()},
+        value=EmailDraft.id,
+    )
+    db.execute(
+        update(EmailDraft)
+        .where(
+            EmailDraft.id.in_(ids),
+            EmailDraft.status == EmailDraftStatus.draft,
+        )
+        .values(
+            status=EmailDraftStatus.approved,
+            scheduled_at=send_at,
+            next_attempt_at=send_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return schedule
@@ -0,0 +1,296 @@
+"""
+Compiled email template registry.
+
+Templates are Jinja2 sources: one file per key in app/email_templates
+("Subject: ..." line, blank line, body), optionally overridden by a staff
+edit in the email_templates table. Subject and body are compiled once into
+a shared sandboxed Environment; compiled code is also kept in a bytecode
+cache on disk, so a fresh worker does not re-parse every template.
+
+Hot reload: file edits are picked up through the loader's mtime check, and
+refresh() (one small query, called before each batch) notices changed DB
+rows and invalidates only what changed – in every worker process.
+
+Rendering is batched: render_batch() loads the per-member fields for a
+whole scan with a fixed number of queries and renders each member with
+templates fetched once per batch.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from jinja2 import BaseLoader, FileSystemBytecodeCache, TemplateError, TemplateNotFound
+from jinja2.sandbox import SandboxedEnvironment
+from sqlalchemy.orm import Session
+
+from app.models import (
+    AGE_BANDS, Activity, ActivityStatus, EmailTemplate, Member, Registration, NOT_HOLDING_PLACE,
+)
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "email_templates")
+# Unset: Jinja's per-user cache directory, which it creates with mode 0700 and
+# refuses to use if another user owns it – a shared path in /tmp would let any
+# local user plant bytecode the workers then execute
+CACHE_DIR = os.getenv("EMAIL_TEMPLATE_CACHE_DIR")
+UPCOMING_LIMIT = 3  # activities listed per section of an email
+UPCOMING_DAYS = 30  # how far ahead "upcoming" looks
+
+TEMPLATE_LABELS = {
+    "new_member": "新會員",
+    "health_care": "健康關懷",
+    "long_absent": "久未出席",
+    "waitlist_promoted": "候補成功",
+    "general": "一般關懷",
+}
+
+
+def split_source(text: str) -> tuple[str, str]:
+    """("Subject: s\\n\\nbody") → (s, body)."""
+    head, _, body = text.partition("\n")
+    subject = head.removeprefix("Subject:").strip()
+    return subject, body.removeprefix("\n")
+
+
+class TemplateLoader(BaseLoader):
+    """
+    Serves "<key>:subject" and "<key>:body". DB overrides win over files;
+    every source is up to date only while the override set is unchanged
+    and, for files, while the file's mtime is the same.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.overrides: dict = {}  # key -> (subject, body)
+        self.version = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def file_source(self, key: str) -> Optional[tuple[str, str]]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return split_source(f.read())
+        except FileNotFoundError:
+            return None
+
+    def get_source(self, environment, name):
+        key, _, part = name.partition(":")
+        version = self.version
+        if key in self.overrides:
+            subject, body = self.overrides[key]
+            return (subject if part == "subject" else body), None, lambda: self.version == version
+        path = self._path(key)
+        if not os.path.exists(path):
+            raise TemplateNotFound(name)
+        mtime = os.path.getmtime(path)
+        subject, body = self.file_source(key)
+        return (
+            subject if part == "subject" else body,
+            path,
+            lambda: self.version == version and os.path.exists(path) and os.path.getmtime(path) == mtime,
+        )
+
+    def list_keys(self) -> list[str]:
+        files = {n[:-4] for n in os.listdir(self.directory) if n.endswith(".txt")}
+        return sorted(files | set(self.overrides))
+
+
+class TemplateRegistry:
+    def __init__(self, directory: str = TEMPLATE_DIR, cache_dir: Optional[str] = CACHE_DIR):
+        if cache_dir:
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        self.loader = TemplateLoader(directory)
+        # Sources are staff-editable: the sandbox refuses attribute access to
+        # internals (__class__, __subclasses__, ...) and unsafe calls
+        self.env = SandboxedEnvironment(
+            loader=self.loader,
+            bytecode_cache=FileSystemBytecodeCache(cache_dir or None),
+            auto_reload=True,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            keep_trailing_newline=True,
+        )
+        self._signature: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    def refresh(self, db: Session):
+        """Pick up added, edited or removed DB overrides (one query)."""
+        rows = db.query(EmailTemplate.key, EmailTemplate.subject, EmailTemplate.body, EmailTemplate.updated_at).all()
+        signature = {key: updated_at for key, _, _, updated_at in rows}
+        if signature == self._signature:
+            return
+        with self._lock:
+            self.loader.overrides = {key: (subject, body) for key, subject, body, _ in rows}
+            self.loader.version += 1
+            self._signature = signature
+
+    def compiled(self, key: str) -> tuple:
+        """(subject, body) Template objects, compiled or taken from cache."""
+        return self.env.get_template(f"{key}:subject"), self.env.get_template(f"{key}:body")
+
+    def file_compiled(self, key: str) -> tuple:
+        """(subject, body) compiled from the file, ignoring any DB override."""
+        subject, body = self.loader.file_source(key) or ("", "")
+        return self.env.from_string(subject), self.env.from_string(body)
+
+    def render(self, key: str, context: dict) -> tuple[str, str]:
+        subject, body = self.compiled(key)
+        return subject.render(context).strip(), body.render(context)
+
+    def check(self, subject: str, body: str):
+        """
+        Compile and trial-render an edit against sample_context(), so unknown
+        filters / tests and runtime errors surface before it is saved. Raises
+        TemplateError (or whatever the trial render raised).
+        """
+        context = sample_context()
+        self.env.from_string(subject).render(context)
+        self.env.from_string(body).render(context)
+
+    def source(self, key: str) -> tuple[str, str]:
+        """Editable (subject, body) source currently in effect for `key`."""
+        if key in self.loader.overrides:
+            return self.loader.overrides[key]
+        return self.loader.file_source(key) or ("", "")
+
+    def keys(self) -> list[str]:
+        return self.loader.list_keys()
+
+
+registry = TemplateRegistry()
+
+
+# ── Per-member fields ─────────────────────────────────────────────────────────
+
+def centre_context() -> dict:
+    """Centre details, read at render time so .env changes apply without a restart."""
+    return {
+        "centre": os.getenv("CENTRE_NAME", "快樂長者中心"),
+        "phone": os.getenv("CENTRE_PHONE", "2xxx-xxxx"),
+    }
+
+
+def sample_context() -> dict:
+    """Every field a template can see, with plausible values, for trial renders."""
+    now = datetime.now()
+    activity = Activity(
+        id=0, name="太極拳班", datetime_start=now + timedelta(days=3),
+        location="多功能廳", status=ActivityStatus.upcoming,
+    )
+    return {
+        **centre_context(),
+        "name": "陳大文",
+        "name_en": "Chan Tai Man",
+        "age": 75,
+        "age_band": AGE_BANDS["70_79"][0],
+        "total_attended": 5,
+        "last_attended_at": now - timedelta(days=20),
+        "days_absent": 20,
+        "my_activities": [activity],
+        "upcoming": [activity],
+        # waitlist_promoted extras
+        "activity": activity.name,
+        "when": activity.datetime_start.strftime("%Y-%m-%d %H:%M"),
+        "location": activity.location,
+    }
+
+
+def member_contexts(db: Session, members: list[Member]) -> dict:
+    """
+    {member_id: fields} for a batch of members with two queries in total:
+    the centre's upcoming activities, and the batch's own upcoming
+    registrations. Templates see name, name_en, age, age_band,
+    total_attended, last_attended_at, days_absent, my_activities (what the
+    member is booked on) and upcoming (other activities to invite them to),
+    both limited to the next UPCOMING_DAYS.
+    """
+    now = datetime.now()
+    horizon = now + timedelta(days=UPCOMING_DAYS)
+    ids = [m.id for m in members]
+    centre_upcoming = (
+        db.query(Activity)
+        .filter(
+            Activity.status == ActivityStatus.upcoming,
+            Activity.datetime_start >= now,
+            Activity.datetime_start < horizon,
+        )
+        .order_by(Activity.datetime_start)
+        .limit(UPCOMING_LIMIT * 3)
+        .all()
+    )
+    booked: dict = {}
+    if ids:
+        rows = (
+            db.query(Registration.member_id, Activity)
+            .join(Activity, Activity.id == Registration.activity_id)
+            .filter(
+                Registration.member_id.in_(ids),
+                Registration.attendance.not_in(NOT_HOLDING_PLACE),
+                Activity.datetime_start >= now,
+                Activity.datetime_start < horizon,
+            )
+            .order_by(Activity.datetime_start)
+            .all()
+        )
+        for member_id, activity in rows:
+            booked.setdefault(member_id, []).append(activity)
+
+    contexts = {}
+    for m in members:
+        mine = booked.get(m.id, [])
+        mine_ids = {a.id for a in mine}
+        stats = m.stats
+        last = stats.last_attended_at if stats else None
+        band = m.age_band
+        contexts[m.id] = {
+            "name": m.name_zh,
+            "name_en": m.name_en or "",
+            "age": m.age,
+            "age_band": AGE_BANDS[band][0] if band else "",
+            "total_attended": stats.total_attended if stats else 0,
+            "last_attended_at": last,
+            "days_absent": (now - last).days if last else None,
+            "my_activities": mine[:UPCOMING_LIMIT],
+            "upcoming": [a for a in centre_upcoming if a.id not in mine_ids][:UPCOMING_LIMIT],
+        }
+    return contexts
+
+
+def render_batch(db: Session, items: list[tuple[Member, str]], **extra) -> list[tuple[str, str]]:
+    """
+    (subject, body) for each (member, template key), in order. `extra` is
+    passed to every template (e.g. activity / when / location).
+    """
+    registry.refresh(db)
+    contexts = member_contexts(db, [m for m, _ in items])
+    shared = {**centre_context(), **extra}
+    compiled: dict = {}
+    fallen_back: set = set()
+
+    def fall_back(key: str, error: Exception):
+        """A broken staff edit must not abort the scan: use the file version instead."""
+        if key not in registry.loader.overrides or key in fallen_back:
+            raise error
+        logger.error(f"Email template '{key}' override failed ({error}) – using the file version")
+        fallen_back.add(key)
+        compiled[key] = registry.file_compiled(key)
+
+    rendered = []
+    for member, key in items:
+        if key not in compiled:
+            try:
+                compiled[key] = registry.compiled(key)
+            except TemplateError as e:
+                fall_back(key, e)
+        context = {**shared, **contexts[member.id]}
+        try:
+            subject, body = compiled[key]
+            rendered.append((subject.render(context).strip(), body.render(context)))
+        except Exception as e:
+            fall_back(key, e)
+            subject, body = compiled[key]
+            rendered.append((subject.render(context).strip(), body.render(context)))
+    return rendered
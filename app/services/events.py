@@ -0,0 +1,170 @@
+"""
+Live event bus for the notifications page (SSE).
+
+publish() records an event in the caller's transaction; nothing is delivered
+unless it commits. On Postgres the event is a NOTIFY on CHANNEL, so every
+worker process hears it through its listener thread (LISTEN). On other
+databases events are held on the session and fanned out in-process after
+commit, which covers the single-process SQLite setup.
+
+Subscribers are asyncio queues owned by SSE responses; delivery from any
+thread goes through loop.call_soon_threadsafe.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+from typing import Optional
+from sqlalchemy import event, func, select as sql_select, text
+from sqlalchemy.orm import Session, object_session
+
+from app.database import engine
+from app.models import SystemNotification
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "crm_events"
+QUEUE_SIZE = 100  # per subscriber; a stalled browser drops events, not the server
+
+_subscribers: set = set()  # {(loop, queue)}
+_lock = threading.Lock()
+_listener: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+_NOTIFY = text("SELECT pg_notify(:channel, :payload)")
+
+
+def _uses_notify(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+# ── Publishing ────────────────────────────────────────────────────────────────
+
+def _queue(session: Session, executor, kind: str, data: dict):
+    """NOTIFY through `executor` on Postgres, otherwise hold on the session until commit."""
+    payload = json.dumps({"kind": kind, "data": data}, ensure_ascii=False, default=str)
+    if _uses_notify(session.get_bind()):
+        executor.execute(_NOTIFY, {"channel": CHANNEL, "payload": payload})
+    else:
+        session.info.setdefault("pending_events", []).append(payload)
+
+
+def publish(db: Session, kind: str, data: dict):
+    """Record an event that is delivered only if `db` commits."""
+    _queue(db, db, kind, data)
+
+
+def _unread_count(executor) -> int:
+    return executor.scalar(
+        sql_select(func.count(SystemNotification.id)).where(SystemNotification.is_read == False)
+    )
+
+
+def publish_unread_count(db: Session):
+    """Publish the unread SystemNotification count as of this transaction."""
+    db.flush()
+    publish(db, "unread", {"count": _unread_count(db)})
+
+
+@event.listens_for(SystemNotification, "after_insert")
+def _notification_inserted(mapper, connection, target):
+    """Every new SystemNotification is announced together with the unread count."""
+    session = object_session(target)
+    if session is None:
+        return
+    # Inside a flush only the flushing connection may be used
+    _queue(session, connection, "notification", {
+        "id": target.id,
+        "title": target.title,
+        "message": target.message,
+        "created_at": target.created_at,
+    })
+    _queue(session, connection, "unread", {"count": _unread_count(connection)})
+
+
+@event.listens_for(Session, "after_commit")
+def _flush_pending(session):
+    for payload in session.info.pop("pending_events", []):
+        _broadcast(payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session):
+    session.info.pop("pending_events", None)
+
+
+# ── Subscribing ───────────────────────────────────────────────────────────────
+
+def subscribe() -> asyncio.Queue:
+    """Register a queue for the calling event loop; pair with unsubscribe()."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    with _lock:
+        _subscribers.add((asyncio.get_running_loop(), queue))
+    return queue
+
+
+def unsubscribe(queue: asyncio.Queue):
+    with _lock:
+        for entry in [e for e in _subscribers if e[1] is queue]:
+            _subscribers.discard(entry)
+
+
+def _put(queue: asyncio.Queue, item: dict):
+    try:
+        queue.put_nowait(item)
+    except asyncio.QueueFull:
+        pass
+
+
+def _broadcast(payload: str):
+    item = json.loads(payload)
+    with _lock:
+        targets = list(_subscribers)
+    for loop, queue in targets:
+        try:
+            loop.call_soon_threadsafe(_put, queue, item)
+        except RuntimeError:  # loop closed
+            unsubscribe(queue)
+
+
+# ── Postgres LISTEN thread ────────────────────────────────────────────────────
+
+def _listen_loop():
+    while not _stop.is_set():
+        try:
+            raw = engine.raw_connection()
+            # Out of the pool for good: close() then really closes it, so an
+            # autocommit connection is never handed to a request afterwards
+            raw.detach()
+            try:
+                conn = raw.driver_connection
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                logger.info(f"[Events] Listening on {CHANNEL}")
+                while not _stop.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        _broadcast(conn.notifies.pop(0).payload)
+            finally:
+                raw.close()
+        except Exception as e:
+            logger.error(f"[Events] Listener error: {e}")
+            _stop.wait(5)
+
+
+def start_event_listener():
+    """Start the LISTEN thread on Postgres; in-process delivery needs nothing."""
+    global _listener
+    if not _uses_notify(engine) or (_listener and _listener.is_alive()):
+        return
+    _stop.clear()
+    _listener = threading.Thread(target=_listen_loop, name="event-listener", daemon=True)
+    _listener.start()
+
+
+def stop_event_listener():
+    _stop.set()
@@ -0,0 +1,251 @@
+"""
+Pluggable outgoing mail transports.
+
+MAIL_TRANSPORT selects the backend:
+  gmail    Gmail API with the stored OAuth refresh token (one service per thread)
+  smtp     SMTP relay over a small pool of persistent connections
+  maildir  writes each message into a Maildir (MAILDIR_PATH) – no network
+  log      logs a one-line summary per message; bodies only at DEBUG
+Unset, it is gmail when Gmail credentials are configured and log otherwise,
+as before. Every transport's send() returns True / False, or raises
+send_rate.RateLimited when the provider refuses for rate reasons.
+"""
+import base64
+import logging
+import mailbox
+import os
+import queue
+import smtplib
+import threading
+from abc import ABC, abstractmethod
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Optional
+
+from app.services import send_rate
+
+logger = logging.getLogger(__name__)
+
+
+def build_message(to: str, subject: str, body: str, sender: str) -> MIMEMultipart:
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = sender
+    msg["To"] = to
+    msg.attach(MIMEText(body, "plain", "utf-8"))
+    return msg
+
+
+class Transport(ABC):
+    name = "base"
+
+    @abstractmethod
+    def send(self, to: str, subject: str, body: str) -> bool:
+        ...
+
+    def close(self):
+        pass
+
+
+class LogTransport(Transport):
+    """Development stand-in: nothing is sent, every message counts as delivered."""
+    name = "log"
+
+    def send(self, to, subject, body):
+        logger.info(f"[MOCK EMAIL] → {to} | {subject} ({len(body)} chars)")
+        logger.debug(f"[MOCK EMAIL] Body:\n{body}")
+        return True
+
+
+class MaildirTransport(Transport):
+    """File sink: one file per message in a Maildir, for local end-to-end runs."""
+    name = "maildir"
+
+    def __init__(self, path: str, sender: str):
+        self.sender = sender
+        self.box = mailbox.Maildir(path, create=True)
+        self._lock = threading.Lock()
+
+    def send(self, to, subject, body):
+        msg = build_message(to, subject, body, self.sender)
+        with self._lock:
+            self.box.add(msg)
+        return True
+
+
+class GmailTransport(Transport):
+    name = "gmail"
+
+    def __init__(self, sender: str):
+        self.sender = sender
+        self._local = threading.local()  # the API client is not thread-safe
+
+    def _service(self):
+        """Authenticated Gmail API service, built once per thread and reused."""
+        service = getattr(self._local, "service", None)
+        if service is None:
+            from google.oauth2.credentials import Credentials
+            from google.auth.transport.requests import Request
+            from googleapiclient.discovery import build
+
+            creds = Credentials(
+                token=None,
+                refresh_token=os.getenv("GMAIL_REFRESH_TOKEN"),
+                client_id=os.getenv("GMAIL_CLIENT_ID"),
+                client_secret=os.getenv("GMAIL_CLIENT_SECRET"),
+                token_uri="https://oauth2.googleapis.com/token",
+                scopes=["https://www.googleapis.com/auth/gmail.send"],
+            )
+            creds.refresh(Request())
+            service = self._local.service = build("gmail", "v1", credentials=creds)
+        return service
+
+    def send(self, to, subject, body):
+        msg = build_message(to, subject, body, self.sender)
+        raw = base64.urlsafe_b64encode(msg.as_bytes()).decode()
+        try:
+            self._service().users().messages().send(userId="me", body={"raw": raw}).execute()
+            logger.info(f"Gmail API: sent → {to} | {subject}")
+            return True
+        except Exception as e:
+            status = getattr(getattr(e, "resp", None), "status", None)
+            if status == 429 or (status == 403 and "rateLimitExceeded" in str(e)):
+                retry_after = send_rate.parse_retry_after(e.resp.get("retry-after"), str(e))
+                send_rate.block(retry_after)
+                logger.warning(f"Gmail API rate limited – pausing sends for {retry_after:.0f}s")
+                raise send_rate.RateLimited(retry_after)
+            self._local.service = None  # rebuild on the next send (e.g. expired token)
+            logger.error(f"Gmail API send failed: {e}")
+            return False
+
+
+class SMTPTransport(Transport):
+    """
+    SMTP relay. Up to `pool_size` authenticated connections are kept open
+    and reused across sends and threads, so a batch pays the connect /
+    STARTTLS / AUTH handshake once per connection rather than per message.
+    """
+    name = "smtp"
+    RATE_CODES = (421, 450, 451, 452)  # transient "slow down / try later" replies
+
+    def __init__(self, host, port, user, password, starttls, sender, pool_size=2, timeout=30):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.starttls = starttls
+        self.sender = sender
+        self.timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.Semaphore(pool_size)
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            conn.starttls()
+        if self.user:
+            conn.login(self.user, self.password)
+        return conn
+
+    def _checkout(self) -> smtplib.SMTP:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _discard(self, conn: Optional[smtplib.SMTP]):
+        if conn is None:
+            return
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def send(self, to, subject, body):
+        msg = build_message(to, subject, body, self.sender)
+        with self._slots:
+            conn = None
+            for attempt in (1, 2):  # a pooled connection may have been dropped by the server
+                try:
+                    conn = self._checkout()
+                    conn.send_message(msg)
+                    self._idle.put(conn)
+                    return True
+                except smtplib.SMTPServerDisconnected:
+                    self._discard(conn)
+                    conn = None
+                    if attempt == 2:
+                        logger.error(f"SMTP send failed: server disconnected ({self.host})")
+                        return False
+                except smtplib.SMTPResponseException as e:
+                    self._discard(conn)
+                    if e.smtp_code in self.RATE_CODES:
+                        retry_after = send_rate.DEFAULT_RETRY_AFTER
+                        send_rate.block(retry_after)
+                        logger.warning(f"SMTP {e.smtp_code} – pausing sends for {retry_after}s")
+                        raise send_rate.RateLimited(retry_after)
+                    logger.error(f"SMTP send failed: {e.smtp_code} {e.smtp_error!r}")
+                    return False
+                except (smtplib.SMTPException, OSError) as e:
+                    self._discard(conn)
+                    logger.error(f"SMTP send failed: {e}")
+                    return False
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                conn.quit()
+            except Exception:
+                self._discard(conn)
+
+
+def create_transport() -> Transport:
+    """Build the transport named by MAIL_TRANSPORT (see module docstring)."""
+    name = os.getenv("MAIL_TRANSPORT", "").lower()
+    if not name:
+        has_gmail = os.getenv("GMAIL_CLIENT_ID") and os.getenv("GMAIL_REFRESH_TOKEN")
+        name = "gmail" if has_gmail else "log"
+    sender = os.getenv("MAIL_FROM") or os.getenv("GMAIL_USER", "me")
+    if name == "gmail":
+        return GmailTransport(sender)
+    if name == "smtp":
+        return SMTPTransport(
+            host=os.getenv("SMTP_HOST", "localhost"),
+            port=int(os.getenv("SMTP_PORT", "25")),
+            user=os.getenv("SMTP_USER", ""),
+            password=os.getenv("SMTP_PASSWORD", ""),
+            starttls=os.getenv("SMTP_STARTTLS", "").lower() in ("1", "true", "yes"),
+            sender=sender,
+            pool_size=int(os.getenv("SMTP_POOL_SIZE", "2")),
+        )
+    if name == "maildir":
+        return MaildirTransport(os.getenv("MAILDIR_PATH", "maildir"), sender)
+    if name == "log":
+        return LogTransport()
+    raise ValueError(f"Unknown MAIL_TRANSPORT: {name}")
+
+
+_transport: Optional[Transport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Transport:
+    """The process-wide transport, created on first use (after .env is loaded)."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = create_transport()
+                logger.info(f"Mail transport: {_transport.name}")
+    return _transport
+
+
+def close_transport():
+    """Close pooled connections; the next send creates a fresh transport."""
+    global _transport
+    with _transport_lock:
+        if _transport is not None:
+            _transport.close()
+            _transport = None
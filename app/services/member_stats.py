@@ -0,0 +1,143 @@
+"""
+Per-member participation rollup (member_stats).
+
+Rather than walking Member.registrations, pages and the inactivity scan read
+one member_stats row. Writers call refresh() with the members whose attendance
+or respite bookings they changed; it recomputes just those members with three
+grouped queries over the member_id indexes and upserts their rows in the
+caller's transaction.
+"""
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import distinct, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models import (
+    Activity, Member, MemberStats, Registration, RespiteService,
+    AttendanceStatus, RespiteStatus,
+)
+
+
+def month_bounds(today: Optional[date] = None) -> tuple[date, date]:
+    """First and last day of the month containing `today`."""
+    first = (today or date.today()).replace(day=1)
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return first, last
+
+
+def compute(db: Session, member_ids: Optional[set] = None) -> dict:
+    """{member_id: column values} for the given members (all members when None)."""
+    def scoped(query, column):
+        return query if member_ids is None else query.where(column.in_(member_ids))
+
+    attended = scoped(
+        select(
+            Registration.member_id,
+            func.count(Registration.id).label("total"),
+            func.max(Activity.datetime_start).label("last_at"),
+        )
+        .join(Activity, Activity.id == Registration.activity_id)
+        .where(Registration.attendance == AttendanceStatus.attended),
+        Registration.member_id,
+    ).group_by(Registration.member_id).subquery()
+
+    # Absences after the latest attended activity (all absences if never attended)
+    streak = scoped(
+        select(Registration.member_id, func.count(Registration.id))
+        .join(Activity, Activity.id == Registration.activity_id)
+        .outerjoin(attended, attended.c.member_id == Registration.member_id)
+        .where(
+            Registration.attendance == AttendanceStatus.absent,
+            or_(attended.c.last_at.is_(None), Activity.datetime_start > attended.c.last_at),
+        ),
+        Registration.member_id,
+    ).group_by(Registration.member_id)
+
+    month, month_end = month_bounds()
+    respite = scoped(
+        select(RespiteService.member_id, func.count(distinct(RespiteService.date)))
+        .where(
+            RespiteService.status == RespiteStatus.approved,
+            RespiteService.date >= month,
+            RespiteService.date <= month_end,
+        ),
+        RespiteService.member_id,
+    ).group_by(RespiteService.member_id)
+
+    ids = member_ids if member_ids is not None else set(db.scalars(select(Member.id)))
+    now = datetime.now()
+    rows = {
+        mid: {
+            "member_id": mid,
+            "total_attended": 0,
+            "last_attended_at": None,
+            "absence_streak": 0,
+            "respite_month": month,
+            "respite_days": 0,
+            "updated_at": now,
+        }
+        for mid in ids
+    }
+    for mid, total, last_at in db.execute(select(attended)):
+        if mid in rows:
+            rows[mid]["total_attended"] = total
+            rows[mid]["last_attended_at"] = last_at
+    for mid, n in db.execute(streak):
+        if mid in rows:
+            rows[mid]["absence_streak"] = n
+    for mid, n in db.execute(respite):
+        if mid in rows:
+            rows[mid]["respite_days"] = n
+    return rows
+
+
+def _upsert(db: Session, rows: list[dict]):
+    table = MemberStats.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.member_id],
+            set_={c.name: stmt.excluded[c.name] for c in table.columns if c.name != "member_id"},
+        )
+        db.execute(stmt, rows)
+        return
+    for row in rows:
+        db.merge(MemberStats(**row))
+
+
+def refresh(db: Session, member_ids: Iterable[int]):
+    """Recompute the rollup for these members. Caller commits."""
+    ids = {mid for mid in member_ids if mid is not None}
+    if not ids:
+        return
+    db.flush()
+    rows = compute(db, ids)
+    existing = set(db.scalars(select(Member.id).where(Member.id.in_(ids))))
+    rows = [row for mid, row in rows.items() if mid in existing]
+    if rows:
+        _upsert(db, rows)
+
+
+def rebuild(db: Session) -> int:
+    """Recompute every member's rollup (used at month rollover and for repair)."""
+    rows = list(compute(db).values())
+    if rows:
+        _upsert(db, rows)
+    db.commit()
+    return len(rows)
+
+
+def get_stats(db: Session, member_id: int) -> Optional[MemberStats]:
+    """
+    The member's rollup row. A row whose respite count belongs to an earlier
+    month (the monthly rebuild has not run yet) is refreshed first.
+    """
+    stats = db.get(MemberStats, member_id)
+    if stats is None or stats.respite_month != month_bounds()[0]:
+        refresh(db, [member_id])
+        db.commit()
+        stats = db.get(MemberStats, member_id, populate_existing=True)
+    return stats
@@ -0,0 +1,196 @@
+"""
+Set-based respite operations: bulk approve / reject and recurring bookings.
+
+All affected dates are planned in one pass: occupancy for the whole date span
+is read (and locked) with one query, capacities come from the in-memory
+calendar, and the writes are a single UPDATE ... WHERE id IN (...) or one
+batched INSERT.
+"""
+from datetime import date, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session, joinedload
+
+from app.models import RespiteService, RespiteDailyOccupancy, RespiteStatus, SessionType
+from app.services.respite_occupancy import (
+    record_changes, snapshot, get_occupancy, halves_for, HALVES,
+)
+from app.services.respite_capacity import get_calendar
+from app.services import member_stats
+
+
+def pending_records(
+    db: Session,
+    record_ids: Optional[list[int]] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> list[RespiteService]:
+    """Pending bookings selected by id and/or date range, in waitlist order."""
+    query = (
+        db.query(RespiteService)
+        .options(joinedload(RespiteService.member))
+        .filter(RespiteService.status == RespiteStatus.pending)
+    )
+    if record_ids:
+        query = query.filter(RespiteService.id.in_(record_ids))
+    if date_from:
+        query = query.filter(RespiteService.date >= date_from)
+    if date_to:
+        query = query.filter(RespiteService.date <= date_to)
+    return query.order_by(RespiteService.date, RespiteService.created_at, RespiteService.id).all()
+
+
+def plan_approval(db: Session, records: list[RespiteService]) -> tuple[list, list]:
+    """
+    Split pending records into (placed, unplaced) against current occupancy.
+    Records are taken in the given order; a record that does not fit is
+    skipped so later, smaller requests (e.g. a half day) can still be placed.
+    """
+    if not records:
+        return [], []
+
+    start_date = min(r.date for r in records)
+    end_date = max(r.date for r in records)
+    (
+        db.query(RespiteDailyOccupancy)
+        .filter(
+            RespiteDailyOccupancy.date >= start_date,
+            RespiteDailyOccupancy.date <= end_date,
+        )
+        .with_for_update()
+        .all()
+    )
+    occupancy = get_occupancy(db, start_date, end_date)
+    calendar = get_calendar(db)
+
+    free: dict = {}
+    placed, unplaced = [], []
+    for record in records:
+        if record.date not in free:
+            day = occupancy.get(record.date, {})
+            free[record.date] = {
+                half: calendar.capacity(record.date, half) - day.get(half, {}).get("approved", 0)
+                for half in HALVES
+            }
+        slots = free[record.date]
+        halves = halves_for(record.session)
+        if all(slots[half] > 0 for half in halves):
+            for half in halves:
+                slots[half] -= 1
+            placed.append(record)
+        else:
+            unplaced.append(record)
+    return placed, unplaced
+
+
+def _set_status(db: Session, records: list[RespiteService], status: RespiteStatus):
+    """One UPDATE for the whole set, with occupancy counters adjusted in bulk."""
+    if not records:
+        return
+    changes = []
+    for record in records:
+        before = snapshot(record)
+        changes.append((before, (before[0], before[1], status)))
+    db.query(RespiteService).filter(
+        RespiteService.id.in_([r.id for r in records])
+    ).update({RespiteService.status: status}, synchronize_session="fetch")
+    record_changes(db, changes)
+    member_stats.refresh(db, {r.member_id for r in records})
+
+
+def bulk_approve(db: Session, records: list[RespiteService]) -> tuple[list, list]:
+    """Approve whatever fits; returns (approved, unplaced). Caller commits."""
+    placed, unplaced = plan_approval(db, records)
+    _set_status(db, placed, RespiteStatus.approved)
+    return placed, unplaced
+
+
+def bulk_reject(db: Session, records: list[RespiteService]) -> list:
+    """Reject every given pending record. Caller commits."""
+    _set_status(db, records, RespiteStatus.rejected)
+    return records
+
+
+# ── Recurring bookings ─────────────────────────────────────────────────────────
+
+MAX_RECURRENCE_DAYS = 366
+
+
+def expand_recurrence(start: date, until: date, weekdays: set[int]) -> list[date]:
+    """Every date from start to until (inclusive) falling on one of `weekdays` (Mon = 0)."""
+    until = min(until, start + timedelta(days=MAX_RECURRENCE_DAYS))
+    days = (until - start).days + 1
+    return [
+        start + timedelta(days=i)
+        for i in range(days)
+        if (start + timedelta(days=i)).weekday() in weekdays
+    ]
+
+
+def book_recurring(
+    db: Session,
+    member_id: int,
+    dates: list[date],
+    session: SessionType,
+    status: RespiteStatus,
+    notes: str = "",
+) -> tuple[list[RespiteService], list[tuple[date, str]]]:
+    """
+    Create one booking per date with a single capacity check across all dates.
+
+    Returns (created, conflicts) where conflicts is [(date, reason)]. Dates the
+    member already has a booking on, or where the centre is closed, are skipped.
+    Approved bookings that would exceed capacity are created as pending instead,
+    i.e. they join that date's waitlist. Caller commits.
+    """
+    if not dates:
+        return [], []
+
+    already = {
+        d for (d,) in db.query(RespiteService.date).filter(
+            RespiteService.member_id == member_id,
+            RespiteService.date.in_(dates),
+            RespiteService.status != RespiteStatus.rejected,
+        )
+    }
+    start_date, end_date = min(dates), max(dates)
+    if status == RespiteStatus.approved:
+        (
+            db.query(RespiteDailyOccupancy)
+            .filter(
+                RespiteDailyOccupancy.date >= start_date,
+                RespiteDailyOccupancy.date <= end_date,
+            )
+            .with_for_update()
+            .all()
+        )
+    occupancy = get_occupancy(db, start_date, end_date)
+    calendar = get_calendar(db)
+    halves = halves_for(session)
+
+    rows, conflicts = [], []
+    for d in dates:
+        if d in already:
+            conflicts.append((d, "已有暫託預約"))
+            continue
+        capacity = {half: calendar.capacity(d, half) for half in halves}
+        if any(cap == 0 for cap in capacity.values()):
+            conflicts.append((d, "當日暫停服務"))
+            continue
+        rec_status = status
+        if status == RespiteStatus.approved:
+            day = occupancy.get(d, {})
+            if any(day.get(half, {}).get("approved", 0) >= capacity[half] for half in halves):
+                rec_status = RespiteStatus.pending
+                conflicts.append((d, "名額已滿，已轉為候補"))
+        rows.append(RespiteService(
+            member_id=member_id,
+            date=d,
+            session=session,
+            status=rec_status,
+            notes=notes,
+        ))
+
+    db.add_all(rows)
+    record_changes(db, [(None, snapshot(r)) for r in rows])
+    member_stats.refresh(db, [member_id])
+    return rows, conflicts
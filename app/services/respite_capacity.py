@@ -0,0 +1,105 @@
+import time
+from bisect import bisect_right
+from datetime import date, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+
+from app.models import RespiteCapacityRule, CapacityRuleKind
+
+DEFAULT_CAPACITY = 4  # Used when no default rule exists
+CAPACITY_CACHE_TTL = 60  # seconds; rule edits in this process invalidate immediately
+
+HALVES = ("morning", "afternoon")
+
+
+class CapacityCalendar:
+    """
+    In-memory view of respite_capacity_rules.
+
+    Default and weekday capacities are plain lookups. Closures and reductions
+    are date intervals kept sorted by start date with a running maximum of end
+    dates, so a lookup bisects to the last interval that could start on or
+    before the date and walks back only while an interval can still reach it.
+    """
+
+    def __init__(self, rules: list):
+        self.default = {half: DEFAULT_CAPACITY for half in HALVES}
+        self.weekday: dict = {}  # (weekday, half) -> capacity
+        intervals = []
+        for rule in rules:
+            halves = (rule.half,) if rule.half in HALVES else HALVES
+            if rule.kind == CapacityRuleKind.default:
+                for half in halves:
+                    self.default[half] = rule.capacity or 0
+            elif rule.kind == CapacityRuleKind.weekday and rule.weekday is not None:
+                for half in halves:
+                    self.weekday[(rule.weekday, half)] = rule.capacity or 0
+            elif rule.kind in (CapacityRuleKind.closure, CapacityRuleKind.reduction) and rule.start_date:
+                end = rule.end_date or rule.start_date
+                intervals.append((rule.start_date, end, rule.kind, halves, rule.capacity or 0))
+
+        intervals.sort(key=lambda iv: iv[0])
+        self._intervals = intervals
+        self._starts = [iv[0] for iv in intervals]
+        self._max_end = []
+        running = date.min
+        for iv in intervals:
+            running = max(running, iv[1])
+            self._max_end.append(running)
+
+    def _covering(self, day: date):
+        i = bisect_right(self._starts, day) - 1
+        while i >= 0 and self._max_end[i] >= day:
+            if self._intervals[i][1] >= day:
+                yield self._intervals[i]
+            i -= 1
+
+    def capacity(self, day: date, half: str) -> int:
+        """Slots available for one half-session on `day` (0 when closed)."""
+        cap = self.weekday.get((day.weekday(), half), self.default[half])
+        for _, _, kind, halves, amount in self._covering(day):
+            if half not in halves:
+                continue
+            if kind == CapacityRuleKind.closure:
+                return 0
+            cap -= amount
+        return max(0, cap)
+
+    def capacities(self, start_date: date, end_date: date) -> dict:
+        """{date: {"morning": n, "afternoon": n}} for every date in the range."""
+        result = {}
+        day = start_date
+        while day <= end_date:
+            result[day] = {half: self.capacity(day, half) for half in HALVES}
+            day += timedelta(days=1)
+        return result
+
+
+_calendar: Optional[CapacityCalendar] = None
+_loaded_at = 0.0
+_version = 0  # bumped on invalidation so dependent caches can tell
+
+
+def get_calendar(db: Session) -> CapacityCalendar:
+    """Return the cached capacity calendar, loading all rules in one query when stale."""
+    global _calendar, _loaded_at
+    now = time.monotonic()
+    if _calendar is None or now - _loaded_at > CAPACITY_CACHE_TTL:
+        _calendar = CapacityCalendar(db.query(RespiteCapacityRule).all())
+        _loaded_at = now
+    return _calendar
+
+
+def invalidate_cache():
+    """Drop the cached calendar; call after any change to respite_capacity_rules."""
+    global _calendar, _version
+    _calendar = None
+    _version += 1
+
+
+def version() -> int:
+    return _version
+
+
+def get_capacity(db: Session, day: date, half: str) -> int:
+    return get_calendar(db).capacity(day, half)
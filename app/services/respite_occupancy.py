@@ -0,0 +1,227 @@
+from datetime import date
+from typing import Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import event, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.models import RespiteService, RespiteDailyOccupancy, SessionType, RespiteStatus
+
+HALVES = ("morning", "afternoon")
+
+# Bumped when a transaction that wrote counters commits in this process;
+# read-side caches compare against it to know when their data is stale.
+_generation = 0
+
+# (date, session, status) of a RespiteService as it stands in the database
+Snapshot = Optional[tuple[date, SessionType, RespiteStatus]]
+
+
+def halves_for(session: SessionType) -> tuple:
+    """Half-sessions a booking occupies. Full-day bookings occupy both."""
+    if session == SessionType.full_day:
+        return HALVES
+    if session == SessionType.morning:
+        return ("morning",)
+    return ("afternoon",)
+
+
+def snapshot(record: Optional[RespiteService]) -> Snapshot:
+    """Capture the occupancy-relevant fields of a record before it is changed."""
+    if record is None:
+        return None
+    return (record.date, SessionType(record.session), RespiteStatus(record.status))
+
+
+def _deltas(before: Snapshot, after: Snapshot) -> dict:
+    """{(date, half): [approved_delta, pending_delta]} for a before → after change."""
+    deltas: dict = {}
+    for snap, sign in ((before, -1), (after, 1)):
+        if snap is None:
+            continue
+        rec_date, session, status = snap
+        if status == RespiteStatus.approved:
+            idx = 0
+        elif status == RespiteStatus.pending:
+            idx = 1
+        else:
+            continue
+        for half in halves_for(session):
+            deltas.setdefault((rec_date, half), [0, 0])[idx] += sign
+    return {k: v for k, v in deltas.items() if v != [0, 0]}
+
+
+def _upsert(db: Session, rec_date: date, half: str, approved: int, pending: int):
+    """Atomically add to a (date, half) counter row, creating it if missing."""
+    dialect = db.get_bind().dialect.name
+    table = RespiteDailyOccupancy.__table__
+    values = {"date": rec_date, "half": half, "approved": approved, "pending": pending}
+
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.date, table.c.half],
+            set_={
+                "approved": table.c.approved + approved,
+                "pending": table.c.pending + pending,
+            },
+        )
+        db.execute(stmt)
+        return
+
+    row = db.get(RespiteDailyOccupancy, (rec_date, half), with_for_update=True)
+    if row is None:
+        db.add(RespiteDailyOccupancy(**values))
+        db.flush()
+    else:
+        row.approved += approved
+        row.pending += pending
+
+
+def generation() -> int:
+    """Current write generation, for invalidating caches built on occupancy."""
+    return _generation
+
+
+def _bump_generation_on_commit(db: Session):
+    """
+    Mark `db` as having changed occupancy. The generation moves only once it
+    commits: bumping earlier would let a concurrent read cache pre-commit
+    counters under the new generation.
+    """
+    db.info["occupancy_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_generation(session):
+    global _generation
+    if session.info.pop("occupancy_changed", False):
+        _generation += 1
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_bump(session):
+    session.info.pop("occupancy_changed", None)
+
+
+def record_change(db: Session, before: Snapshot, after: Snapshot):
+    """
+    Apply the occupancy effect of a respite record going from `before` to
+    `after` (None for create / delete). Runs inside the caller's transaction,
+    so the counters commit or roll back together with the record itself.
+    """
+    _bump_generation_on_commit(db)
+    for (rec_date, half), (approved, pending) in _deltas(before, after).items():
+        _upsert(db, rec_date, half, approved, pending)
+
+
+def record_changes(db: Session, changes: list[tuple[Snapshot, Snapshot]]):
+    """
+    Batch form of record_change(): net the deltas of many (before, after)
+    pairs first, then touch each affected (date, half) counter once.
+    """
+    _bump_generation_on_commit(db)
+    totals: dict = {}
+    for before, after in changes:
+        for key, (approved, pending) in _deltas(before, after).items():
+            acc = totals.setdefault(key, [0, 0])
+            acc[0] += approved
+            acc[1] += pending
+    for (rec_date, half), (approved, pending) in totals.items():
+        if approved or pending:
+            _upsert(db, rec_date, half, approved, pending)
+
+
+def get_occupancy(db: Session, start_date: date, end_date: date) -> dict:
+    """
+    Returns {date: {"morning": {"approved": n, "pending": n}, "afternoon": {...}}}
+    for dates in the range that have a counter row – a primary-key range scan.
+    """
+    rows = (
+        db.query(RespiteDailyOccupancy)
+        .filter(
+            RespiteDailyOccupancy.date >= start_date,
+            RespiteDailyOccupancy.date <= end_date,
+        )
+        .all()
+    )
+    result: dict = {}
+    for row in rows:
+        day = result.setdefault(row.date, {
+            "morning": {"approved": 0, "pending": 0},
+            "afternoon": {"approved": 0, "pending": 0},
+        })
+        day[row.half] = {"approved": row.approved, "pending": row.pending}
+    return result
+
+
+def get_half_counts(db: Session, query_date: date) -> dict:
+    """{"morning": {...}, "afternoon": {...}} for a single date."""
+    empty = {"morning": {"approved": 0, "pending": 0}, "afternoon": {"approved": 0, "pending": 0}}
+    return get_occupancy(db, query_date, query_date).get(query_date, empty)
+
+
+# ── Rebuild / verify ───────────────────────────────────────────────────────────
+
+def count_from_records(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None) -> dict:
+    """
+    Recompute occupancy from raw respite_services with one
+    GROUP BY date, session, status aggregate. Same shape as get_occupancy().
+    """
+    query = db.query(
+        RespiteService.date,
+        RespiteService.session,
+        RespiteService.status,
+        func.count(RespiteService.id),
+    ).filter(RespiteService.status.in_([RespiteStatus.approved, RespiteStatus.pending]))
+    if start_date:
+        query = query.filter(RespiteService.date >= start_date)
+    if end_date:
+        query = query.filter(RespiteService.date <= end_date)
+    rows = query.group_by(RespiteService.date, RespiteService.session, RespiteService.status).all()
+
+    counts: dict = {}
+    for rec_date, session, status, n in rows:
+        day = counts.setdefault(rec_date, {
+            "morning": {"approved": 0, "pending": 0},
+            "afternoon": {"approved": 0, "pending": 0},
+        })
+        key = "approved" if status == RespiteStatus.approved else "pending"
+        for half in halves_for(session):
+            day[half][key] += n
+    return counts
+
+
+def rebuild(db: Session) -> int:
+    """Replace every counter row with values recomputed from respite_services."""
+    counts = count_from_records(db)
+    db.query(RespiteDailyOccupancy).delete()
+    rows = [
+        {"date": d, "half": half, "approved": c["approved"], "pending": c["pending"]}
+        for d, day in counts.items()
+        for half, c in day.items()
+        if c["approved"] or c["pending"]
+    ]
+    if rows:
+        db.execute(RespiteDailyOccupancy.__table__.insert(), rows)
+    _bump_generation_on_commit(db)
+    db.commit()
+    return len(rows)
+
+
+def verify(db: Session) -> list[tuple]:
+    """Return [(date, half, stored, expected)] for every counter that has drifted."""
+    expected = count_from_records(db)
+    stored: dict = {}
+    for row in db.query(RespiteDailyOccupancy).all():
+        stored[(row.date, row.half)] = {"approved": row.approved, "pending": row.pending}
+
+    zero = {"approved": 0, "pending": 0}
+    keys = set(stored) | {(d, half) for d, day in expected.items() for half in day}
+    mismatches = []
+    for d, half in sorted(keys):
+        want = expected.get(d, {}).get(half, zero)
+        have = stored.get((d, half), zero)
+        if want != have:
+            mismatches.append((d, half, have, want))
+    return mismatches
@@ -1,9 +1,18 @@
-from datetime import date
+import time
+from array import array
+from datetime import date, timedelta
+from typing import Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.models import RespiteService, SessionType, RespiteStatus
+from app.models import RespiteService, Member, SessionType, RespiteStatus
+from app.services.respite_occupancy import get_occupancy, get_half_counts, halves_for, generation
+from app.services import respite_capacity
+from app.services.respite_capacity import get_calendar
 
-TOTAL_CAPACITY = 4  # Physical slots available at any one time
+HEATMAP_CACHE_TTL = 60  # seconds
+
+# (start_date, end_date, today) -> (cache stamp, built_at, heatmap)
+_heatmap_cache: dict = {}
 
 
 def _get_half_session_used(db: Session, query_date: date, half: SessionType) -> int:
@@ -11,179 +20,180 @@ def _get_half_session_used(db: Session, query_date: date, half: SessionType) ->
     Count occupied slots for a half-session (morning or afternoon).
     Full-day bookings count against both half-sessions.
     """
-    full_day_count = (
-        db.query(func.count(RespiteService.id))
-        .filter(
-            RespiteService.date == query_date,
-            RespiteService.session == SessionType.full_day,
-            RespiteService.status == RespiteStatus.approved,
-        )
-        .scalar()
-    )
-    half_count = (
-        db.query(func.count(RespiteService.id))
-        .filter(
-            RespiteService.date == query_date,
-            RespiteService.session == half,
-            RespiteService.status == RespiteStatus.approved,
-        )
-        .scalar()
-    )
-    return full_day_count + half_count
+    return get_half_counts(db, query_date)[half.name]["approved"]
 
 
 def get_remaining_slots(db: Session, query_date: date, session: SessionType) -> int:
     """Calculate remaining slots for a given date and session type."""
-    if session == SessionType.full_day:
-        # Full-day needs a free slot in both morning AND afternoon
-        morning_used = _get_half_session_used(db, query_date, SessionType.morning)
-        afternoon_used = _get_half_session_used(db, query_date, SessionType.afternoon)
-        return max(0, min(TOTAL_CAPACITY - morning_used, TOTAL_CAPACITY - afternoon_used))
-    elif session == SessionType.morning:
-        return max(0, TOTAL_CAPACITY - _get_half_session_used(db, query_date, SessionType.morning))
-    else:  # afternoon
-        return max(0, TOTAL_CAPACITY - _get_half_session_used(db, query_date, SessionType.afternoon))
+    counts = get_half_counts(db, query_date)
+    calendar = get_calendar(db)
+    # Full-day needs a free slot in both morning AND afternoon
+    return max(0, min(
+        calendar.capacity(query_date, half) - counts[half]["approved"]
+        for half in halves_for(session)
+    ))
 
 
 def get_daily_summary(db: Session, query_date: date) -> dict:
     """Get slot summary for morning and afternoon on a given date."""
-    morning_used = _get_half_session_used(db, query_date, SessionType.morning)
-    afternoon_used = _get_half_session_used(db, query_date, SessionType.afternoon)
-    return {
-        "早上": {
-            "capacity": TOTAL_CAPACITY,
-            "used": morning_used,
-            "remaining": max(0, TOTAL_CAPACITY - morning_used),
-        },
-        "下午": {
-            "capacity": TOTAL_CAPACITY,
-            "used": afternoon_used,
-            "remaining": max(0, TOTAL_CAPACITY - afternoon_used),
-        },
-    }
-
-
-def get_heatmap_data(db: Session, days_past: int = 7, days_future: int = 7) -> list:
-    """Get respite usage stats for a heatmap spanning past and future days."""
-    from datetime import timedelta, date as dt_date
-    from sqlalchemy.orm import joinedload
-
-    today = dt_date.today()
-    start_date = today - timedelta(days=days_past)
-    end_date = today + timedelta(days=days_future)
-
-    records = (
-        db.query(RespiteService)
-        .options(joinedload(RespiteService.member))
+    counts = get_half_counts(db, query_date)
+    calendar = get_calendar(db)
+    summary = {}
+    for label, half in (("早上", "morning"), ("下午", "afternoon")):
+        capacity = calendar.capacity(query_date, half)
+        used = counts[half]["approved"]
+        summary[label] = {
+            "capacity": capacity,
+            "used": used,
+            "remaining": max(0, capacity - used),
+        }
+    return summary
+
+
+def _condition_key(condition) -> str:
+    """Heatmap label for a member's health_condition (blank → 一般, long → truncated)."""
+    cond_key = condition.strip() if condition and condition.strip() else "一般"
+    if len(cond_key) > 15:
+        cond_key = cond_key[:12] + "..."
+    return cond_key
+
+
+def _build_heatmap(db: Session, start_date: date, end_date: date, today: date) -> list:
+    n_days = (end_date - start_date).days + 1
+    half_idx = {"morning": 0, "afternoon": 1}
+
+    # Column of approved counts, two cells (morning, afternoon) per day,
+    # filled straight from the materialised occupancy counters.
+    used = array("i", bytes(4 * n_days * 2))
+    for d, day in get_occupancy(db, start_date, end_date).items():
+        base = (d - start_date).days * 2
+        used[base] = day["morning"]["approved"]
+        used[base + 1] = day["afternoon"]["approved"]
+    capacity = array("i", (
+        cap
+        for day in get_calendar(db).capacities(start_date, end_date).values()
+        for cap in (day["morning"], day["afternoon"])
+    ))
+    utilization = [round(u / c * 100) if c else 0 for u, c in zip(used, capacity)]
+
+    # Condition breakdown aggregated in SQL; each distinct condition string
+    # is normalised once rather than once per booking.
+    conditions: list = [{} for _ in range(n_days * 2)]
+    rows = (
+        db.query(
+            RespiteService.date,
+            RespiteService.session,
+            Member.health_condition,
+            func.count(RespiteService.id),
+        )
+        .join(Member, Member.id == RespiteService.member_id)
         .filter(
             RespiteService.date >= start_date,
             RespiteService.date <= end_date,
             RespiteService.status == RespiteStatus.approved,
         )
+        .group_by(RespiteService.date, RespiteService.session, Member.health_condition)
         .all()
     )
+    keys: dict = {}
+    for rec_date, session, condition, n in rows:
+        cond_key = keys.get(condition)
+        if cond_key is None:
+            cond_key = keys[condition] = _condition_key(condition)
+        base = (rec_date - start_date).days * 2
+        for half in halves_for(session):
+            cell = conditions[base + half_idx[half]]
+            cell[cond_key] = cell.get(cond_key, 0) + n
 
     heatmap = []
-    current_date = start_date
-    while current_date <= end_date:
-        date_str = current_date.strftime("%Y-%m-%d")
+    for i in range(n_days):
+        current_date = start_date + timedelta(days=i)
         display_date = current_date.strftime("%m/%d")
         if current_date == today:
             display_date += "(今)"
-
-        sessions_data = {
-            "早上": {"capacity": TOTAL_CAPACITY, "used": 0, "utilization": 0, "conditions": {}},
-            "下午": {"capacity": TOTAL_CAPACITY, "used": 0, "utilization": 0, "conditions": {}},
-        }
-
         heatmap.append({
             "date": current_date,
-            "date_str": date_str,
+            "date_str": current_date.strftime("%Y-%m-%d"),
             "display": display_date,
-            "sessions": sessions_data,
+            "sessions": {
+                label: {
+                    "capacity": capacity[2 * i + j],
+                    "used": used[2 * i + j],
+                    "utilization": utilization[2 * i + j],
+                    "conditions": conditions[2 * i + j],
+                }
+                for j, label in enumerate(("早上", "下午"))
+            },
         })
-        current_date += timedelta(days=1)
-
-    date_to_idx = {h["date"]: i for i, h in enumerate(heatmap)}
-
-    for record in records:
-        idx = date_to_idx.get(record.date)
-        if idx is None:
-            continue
-
-        condition = record.member.health_condition
-        cond_key = condition.strip() if condition and condition.strip() else "一般"
-        if len(cond_key) > 15:
-            cond_key = cond_key[:12] + "..."
-
-        # Full-day bookings count against both half-sessions
-        affected = []
-        if record.session == SessionType.full_day:
-            affected = ["早上", "下午"]
-        elif record.session == SessionType.morning:
-            affected = ["早上"]
-        else:
-            affected = ["下午"]
-
-        for half in affected:
-            sess_data = heatmap[idx]["sessions"][half]
-            sess_data["used"] += 1
-            sess_data["utilization"] = round(sess_data["used"] / sess_data["capacity"] * 100)
-            sess_data["conditions"][cond_key] = sess_data["conditions"].get(cond_key, 0) + 1
-
     return heatmap
 
 
-def get_days_data(db: Session, dates: list) -> dict:
+def get_heatmap_data(
+    db: Session,
+    days_past: int = 7,
+    days_future: int = 7,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> list:
     """
-    Returns {date: {morning: {...}, afternoon: {...}}} for an arbitrary list of dates.
-    Full-day bookings count against both half-sessions.
+    Get respite usage stats for a heatmap spanning past and future days, or an
+    explicit start_date..end_date window (e.g. 90 or 365 days).
+    Results are cached per window until the next occupancy or capacity rule
+    write in this process, or HEATMAP_CACHE_TTL seconds for writes made by
+    other workers.
+    The returned list is shared with the cache – treat it as read-only.
     """
-    if not dates:
-        return {}
-
-    date_set = set(dates)
-    records = (
-        db.query(RespiteService)
-        .filter(
-            RespiteService.date >= min(dates),
-            RespiteService.date <= max(dates),
-        )
-        .all()
-    )
+    today = date.today()
+    start_date = start_date or today - timedelta(days=days_past)
+    end_date = end_date or today + timedelta(days=days_future)
+    if end_date < start_date:
+        return []
+
+    key = (start_date, end_date, today)
+    stamp = (generation(), respite_capacity.version())
+    cached = _heatmap_cache.get(key)
+    now = time.monotonic()
+    if cached and cached[0] == stamp and now - cached[1] < HEATMAP_CACHE_TTL:
+        return cached[2]
+
+    heatmap = _build_heatmap(db, start_date, end_date, today)
+    if len(_heatmap_cache) >= 32:
+        _heatmap_cache.clear()
+    _heatmap_cache[key] = (stamp, now, heatmap)
+    return heatmap
 
-    raw = {
-        d: {"morning": {"approved": 0, "pending": 0}, "afternoon": {"approved": 0, "pending": 0}}
-        for d in dates
-    }
-    for rec in records:
-        if rec.date not in date_set:
-            continue
-        halves = (
-            ["morning", "afternoon"] if rec.session == SessionType.full_day
-            else ["morning"] if rec.session == SessionType.morning
-            else ["afternoon"]
-        )
-        for hs in halves:
-            if rec.status == RespiteStatus.approved:
-                raw[rec.date][hs]["approved"] += 1
-            elif rec.status == RespiteStatus.pending:
-                raw[rec.date][hs]["pending"] += 1
 
+def _slot_data(db: Session, counts: dict, dates) -> dict:
+    """Shape per-half counts into the calendar cell structure for each date."""
+    empty = {"approved": 0, "pending": 0}
+    calendar = get_calendar(db)
     result = {}
-    for d, data in raw.items():
+    for d in dates:
+        day = counts.get(d, {})
         result[d] = {}
         for hs in ("morning", "afternoon"):
-            ac = data[hs]["approved"]
+            ac = day.get(hs, empty)["approved"]
+            capacity = calendar.capacity(d, hs)
             result[d][hs] = {
                 "approved_count": ac,
-                "pending_count": data[hs]["pending"],
-                "remaining": max(0, TOTAL_CAPACITY - ac),
-                "capacity": TOTAL_CAPACITY,
+                "pending_count": day.get(hs, empty)["pending"],
+                "remaining": max(0, capacity - ac),
+                "capacity": capacity,
             }
     return result
 
 
+def get_days_data(db: Session, dates: list) -> dict:
+    """
+    Returns {date: {morning: {...}, afternoon: {...}}} for an arbitrary list of dates.
+    Full-day bookings count against both half-sessions.
+    """
+    if not dates:
+        return {}
+    counts = get_occupancy(db, min(dates), max(dates))
+    return _slot_data(db, counts, dates)
+
+
 def get_monthly_data(db: Session, year: int, month: int) -> dict:
     """
     Returns {date: {morning: {...}, afternoon: {...}}} for every day in the month.
@@ -191,49 +201,10 @@ def get_monthly_data(db: Session, year: int, month: int) -> dict:
     Full-day bookings count against both morning and afternoon.
     """
     from calendar import monthrange
-    from datetime import date
 
     first_day = date(year, month, 1)
     _, last_num = monthrange(year, month)
     last_day = date(year, month, last_num)
 
-    records = (
-        db.query(RespiteService)
-        .filter(
-            RespiteService.date >= first_day,
-            RespiteService.date <= last_day,
-        )
-        .all()
-    )
-
-    raw: dict = {}
-    for d in range(1, last_num + 1):
-        raw[date(year, month, d)] = {
-            "morning": {"approved": 0, "pending": 0},
-            "afternoon": {"approved": 0, "pending": 0},
-        }
-
-    for rec in records:
-        halves = (
-            ["morning", "afternoon"] if rec.session == SessionType.full_day
-            else ["morning"] if rec.session == SessionType.morning
-            else ["afternoon"]
-        )
-        for hs in halves:
-            if rec.status == RespiteStatus.approved:
-                raw[rec.date][hs]["approved"] += 1
-            elif rec.status == RespiteStatus.pending:
-                raw[rec.date][hs]["pending"] += 1
-
-    result = {}
-    for d, data in raw.items():
-        result[d] = {}
-        for hs in ("morning", "afternoon"):
-            ac = data[hs]["approved"]
-            result[d][hs] = {
-                "approved_count": ac,
-                "pending_count": data[hs]["pending"],
-                "remaining": max(0, TOTAL_CAPACITY - ac),
-                "capacity": TOTAL_CAPACITY,
-            }
-    return result
+    counts = get_occupancy(db, first_day, last_day)
+    return _slot_data(db, counts, (first_day + timedelta(days=i) for i in range(last_num)))
@@ -0,0 +1,97 @@
+"""
+Respite waitlist.
+
+Pending bookings form a FIFO queue per date (by created_at, then id). When an
+approved booking is deleted or rejected, promote_waitlist() approves the
+earliest pending bookings that now fit, in the caller's transaction.
+"""
+from datetime import date
+from sqlalchemy.orm import Session
+
+from app.models import (
+    RespiteService, RespiteDailyOccupancy, RespiteStatus, SystemNotification,
+)
+from app.services.respite_occupancy import (
+    record_change, snapshot, get_half_counts, halves_for, HALVES,
+)
+from app.services.respite_capacity import get_calendar
+from app.services import member_stats
+
+
+def waitlist(db: Session, query_date: date) -> list[RespiteService]:
+    """Pending bookings for a date in queue order (served by ix_respite_services_waitlist)."""
+    return (
+        db.query(RespiteService)
+        .filter(
+            RespiteService.date == query_date,
+            RespiteService.status == RespiteStatus.pending,
+        )
+        .order_by(RespiteService.created_at, RespiteService.id)
+        .all()
+    )
+
+
+def promote_waitlist(db: Session, query_date: date) -> list[RespiteService]:
+    """
+    Approve waitlisted bookings on `query_date` while capacity allows.
+
+    The date's occupancy rows are locked first (SELECT ... FOR UPDATE on
+    Postgres), so concurrent cancellations on the same date promote one after
+    the other instead of both filling the same freed slot. A booking that does
+    not fit (e.g. a full-day request when only the morning freed up) keeps its
+    place and the next one in the queue is considered.
+    Does not commit – the caller commits together with the cancellation.
+    """
+    db.flush()
+    (
+        db.query(RespiteDailyOccupancy)
+        .filter(RespiteDailyOccupancy.date == query_date)
+        .with_for_update()
+        .all()
+    )
+
+    calendar = get_calendar(db)
+    counts = get_half_counts(db, query_date)
+    free = {
+        half: calendar.capacity(query_date, half) - counts[half]["approved"]
+        for half in HALVES
+    }
+    if all(n <= 0 for n in free.values()):
+        return []
+
+    promoted = []
+    for record in waitlist(db, query_date):
+        halves = halves_for(record.session)
+        if any(free[half] <= 0 for half in halves):
+            continue
+        before = snapshot(record)
+        record.status = RespiteStatus.approved
+        record_change(db, before, snapshot(record))
+        for half in halves:
+            free[half] -= 1
+        promoted.append(record)
+        if all(n <= 0 for n in free.values()):
+            break
+
+    if promoted:
+        member_stats.refresh(db, {r.member_id for r in promoted})
+        names = "、".join(r.member.name_zh for r in promoted)
+        db.add(SystemNotification(
+            title=f"暫託候補已自動批准（{query_date.strftime('%Y-%m-%d')}）",
+            message=f"因有名額釋出，系統已按申請次序批准：{names}。",
+            notif_type="respite_waitlist",
+        ))
+    return promoted
+
+
+def release_and_promote(db: Session, before, after) -> list[RespiteService]:
+    """
+    If a change took an approved booking off a date (delete, reject, or moved
+    to another date / session), promote the waitlist for the date it left.
+    `before` / `after` are occupancy snapshots; `after` is None for deletes.
+    """
+    if before is None or before[2] != RespiteStatus.approved:
+        return []
+    if after is not None and after[2] == RespiteStatus.approved and after[:2] == before[:2]:
+        return []
+    return promote_waitlist(db, before[0])
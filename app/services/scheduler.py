@@ -1,23 +1,28 @@
 import logging
+from datetime import date
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 
 from app.database import SessionLocal
 from app.services.email import run_inactive_scan, process_scheduled_sends
+from app.services import member_stats
 
 logger = logging.getLogger(__name__)
 
+FULL_SCAN_WEEKDAY = 0  # Monday: re-evaluate every member, not just those who changed
+
 _scheduler = BackgroundScheduler(timezone="Asia/Hong_Kong")
 
 
 def _scan_job():
     db = SessionLocal()
     try:
-        count = run_inactive_scan(db)
-        logger.info(f"[Scheduler] Weekly scan complete – {count} drafts created")
+        full = date.today().weekday() == FULL_SCAN_WEEKDAY
+        count = run_inactive_scan(db, full=full)
+        logger.info(f"[Scheduler] {'Full' if full else 'Daily'} scan complete – {count} drafts created")
     except Exception as e:
-        logger.error(f"[Scheduler] Weekly scan error: {e}")
+        logger.error(f"[Scheduler] Daily scan error: {e}")
     finally:
         db.close()
 
@@ -34,12 +39,23 @@ def _send_job():
         db.close()
 
 
+def _stats_job():
+    db = SessionLocal()
+    try:
+        count = member_stats.rebuild(db)
+        logger.info(f"[Scheduler] Member stats rebuilt for {count} members")
+    except Exception as e:
+        logger.error(f"[Scheduler] Member stats job error: {e}")
+    finally:
+        db.close()
+
+
 def start_scheduler():
-    # Weekly scan: every Monday at 09:00 HKT
+    # Inactivity scan: every day at 09:00 HKT, incremental except on FULL_SCAN_WEEKDAY
     _scheduler.add_job(
         _scan_job,
-        CronTrigger(day_of_week="mon", hour=9, minute=0),
-        id="weekly_scan",
+        CronTrigger(hour=9, minute=0),
+        id="daily_scan",
         replace_existing=True,
     )
     # Process pending sends: every minute
@@ -49,8 +65,15 @@ def start_scheduler():
         id="send_emails",
         replace_existing=True,
     )
+    # New month: respite days in member_stats start counting the new month
+    _scheduler.add_job(
+        _stats_job,
+        CronTrigger(day=1, hour=0, minute=5),
+        id="member_stats_month",
+        replace_existing=True,
+    )
     _scheduler.start()
-    logger.info("[Scheduler] Started – weekly scan (Mon 09:00) + per-minute sender")
+    logger.info("[Scheduler] Started – daily scan (09:00, full on Mondays) + per-minute sender + monthly stats")
 
 
 def stop_scheduler():
@@ -0,0 +1,174 @@
+"""
+Outgoing mail pacing, shared by every worker process.
+
+Gmail limits both how fast and how many messages a user may send per day.
+Two token buckets live in send_rate_buckets: "second" holds up to
+SEND_BURST tokens refilled at SEND_RATE per second, and "day" holds
+DAILY_LIMIT tokens refilled evenly over 24 hours (a rolling approximation
+of the daily quota). A send takes one token from each bucket in a short
+transaction of its own, with both rows locked (SELECT ... FOR UPDATE on
+Postgres), so all workers draw from the same buckets. When the provider
+answers 429 anyway, block() records its Retry-After and every worker
+pauses until then.
+"""
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from sqlalchemy import or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.database import engine
+from app.models import SendRateBucket
+
+SEND_RATE = float(os.getenv("GMAIL_SEND_RATE", "1"))  # sustained messages per second
+SEND_BURST = float(os.getenv("GMAIL_SEND_BURST", "5"))
+DAILY_LIMIT = float(os.getenv("GMAIL_DAILY_LIMIT", "500"))
+DEFAULT_RETRY_AFTER = 60  # seconds, when a 429 carries no usable hint
+CONTENDED_RETRY = 0.01  # seconds, after losing a compare-and-set to another process
+
+BUCKETS = {  # name -> (capacity, tokens per second)
+    "second": (SEND_BURST, SEND_RATE),
+    "day": (DAILY_LIMIT, DAILY_LIMIT / 86400),
+}
+
+# Serialises takers inside this process; SQLite has no row locks to do it
+_local = threading.Lock()
+_ready = False
+
+
+class RateLimited(Exception):
+    """The provider refused a send for rate reasons; nothing was sent."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class _Contended(Exception):
+    pass
+
+
+def _ensure_buckets(now: datetime):
+    """
+    Create missing bucket rows full, once per process. They are committed on
+    their own, before the first take: inside the take's transaction a
+    _Contended rollback would discard them after _ready was already set.
+    """
+    global _ready
+    if _ready:
+        return
+    table = SendRateBucket.__table__
+    rows = [
+        {"name": name, "tokens": capacity, "updated_at": now}
+        for name, (capacity, _) in BUCKETS.items()
+    ]
+    with _local, engine.begin() as conn:
+        dialect = conn.dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            conn.execute(insert(table).on_conflict_do_nothing(index_elements=[table.c.name]), rows)
+        else:
+            existing = set(conn.scalars(select(table.c.name)))
+            missing = [r for r in rows if r["name"] not in existing]
+            if missing:
+                conn.execute(table.insert(), missing)
+    _ready = True  # only once the insert has committed
+
+
+def try_acquire() -> float:
+    """
+    Take one send token if available. Returns 0 when taken, otherwise the
+    number of seconds until one could be (nothing is consumed).
+
+    Each row is written compare-and-set on updated_at, so a taker in another
+    process that read the same state (possible on SQLite, which has no
+    FOR UPDATE) rolls back and is told to retry at once.
+    """
+    try:
+        return _take()
+    except _Contended:
+        return CONTENDED_RETRY
+
+
+def _take() -> float:
+    table = SendRateBucket.__table__
+    now = datetime.now()
+    _ensure_buckets(now)
+    with _local, engine.begin() as conn:
+        rows = {
+            row.name: row
+            for row in conn.execute(
+                select(table).where(table.c.name.in_(list(BUCKETS))).with_for_update()
+            )
+        }
+        blocked = [r.blocked_until for r in rows.values() if r.blocked_until and r.blocked_until > now]
+        if blocked:
+            return (max(blocked) - now).total_seconds()
+
+        levels, wait = {}, 0.0
+        for name, (capacity, rate) in BUCKETS.items():
+            row = rows[name]
+            elapsed = max(0.0, (now - row.updated_at).total_seconds())
+            levels[name] = min(capacity, row.tokens + elapsed * rate)
+            if levels[name] < 1:
+                wait = max(wait, (1 - levels[name]) / rate if rate > 0 else float("inf"))
+        if wait:
+            return wait
+        for name, level in levels.items():
+            result = conn.execute(
+                update(table)
+                .where(table.c.name == name, table.c.updated_at == rows[name].updated_at)
+                .values(tokens=level - 1, updated_at=now)
+            )
+            if result.rowcount != 1:
+                raise _Contended()  # rolls back the other bucket too
+    return 0.0
+
+
+def acquire(timeout: float) -> bool:
+    """Wait up to `timeout` seconds for a send token. Returns False if none came in time."""
+    deadline = time.monotonic() + timeout
+    while True:
+        wait = try_acquire()
+        if not wait:
+            return True
+        if time.monotonic() + wait > deadline:
+            return False
+        time.sleep(wait)
+
+
+def block(retry_after: float):
+    """Pause all sending for `retry_after` seconds (a provider 429)."""
+    until = datetime.now() + timedelta(seconds=retry_after)
+    table = SendRateBucket.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            update(table)
+            .where(or_(table.c.blocked_until.is_(None), table.c.blocked_until < until))
+            .values(blocked_until=until)
+        )
+
+
+def parse_retry_after(header: Optional[str], message: str = "") -> float:
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP date),
+    falling back to Gmail's "Retry after <RFC 3339 time>" error text.
+    """
+    now = datetime.now().astimezone()
+    if header:
+        header = header.strip()
+        if header.isdigit():
+            return float(header)
+        try:
+            return max(0.0, (parsedate_to_datetime(header) - now).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    match = re.search(r"Retry after (\d{4}-\d{2}-\d{2}T[\d:.]+Z)", message)
+    if match:
+        when = datetime.fromisoformat(match.group(1).replace("Z", "+00:00"))
+        return max(0.0, (when - now).total_seconds())
+    return DEFAULT_RETRY_AFTER
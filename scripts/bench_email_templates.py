@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark: email draft rendering per 10k drafts.
+Builds a throwaway SQLite database with members, stats and upcoming
+activities, then times
+  - render_batch() for the whole set (batched member fields + compiled templates),
+  - the same drafts rendered one member at a time (per-member queries),
+  - template compilation from source vs. from the bytecode cache.
+Run: uv run python scripts/bench_email_templates.py [--drafts 10000]
+"""
+import sys
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="bench_email_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+os.environ["EMAIL_TEMPLATE_CACHE_DIR"] = os.path.join(_tmpdir, "jinja")
+
+from sqlalchemy import insert
+from sqlalchemy.orm import contains_eager
+from app.database import engine, SessionLocal
+from app.migrations import upgrade
+from app.models import (
+    Activity, ActivityStatus, ActivityType, AttendanceStatus, Member, MemberStats, Registration,
+)
+from app.services import campaigns, member_stats
+from app.services.email_templates import (
+    TemplateRegistry, member_contexts, registry, render_batch, CACHE_DIR, TEMPLATE_DIR,
+)
+
+ACTIVITIES = 40
+REGISTRATIONS_PER_MEMBER = 3
+SAMPLE = 500  # members timed in the one-at-a-time baseline
+
+
+def load(db, count: int):
+    today = date.today()
+    db.execute(insert(Member), [
+        {
+            "name_zh": f"會員{i}",
+            "dob": today - timedelta(days=random.randrange(55 * 365, 95 * 365)),
+            "joined_date": today - timedelta(days=random.randrange(0, 2000)),
+            "health_condition": random.choice(["", "", "高血壓", "糖尿病"]),
+            "is_active": True,
+        }
+        for i in range(count)
+    ])
+    now = datetime.now()
+    activity_ids = list(db.scalars(insert(Activity).returning(Activity.id), [
+        {
+            "name": f"活動{i}",
+            "type": random.choice(list(ActivityType)),
+            "datetime_start": now + timedelta(days=random.randrange(-20, 30), hours=random.randrange(8)),
+            "location": "多功能廳",
+            "status": ActivityStatus.upcoming,
+        }
+        for i in range(ACTIVITIES)
+    ]))
+    db.execute(insert(Registration), [
+        {
+            "activity_id": activity_id,
+            "member_id": member_id,
+            "registered_at": now,
+            "attendance": random.choice([AttendanceStatus.registered, AttendanceStatus.attended]),
+        }
+        for member_id in range(1, count + 1)
+        for activity_id in random.sample(activity_ids, REGISTRATIONS_PER_MEMBER)
+    ])
+    db.commit()
+    member_stats.rebuild(db)
+
+
+def per_10k(seconds: float, n: int) -> float:
+    return seconds / n * 10_000
+
+
+def main():
+    count = 10_000
+    if "--drafts" in sys.argv:
+        count = int(sys.argv[sys.argv.index("--drafts") + 1])
+
+    random.seed(42)
+    upgrade(engine)
+    db = SessionLocal()
+    load(db, count)
+    members = (
+        db.query(Member)
+        .outerjoin(MemberStats, MemberStats.member_id == Member.id)
+        .options(contains_eager(Member.stats))
+        .all()
+    )
+    # Templates as the scan's campaigns would pick them; members no campaign is due get "general"
+    chosen = {m.id: c.template_key for m, c in campaigns.match(db, campaigns.all_campaigns(db))}
+    items = [(m, chosen.get(m.id, "general")) for m in members]
+
+    render_batch(db, items[:10])  # warm up: compile every template used
+    t0 = time.perf_counter()
+    rendered = render_batch(db, items)
+    batch = time.perf_counter() - t0
+
+    contexts = member_contexts(db, members)
+    t0 = time.perf_counter()
+    for member, key in items:
+        registry.render(key, {"centre": "中心", "phone": "0", **contexts[member.id]})
+    render_only = time.perf_counter() - t0
+
+    sample = items[:SAMPLE]
+    t0 = time.perf_counter()
+    for member, key in sample:
+        render_batch(db, [(member, key)])
+    one_by_one = time.perf_counter() - t0
+
+    keys = sorted({key for _, key in items})
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    t0 = time.perf_counter()
+    cold = TemplateRegistry(TEMPLATE_DIR, CACHE_DIR)
+    for key in keys:
+        cold.compiled(key)
+    compile_source = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    warm = TemplateRegistry(TEMPLATE_DIR, CACHE_DIR)
+    for key in keys:
+        warm.compiled(key)
+    compile_cached = time.perf_counter() - t0
+
+    print(f"drafts rendered: {len(rendered):,} ({len(keys)} templates)")
+    print(f"{'':<34} | {'per 10k drafts (s)':>18}")
+    print("-" * 56)
+    print(f"{'render_batch (fields + render)':<34} | {per_10k(batch, len(items)):>18.3f}")
+    print(f"{'render only (compiled templates)':<34} | {per_10k(render_only, len(items)):>18.3f}")
+    print(f"{'one member at a time':<34} | {per_10k(one_by_one, len(sample)):>18.3f}")
+    print()
+    print(f"compile {len(keys) * 2} templates from source: {compile_source * 1000:.1f} ms, "
+          f"from bytecode cache: {compile_cached * 1000:.1f} ms")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full vs incremental inactivity scan.
+Builds a throwaway SQLite database of members with last attendance
+spread over 60 days, runs the first (full) scan as of yesterday, then
+times selecting today's due members from everyone against selecting from
+only the members who crossed the threshold since, and the incremental
+scan as a whole.
+Run: uv run python scripts/bench_inactive_scan.py [--members 50000]
+"""
+import sys
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="bench_scan_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+os.environ["EMAIL_TEMPLATE_CACHE_DIR"] = os.path.join(_tmpdir, "jinja")
+
+import logging
+logging.basicConfig(level=logging.WARNING)
+
+from sqlalchemy import insert, update
+from app.database import engine, SessionLocal
+from app.migrations import upgrade
+from app.models import EmailDraft, Member, MemberStats, ScanCursor
+from app.services import campaigns
+from app.services.email import run_inactive_scan
+
+
+def load(db, count: int) -> dict:
+    """Members as of yesterday; returns {member_id: last attended} as of today."""
+    today = date.today()
+    now = datetime.now()
+    # Attendance spread over the last 60 days: about 1/60 of members cross the threshold each day
+    last = {
+        member_id: now - timedelta(minutes=random.randrange(60 * 24 * 60))
+        for member_id in range(1, count + 1)
+    }
+    db.execute(insert(Member), [
+        {
+            "name_zh": f"會員{i}",
+            "dob": today - timedelta(days=random.randrange(55 * 365, 95 * 365)),
+            "joined_date": today - timedelta(days=random.randrange(200, 2000)),
+            "is_active": True,
+            "created_at": now - timedelta(days=400),
+            "updated_at": now - timedelta(days=400),
+        }
+        for i in range(count)
+    ])
+    db.execute(insert(MemberStats), [
+        {
+            "member_id": member_id,
+            "total_attended": 5,
+            "last_attended_at": at + timedelta(days=1),
+            "absence_streak": 0,
+            "respite_days": 0,
+            "updated_at": now - timedelta(days=400),
+        }
+        for member_id, at in last.items()
+    ])
+    db.commit()
+    return last
+
+
+def timed(fn) -> tuple[float, int]:
+    t0 = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - t0, result
+
+
+def main():
+    count = 50_000
+    if "--members" in sys.argv:
+        count = int(sys.argv[sys.argv.index("--members") + 1])
+
+    random.seed(42)
+    upgrade(engine)
+    db = SessionLocal()
+    last = load(db, count)
+
+    first, drafted = timed(lambda: run_inactive_scan(db))
+    # A day passes: the first scan, its drafts and every last attendance move one day back
+    yesterday = datetime.now() - timedelta(days=1)
+    db.execute(update(ScanCursor).values(scanned_at=yesterday))
+    db.execute(update(EmailDraft).values(created_at=yesterday))
+    db.execute(update(MemberStats), [{"member_id": mid, "last_attended_at": at} for mid, at in last.items()])
+    db.commit()
+
+    now = datetime.now()
+    rules = campaigns.all_campaigns(db)
+    select_full, full_count = timed(lambda: len(campaigns.match(db, rules, now=now)))
+    db.expunge_all()
+    rules = campaigns.all_campaigns(db)
+    select_incremental, incremental_count = timed(lambda: len(campaigns.match(db, rules, now=now, since=yesterday)))
+    db.expunge_all()
+    incremental, crossed = timed(lambda: run_inactive_scan(db))
+
+    print(f"members: {count:,}")
+    print(f"{'':<34} | {'time (s)':>9} | {'members':>7}")
+    print("-" * 56)
+    print(f"{'first scan (full), yesterday':<34} | {first:>9.3f} | {drafted:>7,}")
+    print(f"{'today: select due, all members':<34} | {select_full:>9.3f} | {full_count:>7,}")
+    print(f"{'today: select due, changed only':<34} | {select_incremental:>9.3f} | {incremental_count:>7,}")
+    print(f"{'today: incremental scan (total)':<34} | {incremental:>9.3f} | {crossed:>7,}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark: respite month calendar as the respite_services table grows.
+Builds a throwaway SQLite database, loads up to 1M respite records spread over
+~10 years and times get_monthly_data() for one month at each size.
+Run: uv run python scripts/bench_respite_calendar.py [--rows 1000000]
+"""
+import sys
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="bench_respite_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}"
+
+from sqlalchemy import insert
+from app.database import engine, SessionLocal
+from app.migrations import upgrade
+from app.models import Member, RespiteService, SessionType, RespiteStatus
+from app.services.respite_occupancy import rebuild
+from app.services.respite_scheduler import get_monthly_data
+
+CHECKPOINTS = [10_000, 100_000, 1_000_000]
+CHUNK = 50_000
+DAYS = 3650
+REPEAT = 20
+
+
+def load_rows(db, count: int, start: date):
+    sessions = list(SessionType)
+    statuses = [RespiteStatus.approved, RespiteStatus.pending, RespiteStatus.rejected]
+    rows = [
+        {
+            "member_id": 1,
+            "date": start + timedelta(days=random.randrange(DAYS)),
+            "session": random.choice(sessions),
+            "status": random.choice(statuses),
+        }
+        for _ in range(count)
+    ]
+    for i in range(0, count, CHUNK):
+        db.execute(insert(RespiteService), rows[i:i + CHUNK])
+    db.commit()
+    rebuild(db)
+
+
+def time_month(db, year: int, month: int) -> float:
+    get_monthly_data(db, year, month)  # warm up
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        get_monthly_data(db, year, month)
+    return (time.perf_counter() - t0) / REPEAT * 1000
+
+
+def main():
+    target = CHECKPOINTS[-1]
+    if "--rows" in sys.argv:
+        target = int(sys.argv[sys.argv.index("--rows") + 1])
+    checkpoints = [c for c in CHECKPOINTS if c < target] + [target]
+
+    random.seed(42)
+    upgrade(engine)
+    db = SessionLocal()
+    db.add(Member(name_zh="測試會員"))
+    db.commit()
+
+    start = date.today() - timedelta(days=DAYS // 2)
+    today = date.today()
+    loaded = 0
+    print(f"{'rows':>10} | {'get_monthly_data (ms)':>22}")
+    print("-" * 36)
+    for checkpoint in checkpoints:
+        load_rows(db, checkpoint - loaded, start)
+        loaded = checkpoint
+        ms = time_month(db, today.year, today.month)
+        print(f"{loaded:>10,} | {ms:>22.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
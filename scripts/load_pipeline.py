@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Load test: scan → bulk approve → send, end to end, without network access.
+Builds a throwaway SQLite database of inactive members, runs the inactivity scan,
+approves its batches at once and drains them through process_scheduled_sends
+into a Maildir (or, with --transport smtp, a local relay configured by SMTP_*),
+with the send rate limits lifted. Prints the time spent in each stage.
+Run: uv run python scripts/load_pipeline.py [--members 10000] [--transport smtp]
+"""
+import sys
+import os
+import mailbox
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix="load_pipeline_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'load.db')}"
+os.environ["MAILDIR_PATH"] = os.path.join(_tmpdir, "maildir")
+os.environ["MAIL_TRANSPORT"] = "smtp" if "--transport" in sys.argv and "smtp" in sys.argv else "maildir"
+os.environ["EMAIL_TEMPLATE_CACHE_DIR"] = os.path.join(_tmpdir, "jinja")
+os.environ.pop("TEST_RECIPIENT", None)
+for var in ("GMAIL_SEND_RATE", "GMAIL_SEND_BURST", "GMAIL_DAILY_LIMIT"):
+    os.environ[var] = "1000000"
+
+import logging
+logging.basicConfig(level=logging.WARNING)
+
+from sqlalchemy import func, insert
+from app.database import engine, SessionLocal
+from app.migrations import upgrade
+from app.models import EmailDraft, Member
+from app.services import member_stats
+from app.services.email import run_inactive_scan, process_scheduled_sends
+from app.services.email_bulk import bulk_approve, draft_batches
+from app.services.mail_transport import close_transport
+
+
+def stage(label: str, fn):
+    t0 = time.perf_counter()
+    result = fn()
+    print(f"{label:<28} {time.perf_counter() - t0:>8.2f} s   {result}")
+    return result
+
+
+def main():
+    count = 10_000
+    if "--members" in sys.argv:
+        count = int(sys.argv[sys.argv.index("--members") + 1])
+
+    upgrade(engine)
+    db = SessionLocal()
+    today = date.today()
+    db.execute(insert(Member), [
+        {
+            "name_zh": f"會員{i}",
+            "phone": f"m{i}@example.org",
+            "dob": today - timedelta(days=70 * 365 + i % 3650),
+            "joined_date": today - timedelta(days=400 + i % 1000),
+            "is_active": True,
+            "created_at": datetime.now() - timedelta(days=400),  # long enough to count as absent
+        }
+        for i in range(count)
+    ])
+    db.commit()
+    member_stats.rebuild(db)
+
+    print(f"members: {count:,}, transport: {os.environ['MAIL_TRANSPORT']}")
+    stage("scan (drafts created)", lambda: run_inactive_scan(db))
+
+    def approve():
+        approved = 0
+        for batch_id, _ in draft_batches(db):  # one batch per campaign
+            approved += len(bulk_approve(db, batch_id=batch_id, window_minutes=0, start=datetime.now()))
+        db.commit()
+        return approved
+
+    stage("bulk approve", approve)
+
+    def drain():
+        sent = 0
+        while True:
+            n = process_scheduled_sends(db)
+            if not n:
+                return sent
+            sent += n
+
+    stage("send (emails sent)", drain)
+    close_transport()
+
+    counts = dict(db.query(EmailDraft.status, func.count(EmailDraft.id)).group_by(EmailDraft.status).all())
+    print("draft status:", {status.name: n for status, n in counts.items()})
+    if os.environ["MAIL_TRANSPORT"] == "maildir":
+        print("maildir messages:", len(mailbox.Maildir(os.environ["MAILDIR_PATH"])))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Apply pending schema migrations.
+Run: uv run python scripts/migrate.py          # upgrade to latest
+     uv run python scripts/migrate.py --status # list applied / pending
+"""
+import sys
+import os
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import engine
+from app.migrations import available_migrations, applied_versions, upgrade
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if "--status" in sys.argv[1:]:
+        with engine.begin() as conn:
+            done = applied_versions(conn)
+        for version, module in available_migrations():
+            mark = "✅" if version in done else "⏳"
+            print(f"{mark} {version}  {module.description}")
+        return
+
+    applied = upgrade(engine)
+    if applied:
+        print(f"🎉 已套用 {len(applied)} 個遷移：{', '.join(applied)}")
+    else:
+        print("資料庫結構已是最新版本")
+
+
+if __name__ == "__main__":
+    main()
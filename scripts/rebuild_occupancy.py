@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Rebuild or verify the respite_daily_occupancy counters against respite_services.
+Run: uv run python scripts/rebuild_occupancy.py          # rebuild all counters
+     uv run python scripts/rebuild_occupancy.py --verify # report drift only
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.services.respite_occupancy import rebuild, verify
+
+
+def main():
+    db = SessionLocal()
+    try:
+        if "--verify" in sys.argv[1:]:
+            mismatches = verify(db)
+            if not mismatches:
+                print("✅ 暫託佔用統計與記錄一致")
+                return
+            print(f"⚠️ 發現 {len(mismatches)} 項不一致：")
+            for d, half, have, want in mismatches:
+                print(f"  {d} {half}: 統計 {have} ≠ 實際 {want}")
+            sys.exit(1)
+
+        count = rebuild(db)
+        print(f"✅ 已重建 {count} 項暫託佔用統計")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
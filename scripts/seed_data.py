@@ -13,8 +13,11 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from faker import Faker
 from app.database import SessionLocal, engine
+from app.migrations import upgrade
+from app.services.respite_occupancy import rebuild
+from app.services import member_stats
 from app.models import (
-    Base, Member, Activity, Registration, RespiteService,
+    Member, Activity, Registration, RespiteService,
     ActivityType, ActivityStatus, AttendanceStatus, SessionType, RespiteStatus
 )
 
@@ -91,7 +94,7 @@ def hk_phone():
 
 def main():
     print("🌱 開始生成資料...")
-    Base.metadata.create_all(bind=engine)
+    upgrade(engine)
     db = SessionLocal()
 
     # Check if data already seeded
@@ -285,6 +288,8 @@ def main():
         respite_count += 1
 
     db.commit()
+    rebuild(db)
+    member_stats.rebuild(db)
     print(f"  ✅ {respite_count} 筆暫託記錄已建立")
     db.close()
     print("\n🎉 資料生成完成！可以啟動伺服器：uv run uvicorn app.main:app --reload")
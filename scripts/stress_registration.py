@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Stress test: many threads register members for one small activity at once.
+Every member is submitted twice (a double click) and there are more members
+than places; afterwards the activity must hold exactly `capacity` places with
+no member registered twice and the overflow on the waitlist. A second round
+cancels several registrations concurrently; each cancellation promotes from
+the waitlist, and the activity must again hold exactly `capacity` places.
+Uses a throwaway SQLite database unless --url points at a real one (e.g. Postgres).
+Run: uv run python scripts/stress_registration.py [--members 60] [--capacity 20] [--cancel 8] [--url postgresql://...]
+"""
+import sys
+import os
+import tempfile
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _arg(name: str, default):
+    if name in sys.argv:
+        return type(default)(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+
+if "--url" in sys.argv:
+    os.environ["DATABASE_URL"] = sys.argv[sys.argv.index("--url") + 1]
+else:
+    _tmpdir = tempfile.mkdtemp(prefix="stress_registration_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'stress.db')}"
+
+from app.database import engine, SessionLocal
+from app.migrations import upgrade
+from app.models import Member, Activity, Registration, ActivityType, AttendanceStatus, NOT_HOLDING_PLACE
+from app.services.activity_registration import register, set_attendance
+from app.services.activity_waitlist import promote_waitlist
+
+
+def run_concurrently(target, args_list: list) -> tuple[Counter, list]:
+    """Start one thread per args tuple behind a barrier; collect outcomes and errors."""
+    results = Counter()
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(len(args_list))
+
+    def worker(*args):
+        session = SessionLocal()
+        try:
+            start.wait()
+            outcome = target(session, *args)
+        except Exception as exc:  # noqa: BLE001 – reported below
+            with lock:
+                errors.append(repr(exc))
+            return
+        finally:
+            session.close()
+        with lock:
+            results[outcome] += 1
+
+    threads = [threading.Thread(target=worker, args=args) for args in args_list]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def cancel(db, activity_id: int, reg_id: int) -> str:
+    """What the attendance endpoints do when a registration is cancelled."""
+    set_attendance(db, activity_id, {reg_id: AttendanceStatus.cancelled})
+    promoted = promote_waitlist(db, activity_id)
+    db.commit()
+    return f"promoted {len(promoted)}"
+
+
+def check(activity_id: int, capacity: int, members: int, label: str) -> bool:
+    db = SessionLocal()
+    rows = (
+        db.query(Registration.member_id, Registration.attendance)
+        .filter(
+            Registration.activity_id == activity_id,
+            Registration.attendance != AttendanceStatus.cancelled,
+        )
+        .all()
+    )
+    db.close()
+    per_member = Counter(mid for mid, _ in rows)
+    holding = sum(1 for _, att in rows if att not in NOT_HOLDING_PLACE)
+    print(f"{label}: {holding} / {capacity} places taken, {len(rows) - holding} waitlisted")
+    return holding == min(capacity, members) and all(n == 1 for n in per_member.values())
+
+
+def report(label: str, attempts: int, results: Counter, errors: list):
+    print(f"{label}: {attempts}  outcomes: {dict(results)}  errors: {len(errors)}")
+    for e in errors[:5]:
+        print("  ", e)
+
+
+def main():
+    members = _arg("--members", 60)
+    capacity = _arg("--capacity", 20)
+
+    upgrade(engine)
+    db = SessionLocal()
+    member_ids = []
+    for i in range(members):
+        m = Member(name_zh=f"壓力測試{i:03d}")
+        db.add(m)
+        db.flush()
+        member_ids.append(m.id)
+    activity = Activity(
+        name="壓力測試活動",
+        type=ActivityType.interest_class,
+        datetime_start=datetime.now() + timedelta(days=7),
+        capacity=capacity,
+    )
+    db.add(activity)
+    db.commit()
+    activity_id = activity.id
+    db.close()
+
+    attempts = [(mid,) for mid in member_ids for _ in range(2)]
+    results, errors = run_concurrently(
+        lambda session, member_id: register(session, activity_id, member_id), attempts,
+    )
+    report("register attempts", len(attempts), results, errors)
+    ok = not errors and check(activity_id, capacity, members, "after registration")
+
+    db = SessionLocal()
+    to_cancel = [
+        reg_id for (reg_id,) in db.query(Registration.id)
+        .filter(
+            Registration.activity_id == activity_id,
+            Registration.attendance == AttendanceStatus.registered,
+        )
+        .limit(_arg("--cancel", 8))
+    ]
+    db.close()
+    results, errors = run_concurrently(
+        lambda session, reg_id: cancel(session, activity_id, reg_id), [(r,) for r in to_cancel],
+    )
+    report("cancellations", len(to_cancel), results, errors)
+    ok = ok and not errors and check(activity_id, capacity, members - len(to_cancel), "after cancellations")
+
+    print("✅ no duplicates, no overbooking, waitlist filled freed places" if ok else "❌ invariant violated")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()